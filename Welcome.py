@@ -30,6 +30,7 @@ from dataclasses import dataclass
 import json
 
 from components.feedback import feedback_form
+from src.warmup import start_warmup
 
 
 @dataclass
@@ -44,6 +45,8 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded",
 )
+# Load the default version's models and indexes before the first question
+start_warmup(Path(os.environ["RAG_VERSION_DIR"]))
 custom_css()
 set_png_as_page_bg("style/assets/logo.png")
 backgroundImage()
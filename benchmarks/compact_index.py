@@ -0,0 +1,151 @@
+"""
+Measure the recall loss and memory saving of the compact index on a version's embeddings.
+
+For each dtype the compact index is built from the version's collection in a temporary
+folder.  A sample of stored embeddings is used as queries, and results are compared against
+exact brute-force neighbours (excluding the query chunk itself) to report recall@k for the
+quantized first pass alone and after re-scoring each number of candidates at full
+precision, with query p50/p95 latency and the size of the quantized embeddings relative
+to float32.
+
+Usage:
+    python -m benchmarks.compact_index -d {version_directory} --dtype int8 float16 --rescore-candidates 10 50 100
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+from omegaconf import OmegaConf
+
+from benchmarks.hnsw_sweep import exact_neighbours, load_embeddings
+from benchmarks.ingestion import git_commit
+from src.compact_index import DTYPES, CompactIndex
+from src.vectordb import VDB, resolve_store_path
+
+
+def evaluate(
+    version_path: Path,
+    dtypes: List[str],
+    rescore_candidates: List[int],
+    k: int,
+    n_queries: int,
+    seed: int,
+) -> Dict[str, object]:
+    """
+    Build the compact index for each dtype and measure recall@k and latency.
+
+    Args:
+        version_path (Path): The version directory.
+        dtypes (List[str]): The quantization dtypes to evaluate.
+        rescore_candidates (List[int]): Numbers of first-pass candidates to re-score.  k gives the first pass alone.
+        k (int): The number of neighbours for recall@k, typically Retriever n_results.
+        n_queries (int): The number of stored embeddings used as queries.
+        seed (int): Seed for choosing the queries.
+
+    Returns:
+        Dict[str, object]: The evaluation parameters and one result per dtype and candidate count.
+    """
+    ids, embeddings, space = load_embeddings(version_path)
+    rows = np.random.default_rng(seed).choice(len(ids), n_queries, replace=False)
+    queries = embeddings[rows]
+    # Each query is a stored chunk, so drop it from both the truth and the results
+    truth = [
+        set([ids[j] for j in row if j != query_row][:k])
+        for query_row, row in zip(
+            rows, exact_neighbours(embeddings, queries, k + 1, space)
+        )
+    ]
+
+    collection_name = OmegaConf.load(version_path / "conf.yml")["VDB"]["collection"]
+    client = chromadb.PersistentClient(
+        path=str(resolve_store_path(version_path) / VDB.vdb_folder),
+        settings=Settings(anonymized_telemetry=False),
+    )
+    collection = client.get_collection(collection_name, embedding_function=None)
+
+    results = []
+    for dtype in dtypes:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = CompactIndex(Path(tmp), dtype)
+            start = time.perf_counter()
+            index.build(collection, fingerprint="benchmark")
+            build_seconds = time.perf_counter() - start
+            index.load()
+            for candidates in rescore_candidates:
+                latencies, recalls = [], []
+                for query_row, query, expected in zip(rows, queries, truth):
+                    start = time.perf_counter()
+                    found, _ = index.search(query[None, :], k + 1, candidates + 1)
+                    latencies.append(time.perf_counter() - start)
+                    found = [i for i in found[0] if i != ids[query_row]][:k]
+                    recalls.append(len(expected.intersection(found)) / len(expected))
+                result = {
+                    "dtype": dtype,
+                    "rescore_candidates": candidates,
+                    f"recall@{k}": round(float(np.mean(recalls)), 4),
+                    "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+                    "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+                    "build_seconds": round(build_seconds, 3),
+                    "compression": 4 / np.dtype(DTYPES[dtype]).itemsize,
+                }
+                print(json.dumps(result))
+                results.append(result)
+
+    return {
+        **git_commit(),
+        "version": version_path.name,
+        "n_chunks": len(ids),
+        "n_queries": n_queries,
+        "dim": int(embeddings.shape[1]),
+        "float32_mb": round(embeddings.nbytes / (1 << 20), 1),
+        "k": k,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="CompactIndexBenchmark",
+        description="Measure recall and latency of the quantized compact index on a version's embeddings.",
+    )
+    parser.add_argument("-d", "--directory", type=Path, required=True)
+    parser.add_argument(
+        "--dtype", nargs="+", choices=list(DTYPES), default=list(DTYPES)
+    )
+    parser.add_argument(
+        "--rescore-candidates", type=int, nargs="+", default=[10, 50, 100]
+    )
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="Output JSON path. Defaults to benchmarks/results/compact_index_{version}_{commit}.json",
+    )
+    args = parser.parse_args()
+
+    results = evaluate(
+        args.directory,
+        dtypes=args.dtype,
+        rescore_candidates=args.rescore_candidates,
+        k=args.k,
+        n_queries=args.queries,
+        seed=args.seed,
+    )
+    output = args.output or (
+        Path(__file__).parent
+        / "results"
+        / f"compact_index_{args.directory.name}_{results['commit'][:8]}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
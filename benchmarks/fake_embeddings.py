@@ -0,0 +1,171 @@
+"""
+Deterministic fake embeddings for running ingestion and embedding code without network access.
+
+Provides an in-process Chroma embedding function and a local HTTP server that mimics the
+Azure OpenAI embeddings endpoint, including 429 throttling once a tokens-per-minute budget
+is exceeded, so that the rate-limited embedding scheduler can be exercised end to end.
+
+Usage:
+    python -m benchmarks.fake_embeddings --port 8765 --tokens-per-minute 20000
+
+    Then set VDB.embedding_config.scheduler.endpoint to http://localhost:8765.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+DEPLOYMENT_PATH = re.compile(r"^/openai/deployments/(?P<deployment>[^/]+)/embeddings")
+
+
+def fake_embedding(text: str, dim: int = 1536) -> List[float]:
+    """Unit-norm vector seeded from the text's hash, so identical text gives identical vectors."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def approximate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    In-process embedding function returning deterministic vectors.
+
+    Args:
+        dim (int, optional): The embedding dimension. Defaults to 1536 (ada-002).
+    """
+
+    def __init__(self, dim: int = 1536) -> None:
+        self.dim = dim
+        self.calls = 0
+
+    def __call__(self, input: Documents) -> Embeddings:
+        self.calls += 1
+        return [fake_embedding(t, self.dim) for t in input]
+
+
+class _TokenBudget:
+    """Fixed one minute window of token usage, shared by all request handler threads."""
+
+    def __init__(self, tokens_per_minute: int) -> None:
+        self.tokens_per_minute = tokens_per_minute
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def try_spend(self, tokens: int) -> float:
+        """Spend tokens, returning 0 on success or the seconds until the window resets."""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start, self.used = now, 0
+            if self.used + tokens > self.tokens_per_minute:
+                return 60 - (now - self.window_start)
+            self.used += tokens
+            return 0.0
+
+
+def make_handler(dim: int, budget: _TokenBudget, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            match = DEPLOYMENT_PATH.match(self.path)
+            if not match:
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = (
+                body["input"] if isinstance(body["input"], list) else [body["input"]]
+            )
+            tokens = sum(approximate_tokens(t) for t in texts)
+            wait = budget.try_spend(tokens)
+            if wait:
+                self._respond(
+                    429,
+                    {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                    {"retry-after": f"{wait:.1f}"},
+                )
+                return
+            time.sleep(latency)
+            self._respond(
+                200,
+                {
+                    "object": "list",
+                    "model": match.group("deployment"),
+                    "data": [
+                        {
+                            "object": "embedding",
+                            "index": i,
+                            "embedding": fake_embedding(t, dim),
+                        }
+                        for i, t in enumerate(texts)
+                    ],
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                },
+            )
+
+        def _respond(self, status: int, payload: dict, headers: dict = {}):
+            content = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(
+    port: int, dim: int, tokens_per_minute: int, latency: float
+) -> ThreadingHTTPServer:
+    """
+    Start the fake embeddings endpoint in a background thread.
+
+    Args:
+        port (int): The port to listen on.
+        dim (int): The embedding dimension.
+        tokens_per_minute (int): Token budget before requests are throttled with 429s.
+        latency (float): Seconds each successful request takes, to simulate round trips.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer(
+        ("localhost", port),
+        make_handler(dim, _TokenBudget(tokens_per_minute), latency),
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="FakeEmbeddings",
+        description="Serve deterministic embeddings on an Azure OpenAI compatible route.",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--tokens-per-minute", type=int, default=240000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.dim, args.tokens_per_minute, args.latency)
+    print(f"Serving fake embeddings on http://localhost:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
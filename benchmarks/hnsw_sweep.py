@@ -0,0 +1,254 @@
+"""
+Sweep Chroma HNSW index parameters over an existing version's embeddings.
+
+Reads the chunk embeddings stored in a version's collection, holds out a sample of them as
+queries and builds a fresh collection for every point of a grid of M, construction_ef and
+search_ef values.  Each point reports recall@k against exact brute-force neighbours, query
+p50/p95 latency, build time and the estimated index size.  No embedding calls are made.
+The chosen parameters can then be set per version as VDB.hnsw_config in conf.yml.
+
+Usage:
+    python -m benchmarks.hnsw_sweep -d {version_directory} --M 16 32 64 --construction-ef 100 200 --search-ef 10 50 100
+"""
+
+import argparse
+import itertools
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+from omegaconf import OmegaConf
+
+from benchmarks.ingestion import git_commit
+from src.vectordb import VDB, HNSWConfig, hnsw_metadata, resolve_store_path
+
+# Chroma's defaults, for the parameters not being swept
+DEFAULT_M = 16
+DEFAULT_CONSTRUCTION_EF = 100
+DEFAULT_SEARCH_EF = 10
+PAGE_SIZE = 1000
+
+
+def load_embeddings(version_path: Path) -> Tuple[List[str], np.ndarray, str]:
+    """
+    Read all chunk ids and embeddings from a version's collection.
+
+    Args:
+        version_path (Path): The version directory.
+
+    Returns:
+        Tuple[List[str], np.ndarray, str]: The chunk ids, the embeddings and the collection's distance space.
+    """
+    collection_name = OmegaConf.load(version_path / "conf.yml")["VDB"]["collection"]
+    client = chromadb.PersistentClient(
+        path=str(resolve_store_path(version_path) / VDB.vdb_folder),
+        settings=Settings(anonymized_telemetry=False),
+    )
+    collection = client.get_collection(collection_name, embedding_function=None)
+    ids, embeddings = [], []
+    for offset in range(0, collection.count(), PAGE_SIZE):
+        page = collection.get(include=["embeddings"], limit=PAGE_SIZE, offset=offset)
+        ids.extend(page["ids"])
+        embeddings.extend(page["embeddings"])
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    return ids, np.asarray(embeddings, dtype=np.float32), space
+
+
+def exact_neighbours(
+    index: np.ndarray, queries: np.ndarray, k: int, space: str
+) -> np.ndarray:
+    """
+    Brute-force the k nearest indexed vectors of each query, using Chroma's distance for the space.
+
+    Args:
+        index (np.ndarray): The indexed vectors, one per row.
+        queries (np.ndarray): The query vectors, one per row.
+        k (int): The number of neighbours.
+        space (str): "l2", "cosine" or "ip".
+
+    Returns:
+        np.ndarray: The row indices of the neighbours of each query, nearest first.
+    """
+    if space == "cosine":
+        index = index / np.linalg.norm(index, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ index.T
+    if space == "l2":
+        distances = (index**2).sum(axis=1)[None, :] - 2 * scores
+    else:
+        distances = -scores
+    nearest = np.argpartition(distances, k, axis=1)[:, :k]
+    order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def estimate_index_bytes(n: int, dim: int, M: int) -> int:
+    """
+    Estimate the memory hnswlib uses for an index: level 0 holds the vector, 2*M links and
+    a label per element, and each upper level (reached by 1/ln(M) of elements on average)
+    holds M links.
+    """
+    level0 = n * (dim * 4 + 4 + 2 * M * 4 + 8)
+    upper = int(n / np.log(M) * (4 + M * 4))
+    return level0 + upper
+
+
+def run_point(
+    ids: List[str],
+    embeddings: np.ndarray,
+    queries: np.ndarray,
+    truth: List[set],
+    k: int,
+    hnsw_config: HNSWConfig,
+    batch_size: int,
+) -> Dict[str, object]:
+    """Build a collection with the given HNSW parameters and measure it against the exact neighbours."""
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(
+            path=tmp, settings=Settings(anonymized_telemetry=False)
+        )
+        collection = client.create_collection(
+            "sweep", embedding_function=None, metadata=hnsw_metadata(hnsw_config)
+        )
+        start = time.perf_counter()
+        for i in range(0, len(ids), batch_size):
+            collection.add(
+                ids=ids[i : i + batch_size],
+                embeddings=embeddings[i : i + batch_size].tolist(),
+            )
+        build_seconds = time.perf_counter() - start
+
+        position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            result = collection.query(
+                query_embeddings=[query.tolist()], n_results=k, include=[]
+            )
+            latencies.append(time.perf_counter() - start)
+            found = {position[chunk_id] for chunk_id in result["ids"][0]}
+            recalls.append(len(found.intersection(expected)) / k)
+
+    return {
+        **hnsw_config,
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "build_seconds": round(build_seconds, 3),
+        "index_mb": round(
+            estimate_index_bytes(len(ids), embeddings.shape[1], hnsw_config["M"])
+            / (1 << 20),
+            1,
+        ),
+    }
+
+
+def sweep(
+    version_path: Path,
+    M_values: List[int],
+    construction_efs: List[int],
+    search_efs: List[int],
+    k: int,
+    n_queries: int,
+    batch_size: int,
+    seed: int,
+) -> Dict[str, object]:
+    """
+    Run the parameter grid over a version's embeddings.
+
+    Args:
+        version_path (Path): The version directory.
+        M_values (List[int]): Values of hnsw:M.
+        construction_efs (List[int]): Values of hnsw:construction_ef.
+        search_efs (List[int]): Values of hnsw:search_ef.
+        k (int): The number of neighbours for recall@k, typically Retriever n_results.
+        n_queries (int): The number of stored embeddings held out as queries.
+        batch_size (int): Embeddings per add call when building.
+        seed (int): Seed for choosing the held out queries.
+
+    Returns:
+        Dict[str, object]: The sweep parameters and one result per grid point.
+    """
+    ids, embeddings, space = load_embeddings(version_path)
+    assert len(ids) > n_queries + k, f"Need more than {n_queries + k} chunks to sweep"
+    rng = np.random.default_rng(seed)
+    held_out = np.zeros(len(ids), dtype=bool)
+    held_out[rng.choice(len(ids), n_queries, replace=False)] = True
+    queries = embeddings[held_out]
+    index_ids = [chunk_id for chunk_id, h in zip(ids, held_out) if not h]
+    index_embeddings = embeddings[~held_out]
+    truth = [set(row) for row in exact_neighbours(index_embeddings, queries, k, space)]
+
+    results = []
+    for M, construction_ef, search_ef in itertools.product(
+        M_values, construction_efs, search_efs
+    ):
+        hnsw_config: HNSWConfig = {
+            "space": space,
+            "M": M,
+            "construction_ef": construction_ef,
+            "search_ef": search_ef,
+        }
+        result = run_point(
+            index_ids, index_embeddings, queries, truth, k, hnsw_config, batch_size
+        )
+        print(json.dumps(result))
+        results.append(result)
+
+    return {
+        **git_commit(),
+        "version": version_path.name,
+        "n_chunks": len(index_ids),
+        "n_queries": n_queries,
+        "dim": int(embeddings.shape[1]),
+        "k": k,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="HNSWSweep",
+        description="Measure recall and latency of HNSW parameters on a version's embeddings.",
+    )
+    parser.add_argument("-d", "--directory", type=Path, required=True)
+    parser.add_argument("--M", type=int, nargs="+", default=[DEFAULT_M])
+    parser.add_argument(
+        "--construction-ef", type=int, nargs="+", default=[DEFAULT_CONSTRUCTION_EF]
+    )
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[DEFAULT_SEARCH_EF])
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="Output JSON path. Defaults to benchmarks/results/hnsw_{version}_{commit}.json",
+    )
+    args = parser.parse_args()
+
+    results = sweep(
+        args.directory,
+        M_values=args.M,
+        construction_efs=args.construction_ef,
+        search_efs=args.search_ef,
+        k=args.k,
+        n_queries=args.queries,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+    output = args.output or (
+        Path(__file__).parent
+        / "results"
+        / f"hnsw_{args.directory.name}_{results['commit'][:8]}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
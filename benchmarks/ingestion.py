@@ -0,0 +1,346 @@
+"""
+Offline benchmark of the ingestion stages in src/vectordb.py.
+
+Generates synthetic PDFs of configurable size and layout, then times each ingestion stage
+separately: partitioning (pages/sec), chunking (chunks/sec), embedding with a deterministic
+fake embedding function (embeddings/sec) and inserting into a local Chroma collection
+(inserts/sec).  Peak resident memory is recorded after each stage.  No network access is
+needed.  Results are written as JSON, tagged with the git commit, so runs on different
+commits can be compared.
+
+Usage:
+    python -m benchmarks.ingestion --files 5 --pages 20 --layout two_column
+
+    To benchmark a pipeline version's settings, pass --conf {version}/conf.yml to take the
+    partition and chunking config from it.
+"""
+
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import chromadb
+from chromadb.config import Settings
+from omegaconf import OmegaConf
+from unstructured.__version__ import __version__ as unstructured_version
+
+from benchmarks.fake_embeddings import FakeEmbeddingFunction
+from src.util import to_plain
+from src.vectordb import _chunk_elements, _partition_pdf
+
+LAYOUTS = ["single", "two_column"]
+PAGE_WIDTH, PAGE_HEIGHT, MARGIN = 612, 792, 72
+FONT_SIZE, LEADING = 10, 13
+WORDS = (
+    "audit contract supplier payment invoice liability clause term agreement party "
+    "obligation notice period delivery warranty schedule service price review control "
+    "risk compliance record report evidence sample testing approval procurement value "
+    "budget assurance governance framework requirement standard process"
+).split()
+
+DEFAULT_PARTITION_CONFIG = {"strategy": "fast"}
+DEFAULT_CHUNKING_CONFIG = {"max_characters": 512, "overlap": 64}
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(8, 18))
+    return " ".join(words).capitalize() + "."
+
+
+def _wrap(text: str, width: int) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def _page_stream(
+    rng: random.Random, page_number: int, layout: str, paragraphs: int
+) -> bytes:
+    """Content stream for one page: a heading then wrapped paragraphs in one or two columns."""
+    n_columns = 2 if layout == "two_column" else 1
+    gutter = 24
+    column_width = (PAGE_WIDTH - 2 * MARGIN - gutter * (n_columns - 1)) / n_columns
+    chars_per_line = int(column_width / (FONT_SIZE * 0.5))
+    lines_per_column = int((PAGE_HEIGHT - 2 * MARGIN - 2 * LEADING) / LEADING)
+
+    if page_number % 5 == 1:
+        heading = f"Chapter {page_number // 5 + 1} {rng.choice(WORDS).title()}"
+    else:
+        heading = " ".join(rng.choices(WORDS, k=3)).upper()
+    ops = [
+        f"BT /F1 {FONT_SIZE + 4} Tf {MARGIN} {PAGE_HEIGHT - MARGIN} Td "
+        f"({_escape(heading)}) Tj ET"
+    ]
+    column, row = 0, 0
+    for _ in range(paragraphs):
+        paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+        for line in _wrap(paragraph, chars_per_line) + [""]:
+            if row >= lines_per_column:
+                column, row = column + 1, 0
+            if column >= n_columns:
+                break
+            x = MARGIN + column * (column_width + gutter)
+            y = PAGE_HEIGHT - MARGIN - 2 * LEADING - row * LEADING
+            if line:
+                ops.append(
+                    f"BT /F1 {FONT_SIZE} Tf {x:.0f} {y:.0f} Td ({_escape(line)}) Tj ET"
+                )
+            row += 1
+    return "\n".join(ops).encode("latin-1")
+
+
+def write_pdf(path: Path, pages: int, layout: str, paragraphs: int, seed: int) -> None:
+    """
+    Write a text-only PDF with a Helvetica text layer, without any PDF library.
+
+    Args:
+        path (Path): The output path.
+        pages (int): The number of pages.
+        layout (str): "single" or "two_column".
+        paragraphs (int): Paragraphs per page; text that does not fit on the page is dropped.
+        seed (int): Seed for the generated text.
+    """
+    rng = random.Random(seed)
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and content stream per page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page_number in range(1, pages + 1):
+        stream = _page_stream(rng, page_number, layout, paragraphs)
+        page_id, content_id = len(objects) + 1, len(objects) + 2
+        page_refs.append(f"{page_id} 0 R")
+        objects.append(
+            (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode("latin-1")
+        )
+        objects.append(
+            f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1")
+            + stream
+            + b"\nendstream"
+        )
+    objects[1] = (
+        f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {pages} >>"
+    ).encode("latin-1")
+
+    content = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f"{i} 0 obj\n".encode("latin-1") + obj + b"\nendobj\n"
+    xref_offset = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        content += f"{offset:010d} 00000 n \n".encode("latin-1")
+    content += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode("latin-1")
+    path.write_bytes(bytes(content))
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def git_commit() -> Dict[str, object]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=False
+        ).stdout.strip()
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+def _stage(name: str, seconds: float, count: int, unit: str) -> Dict[str, object]:
+    return {
+        "stage": name,
+        "seconds": round(seconds, 4),
+        unit: count,
+        f"{unit}_per_sec": round(count / seconds, 2) if seconds else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_benchmark(
+    files: int,
+    pages: int,
+    layout: str,
+    paragraphs: int,
+    partition_config: Dict,
+    chunking_config: Dict,
+    embedding_dim: int,
+    batch_size: int,
+    seed: int,
+) -> Dict[str, object]:
+    """
+    Generate synthetic PDFs and time each ingestion stage over them.
+
+    Args:
+        files (int): The number of PDFs to generate.
+        pages (int): Pages per PDF.
+        layout (str): "single" or "two_column".
+        paragraphs (int): Paragraphs per page.
+        partition_config (Dict): Keyword arguments for _partition_pdf.
+        chunking_config (Dict): Keyword arguments for _chunk_elements.
+        embedding_dim (int): Dimension of the fake embeddings.
+        batch_size (int): Chunks per embedding call and per Chroma insert.
+        seed (int): Seed for the generated text.
+
+    Returns:
+        Dict[str, object]: The benchmark parameters and per-stage results.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        paths = []
+        for i in range(files):
+            path = tmp_dir / f"synthetic_{i:03d}.pdf"
+            write_pdf(path, pages, layout, paragraphs, seed + i)
+            paths.append(path)
+        baseline_rss = peak_rss_mb()
+
+        start = time.perf_counter()
+        partitioned = [_partition_pdf(path, **partition_config) for path in paths]
+        partition_seconds = time.perf_counter() - start
+        partition = _stage("partition", partition_seconds, files * pages, "pages")
+        partition["elements"] = sum(len(e) for e in partitioned)
+
+        start = time.perf_counter()
+        chunked = [_chunk_elements(e, **chunking_config) for e in partitioned]
+        chunk_seconds = time.perf_counter() - start
+        ids = [i for file_ids, _, _ in chunked for i in file_ids]
+        metadatas = [m for _, file_meta, _ in chunked for m in file_meta]
+        documents = [d for _, _, file_docs in chunked for d in file_docs]
+        chunk = _stage("chunk", chunk_seconds, len(ids), "chunks")
+        del partitioned
+
+        embedding_function = FakeEmbeddingFunction(embedding_dim)
+        start = time.perf_counter()
+        embeddings = []
+        for i in range(0, len(documents), batch_size):
+            embeddings.extend(embedding_function(documents[i : i + batch_size]))
+        embed = _stage(
+            "embed", time.perf_counter() - start, len(embeddings), "embeddings"
+        )
+
+        client = chromadb.PersistentClient(
+            path=str(tmp_dir / "vdb"), settings=Settings(anonymized_telemetry=False)
+        )
+        collection = client.create_collection("benchmark")
+        start = time.perf_counter()
+        for i in range(0, len(ids), batch_size):
+            collection.add(
+                ids=ids[i : i + batch_size],
+                metadatas=metadatas[i : i + batch_size],
+                documents=documents[i : i + batch_size],
+                embeddings=embeddings[i : i + batch_size],
+            )
+        insert = _stage("insert", time.perf_counter() - start, len(ids), "inserts")
+
+    return {
+        **git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "versions": {
+            "python": platform.python_version(),
+            "unstructured": unstructured_version,
+            "chromadb": chromadb.__version__,
+        },
+        "params": {
+            "files": files,
+            "pages": pages,
+            "layout": layout,
+            "paragraphs": paragraphs,
+            "partition_config": partition_config,
+            "chunking_config": chunking_config,
+            "embedding_dim": embedding_dim,
+            "batch_size": batch_size,
+            "seed": seed,
+        },
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "stages": [partition, chunk, embed, insert],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="IngestionBenchmark",
+        description="Time partitioning, chunking, embedding and inserting synthetic PDFs.",
+    )
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--layout", choices=LAYOUTS, default="single")
+    parser.add_argument("--paragraphs", type=int, default=4)
+    parser.add_argument(
+        "--conf",
+        type=Path,
+        help="A version's conf.yml to take VDB.partition_config and VDB.chunking_config from",
+    )
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="Output JSON path. Defaults to benchmarks/results/ingestion_{commit}.json",
+    )
+    args = parser.parse_args()
+
+    partition_config, chunking_config = (
+        DEFAULT_PARTITION_CONFIG,
+        DEFAULT_CHUNKING_CONFIG,
+    )
+    if args.conf:
+        vdb_config = OmegaConf.load(args.conf)["VDB"]
+        partition_config = to_plain(vdb_config["partition_config"])
+        chunking_config = to_plain(vdb_config["chunking_config"])
+
+    results = run_benchmark(
+        files=args.files,
+        pages=args.pages,
+        layout=args.layout,
+        paragraphs=args.paragraphs,
+        partition_config=partition_config,
+        chunking_config=chunking_config,
+        embedding_dim=args.dim,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+    output = args.output or (
+        Path(__file__).parent / "results" / f"ingestion_{results['commit'][:8]}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    for stage in results["stages"]:
+        print(json.dumps(stage))
+    print(f"Results written to {output}")
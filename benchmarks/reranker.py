@@ -0,0 +1,238 @@
+"""
+Compare the latency and ranking agreement of the ONNX reranker backend against PyTorch.
+
+Queries are built from a version's stored chunks without any embedding calls: for each
+sampled chunk, its first words are used as the query and its nearest stored neighbours
+(by the stored embeddings) as the candidates to rerank, as Retriever n_results would
+return.  Each backend variant scores the same pairs, reporting per-query p50/p95 latency,
+and agreement with the PyTorch ranking: top-1 agreement, top-k overlap and the Spearman
+correlation of the scores.
+
+Usage:
+    python -m benchmarks.reranker -d {version_directory} --candidates 10 --top-k 5 --intra-op-threads 1 2 4
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+from omegaconf import OmegaConf
+from scipy.stats import spearmanr
+
+from benchmarks.hnsw_sweep import exact_neighbours, load_embeddings
+from benchmarks.ingestion import git_commit
+from src.reranker import load_cross_encoder
+from src.vectordb import VDB, resolve_store_path
+
+DEFAULT_MODEL = "cross-encoder/stsb-roberta-base"
+
+
+def load_pairs(
+    version_path: Path, n_queries: int, n_candidates: int, query_words: int, seed: int
+) -> List[List[List[str]]]:
+    """
+    Build the [query, document] pairs to rerank for each sampled chunk of a version.
+
+    Args:
+        version_path (Path): The version directory.
+        n_queries (int): The number of chunks sampled as queries.
+        n_candidates (int): The number of candidates per query.
+        query_words (int): The number of leading words of a chunk used as its query.
+        seed (int): Seed for sampling the chunks.
+
+    Returns:
+        List[List[List[str]]]: The pairs of each query.
+    """
+    ids, embeddings, space = load_embeddings(version_path)
+    rows = np.random.default_rng(seed).choice(len(ids), n_queries, replace=False)
+    neighbours = exact_neighbours(embeddings, embeddings[rows], n_candidates, space)
+
+    collection_name = OmegaConf.load(version_path / "conf.yml")["VDB"]["collection"]
+    client = chromadb.PersistentClient(
+        path=str(resolve_store_path(version_path) / VDB.vdb_folder),
+        settings=Settings(anonymized_telemetry=False),
+    )
+    collection = client.get_collection(collection_name, embedding_function=None)
+    needed = sorted({ids[i] for row in neighbours for i in row})
+    fetched = collection.get(ids=needed, include=["documents"])
+    documents = dict(zip(fetched["ids"], fetched["documents"]))
+
+    pairs = []
+    for query_row, row in zip(rows, neighbours):
+        query = " ".join(documents[ids[query_row]].split()[:query_words])
+        pairs.append([[query, documents[ids[i]]] for i in row])
+    return pairs
+
+
+def score_all(
+    cross_encoder, pairs: List[List[List[str]]], batch_size: int
+) -> Tuple[List[np.ndarray], List[float]]:
+    """Score each query's pairs, returning the scores and the latency of each query."""
+    cross_encoder.predict(pairs[0], batch_size=batch_size)  # warm up
+    scores, latencies = [], []
+    for query_pairs in pairs:
+        start = time.perf_counter()
+        scores.append(
+            np.asarray(cross_encoder.predict(query_pairs, batch_size=batch_size))
+        )
+        latencies.append(time.perf_counter() - start)
+    return scores, latencies
+
+
+def agreement(
+    reference: List[np.ndarray], scores: List[np.ndarray], top_k: int
+) -> Dict[str, float]:
+    """Measure how closely a variant's rankings agree with the reference rankings."""
+    top1, overlap, correlation = [], [], []
+    for expected, found in zip(reference, scores):
+        expected_order = np.argsort(-expected)
+        found_order = np.argsort(-found)
+        top1.append(expected_order[0] == found_order[0])
+        overlap.append(
+            len(set(expected_order[:top_k]).intersection(found_order[:top_k])) / top_k
+        )
+        correlation.append(spearmanr(expected, found).correlation)
+    return {
+        "top1_agreement": round(float(np.mean(top1)), 4),
+        f"top{top_k}_overlap": round(float(np.mean(overlap)), 4),
+        "spearman": round(float(np.nanmean(correlation)), 4),
+    }
+
+
+def evaluate(
+    version_path: Path,
+    model: str,
+    intra_op_threads: List[Optional[int]],
+    n_queries: int,
+    n_candidates: int,
+    top_k: int,
+    batch_size: int,
+    query_words: int,
+    seed: int,
+) -> Dict[str, object]:
+    """
+    Score the same pairs with PyTorch and each ONNX variant and compare them.
+
+    Args:
+        version_path (Path): The version directory.
+        model (str): The cross-encoder name.
+        intra_op_threads (List[Optional[int]]): Thread counts to run the ONNX variants with.  None for onnxruntime's choice.
+        n_queries (int): The number of queries.
+        n_candidates (int): The number of candidates reranked per query, typically Retriever n_results.
+        top_k (int): The number of results kept after reranking.
+        batch_size (int): Pairs scored per forward pass.
+        query_words (int): The number of leading words of a chunk used as its query.
+        seed (int): Seed for sampling the queries.
+
+    Returns:
+        Dict[str, object]: The evaluation parameters and one result per variant.
+    """
+    pairs = load_pairs(version_path, n_queries, n_candidates, query_words, seed)
+    reference, latencies = score_all(
+        load_cross_encoder(model, "torch"), pairs, batch_size
+    )
+    variants = [("torch", False, None, reference, latencies)]
+    for quantize in [False, True]:
+        for threads in intra_op_threads:
+            cross_encoder = load_cross_encoder(model, "onnx", quantize, threads)
+            variants.append(
+                (
+                    "onnx",
+                    quantize,
+                    threads,
+                    *score_all(cross_encoder, pairs, batch_size),
+                )
+            )
+
+    baseline_p50 = np.percentile(latencies, 50)
+    results = []
+    for backend, quantize, threads, scores, latencies in variants:
+        result = {
+            "backend": backend,
+            "quantize": quantize,
+            "intra_op_threads": threads,
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+            "speedup_p50": round(float(baseline_p50 / np.percentile(latencies, 50)), 2),
+            **agreement(reference, scores, top_k),
+            "max_score_difference": round(
+                float(max(np.abs(r - s).max() for r, s in zip(reference, scores))), 5
+            ),
+        }
+        print(json.dumps(result))
+        results.append(result)
+
+    return {
+        **git_commit(),
+        "version": version_path.name,
+        "model": model,
+        "n_queries": n_queries,
+        "n_candidates": n_candidates,
+        "top_k": top_k,
+        "batch_size": batch_size,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="RerankerBenchmark",
+        description="Compare latency and ranking agreement of the ONNX reranker backend against PyTorch.",
+    )
+    parser.add_argument("-d", "--directory", type=Path, required=True)
+    parser.add_argument(
+        "--model",
+        help="Cross-encoder name. Defaults to the version's reranking model, or "
+        + DEFAULT_MODEL,
+    )
+    parser.add_argument(
+        "--intra-op-threads",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="Thread counts for the ONNX variants. 0 for onnxruntime's choice.",
+    )
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--candidates", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--query-words", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="Output JSON path. Defaults to benchmarks/results/reranker_{version}_{commit}.json",
+    )
+    args = parser.parse_args()
+
+    model = args.model
+    if model is None:
+        config = OmegaConf.load(args.directory / "conf.yml")
+        reranking = config["Retriever"].get("retrieval_config", {}).get("reranking")
+        model = reranking["model"] if reranking else DEFAULT_MODEL
+
+    results = evaluate(
+        args.directory,
+        model=model,
+        intra_op_threads=[t or None for t in args.intra_op_threads],
+        n_queries=args.queries,
+        n_candidates=args.candidates,
+        top_k=args.top_k,
+        batch_size=args.batch_size,
+        query_words=args.query_words,
+        seed=args.seed,
+    )
+    output = args.output or (
+        Path(__file__).parent
+        / "results"
+        / f"reranker_{args.directory.name}_{results['commit'][:8]}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
@@ -6,11 +6,14 @@ import streamlit as st
 
 from components import USER_SELECTOR_KEY
 from src.util import cache_resource
+from src.vectordb import resolve_store_path
 
 
 def file_list(version_directory: Path, pipeline_version: str):
     st.write("I currently know about the following documents:")
-    files = os.listdir(version_directory / pipeline_version / "files")
+    files = os.listdir(
+        resolve_store_path(version_directory / pipeline_version) / "files"
+    )
     for file in files:
         st.markdown(f"- {file}")
 
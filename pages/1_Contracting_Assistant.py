@@ -48,6 +48,7 @@ from components.chat import (
 from src.messages import Instance, MessageHistory
 from src.pipeline_versions import VersionManager
 from src.util import copy_to_clipboard, clean_filename
+from src.warmup import start_warmup
 from streamlit import session_state
 
 version_directory = Path(os.environ["RAG_VERSION_DIR"])
@@ -65,6 +66,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded",
 )
+start_warmup(version_directory)
 custom_css()
 set_png_as_page_bg("style/assets/logo.png")
 backgroundImage()
@@ -8,7 +8,11 @@ from components.theme import (
     set_png_as_page_bg,
     static_admin_head,
 )
+from omegaconf import OmegaConf
 from src.pipeline_versions import VersionManager
+from src.answer_cache import load_answer_cache
+from src.retriever import load_query_cache, load_result_cache
+from src.warmup import start_warmup
 
 st.set_page_config(
     page_icon=":space_invader:",
@@ -43,3 +47,43 @@ selected_default_pipeline = st.selectbox(
 
 if selected_default_pipeline and (selected_default_pipeline != vm.default):
     vm.save_default_version(selected_default_pipeline)
+
+st.subheader("Query caches")
+cache_stats = {}
+for version in vm.app_versions:
+    config = OmegaConf.load(version_directory / version / "conf.yml")
+    retrieval_config = config["Retriever"].get("retrieval_config", {})
+    if "query_cache" in retrieval_config:
+        cache_stats[f"{version} query embeddings"] = load_query_cache(
+            version_directory,
+            config["VDB"]["embedding_config"]["model_name"],
+            **retrieval_config["query_cache"],
+        ).stats()
+    if "result_cache" in retrieval_config:
+        # Shared between versions with the same settings
+        cache_stats[f"{version} results"] = load_result_cache(
+            **retrieval_config["result_cache"]
+        ).stats()
+    if "answer_cache" in config["RAG"]:
+        cache_stats[f"{version} answers"] = load_answer_cache(
+            version_directory / version, **config["RAG"]["answer_cache"]
+        ).stats()
+if cache_stats:
+    st.dataframe(cache_stats)
+else:
+    st.write(
+        "No app version has Retriever.retrieval_config.query_cache or result_cache, or RAG.answer_cache set."
+    )
+
+st.subheader("Warm-up")
+warmup_status = start_warmup(version_directory)
+if not warmup_status.versions:
+    st.write("Warm-up is disabled (RAG_WARMUP=OFF).")
+else:
+    if warmup_status.done:
+        st.write(
+            f"Finished in {warmup_status.finished - warmup_status.started:.1f}s after server start."
+        )
+    else:
+        st.write("Running.")
+    st.dataframe(warmup_status.stats())
@@ -1,6 +1,6 @@
 import argparse
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 from src.evaluation import (
     costs_bar_chart_stacked,
     scores_bar_chart,
@@ -39,7 +39,12 @@ def check_streamlit():
         return False
 
 
-def run(directory: Path, vectorise: bool, question_dir: Path):
+def run(
+    directory: Path,
+    vectorise: bool,
+    question_dir: Path,
+    n_workers: Optional[int] = None,
+):
     logging.basicConfig(stream=sys.stdout, level=logging.INFO)
     logger = logging.getLogger(__name__)
 
@@ -51,6 +56,10 @@ def run(directory: Path, vectorise: bool, question_dir: Path):
     set_model_cache_env()
 
     config = OmegaConf.load(directory / "conf.yml")
+    if n_workers is not None:
+        OmegaConf.update(
+            config, "VDB.ingestion_config.n_workers", n_workers, merge=True
+        )
     logger.info("Setting up pipeline")
     if check_streamlit():
         import streamlit as st
@@ -64,13 +73,17 @@ def run(directory: Path, vectorise: bool, question_dir: Path):
 
     if vectorise:
         message_manager.create_user("evaluation")
-        message_manager.change_user("evaluation")
+    message_manager.change_user("evaluation")
+    if vectorise and vdb.read_only:
+        logger.info(f"Skipping vectorisation, using vdb of {vdb.store_path.name}")
+        if check_streamlit():
+            st.write(f"Skipping vectorisation, using vdb of {vdb.store_path.name}")
+    elif vectorise:
         logger.info("Vectorising")
         if check_streamlit():
             st.write("Vectorising")
-        vdb.add_pdfs([p for p in (directory / "files").iterdir()])
+        vdb.sync_pdfs(sorted((directory / "files").iterdir()))
     else:
-        message_manager.change_user("evaluation")
         logger.info("Skipping vectorisation")
         if check_streamlit():
             st.write("Skipping vectorisation")
@@ -80,10 +93,16 @@ def run(directory: Path, vectorise: bool, question_dir: Path):
     q_dict = questions_df.to_dict(orient="index")
 
     model = config["RAG"]["model"]
+    # Retrieve for every question in batched embedding, search and re-ranking calls
+    all_retrieved_chunks = dict(
+        zip(q_dict, retriever.query_many([q["question"] for q in q_dict.values()]))
+    )
     for i in tqdm(q_dict, "running questions"):
         instance = message_manager.create_instance(name_override=str(i))
         message_manager.change_instance(instance_id=instance.id)
-        response, chunks = rag.query(prompt=q_dict[i]["question"])
+        response, chunks = rag.query(
+            prompt=q_dict[i]["question"], retrieved_chunks=all_retrieved_chunks[i]
+        )
         update_q_dict(q_dict, i, response, chunks, model)
 
     import os
@@ -152,9 +171,21 @@ if __name__ == "__main__":
         help="Flag to toggle file vectorisation.  \
             Off requires a vdb to already exist in the RAG directory.",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of processes used to partition files when vectorising.  \
+            Overrides VDB.ingestion_config.n_workers in conf.yml.",
+    )
     args = parser.parse_args()
     directory = Path(args.directory)
     vectorise = args.vectorise
     question_dir = args.questions
 
-    run(directory=directory, vectorise=vectorise, question_dir=question_dir)
+    run(
+        directory=directory,
+        vectorise=vectorise,
+        question_dir=question_dir,
+        n_workers=args.workers,
+    )
@@ -0,0 +1,110 @@
+"""
+Module for partitioning PDFs with a per-page choice of strategy.
+
+The hi_res strategy runs layout detection and OCR on every page, which is wasted on pages
+that already have a good text layer and no tables or figures.  The adaptive strategy
+inspects each page with pdfplumber and only sends pages that need layout inference through
+hi_res; the remaining pages use the fast text-layer extraction.  The results are merged
+back into a single element list in page order.
+
+Functions:
+    classify_pages: Split the pages of a PDF into those that can use the fast strategy and those that need hi_res.
+    partition_pdf_adaptive: Partition a PDF using the fast strategy where possible and hi_res elsewhere.
+"""
+
+import logging
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+import pdfplumber
+from pypdf import PdfReader, PdfWriter
+from unstructured.documents.elements import Element
+from unstructured.partition.pdf import partition_pdf
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_STRATEGY = "adaptive"
+
+
+def classify_pages(filepath: Path, min_text_chars: int) -> Tuple[List[int], List[int]]:
+    """
+    Split the pages of a PDF by whether they need layout inference.  A page needs hi_res
+    if it has too little extractable text (e.g. scanned), or contains tables or images.
+
+    Args:
+        filepath (Path): The path to the PDF file.
+        min_text_chars (int): Pages with fewer extractable characters than this use hi_res.
+
+    Returns:
+        Tuple[List[int], List[int]]: The 1-based page numbers for the fast and hi_res strategies.
+    """
+    fast_pages, hi_res_pages = [], []
+    with pdfplumber.open(filepath) as pdf:
+        for page_number, page in enumerate(pdf.pages, start=1):
+            needs_layout = (
+                len(page.chars) < min_text_chars
+                or bool(page.images)
+                or bool(page.find_tables())
+            )
+            (hi_res_pages if needs_layout else fast_pages).append(page_number)
+            page.close()
+    return fast_pages, hi_res_pages
+
+
+def _partition_pages(
+    filepath: Path, page_numbers: List[int], **kwargs
+) -> List[Element]:
+    """Partition a subset of pages with hi_res, mapping page numbers back to the original file."""
+    reader = PdfReader(filepath)
+    writer = PdfWriter()
+    for page_number in page_numbers:
+        writer.add_page(reader.pages[page_number - 1])
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as subset:
+        writer.write(subset)
+        subset.flush()
+        elements = partition_pdf(
+            subset.name, strategy="hi_res", metadata_filename=str(filepath), **kwargs
+        )
+    for element in elements:
+        if element.metadata.page_number is not None:
+            element.metadata.page_number = page_numbers[
+                element.metadata.page_number - 1
+            ]
+    return elements
+
+
+def partition_pdf_adaptive(
+    filepath: Path, min_text_chars: int = 200, **kwargs
+) -> List[Element]:
+    """
+    Partition a PDF using the fast strategy for pages with a usable text layer and no
+    tables or images, and hi_res for the rest.
+
+    Args:
+        filepath (Path): The path to the PDF file.
+        min_text_chars (int, optional): Pages with fewer extractable characters use hi_res. Defaults to 200.
+        **kwargs: Additional keyword arguments for partition_pdf, excluding strategy.
+
+    Returns:
+        List[Element]: The elements of all pages, in page order.
+    """
+    kwargs.pop("strategy", None)
+    fast_pages, hi_res_pages = classify_pages(filepath, min_text_chars)
+    logger.info(
+        f"{Path(filepath).name}: {len(fast_pages)} pages fast, {len(hi_res_pages)} pages hi_res"
+    )
+    if not hi_res_pages:
+        return partition_pdf(filepath, strategy="fast", **kwargs)
+    if not fast_pages:
+        return partition_pdf(filepath, strategy="hi_res", **kwargs)
+
+    fast_set = set(fast_pages)
+    elements = [
+        e
+        for e in partition_pdf(filepath, strategy="fast", **kwargs)
+        if e.metadata.page_number in fast_set
+    ]
+    elements.extend(_partition_pages(filepath, hi_res_pages, **kwargs))
+    # Stable sort keeps the reading order of elements within each page
+    return sorted(elements, key=lambda e: e.metadata.page_number or 0)
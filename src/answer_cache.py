@@ -0,0 +1,209 @@
+"""
+Module for caching answers to first-turn questions by semantic similarity.
+
+Many users ask the same question in slightly different words, and each would otherwise pay
+for retrieval, reranking and a completion.  Answers are stored with the embedding of their
+question in a SQLite database in the version directory, so versions never share answers.
+A new question is answered from the cache when its embedding's cosine similarity to a
+stored question reaches the threshold.  Entries only match while the RAG and retrieval
+configuration and the collection are unchanged, and are evicted after a time to live or,
+least recently used first, beyond maxsize.
+
+Classes:
+    AnswerCacheConfig: Typed dictionary for the answer cache configuration.
+    SemanticAnswerCache: SQLite cache of completions and their context, looked up by question similarity.
+
+Functions:
+    load_answer_cache: Get the answer cache of a version, shared between sessions.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+import numpy as np
+from chromadb.api.types import QueryResult
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion
+
+from src import queries
+from src.util import cache_resource
+
+
+class AnswerCacheConfig(TypedDict, total=False):
+    threshold: float
+    maxsize: int
+    ttl: float
+
+
+class SemanticAnswerCache:
+    """
+    SQLite cache of completions and their retrieved context, looked up by the cosine similarity of question embeddings.
+
+    Args:
+        directory (Path): The directory the cache database is stored in, normally the version directory.
+        threshold (float, optional): The cosine similarity at which a stored question matches. Defaults to 0.95.
+        maxsize (int, optional): The number of answers kept, least recently used evicted first. Defaults to 1000.
+        ttl (float, optional): Seconds before a stored answer expires. Defaults to one week.
+    """
+
+    file_name = "answer_cache.db"
+
+    def __init__(
+        self,
+        directory: Path,
+        threshold: float = 0.95,
+        maxsize: int = 1000,
+        ttl: float = 604800,
+    ) -> None:
+        assert 0 < threshold <= 1, f"threshold ({threshold}) must be in (0, 1]"
+        self.directory = directory
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        connection = self._open_connection()
+        connection.execute(queries.CREATE_ANSWERS_TABLE)
+        connection.commit()
+        connection.close()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _open_connection(self):
+        return sqlite3.connect(self.directory / self.file_name, timeout=30)
+
+    def get(
+        self, embedding: List[float], config_hash: str, fingerprint: str
+    ) -> Optional[Tuple[ChatCompletion, Optional[QueryResult]]]:
+        """
+        Find the stored answer to the most similar question, if similar enough.
+
+        Args:
+            embedding (List[float]): The question embedding.
+            config_hash (str): Hash of the configuration the answer must have been produced with.
+            fingerprint (str): The current fingerprint of the collection.
+
+        Returns:
+            Optional[Tuple[ChatCompletion, Optional[QueryResult]]]: The completion, with zero token usage,
+                and the retrieved context, or None on a miss.
+        """
+        connection = self._open_connection()
+        rows = connection.execute(
+            queries.GET_ANSWER_EMBEDDINGS,
+            (config_hash, fingerprint, time.time() - self.ttl),
+        ).fetchall()
+        found = None
+        if rows:
+            stored = np.stack(
+                [np.frombuffer(blob, dtype=np.float32) for _, blob in rows]
+            )
+            query = np.asarray(embedding, dtype=np.float32)
+            similarities = (stored @ query) / np.maximum(
+                np.linalg.norm(stored, axis=1) * np.linalg.norm(query), 1e-12
+            )
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                answer_id = rows[best][0]
+                response, context = connection.execute(
+                    queries.GET_ANSWER, (answer_id,)
+                ).fetchone()
+                connection.execute(queries.UPDATE_ANSWER_HIT, (time.time(), answer_id))
+                connection.commit()
+                completion = ChatCompletion.model_validate_json(response)
+                # Serving a stored answer uses no tokens, so it must not count towards usage
+                completion.usage = CompletionUsage(
+                    prompt_tokens=0, completion_tokens=0, total_tokens=0
+                )
+                found = (
+                    completion,
+                    json.loads(context) if context is not None else None,
+                )
+        connection.close()
+        with self.lock:
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return found
+
+    def put(
+        self,
+        question: str,
+        embedding: List[float],
+        config_hash: str,
+        fingerprint: str,
+        response: ChatCompletion,
+        context: Optional[QueryResult],
+    ) -> None:
+        """
+        Store the answer to a question, evicting expired and stale answers and the least recently used beyond maxsize.
+
+        Args:
+            question (str): The question.
+            embedding (List[float]): The question embedding.
+            config_hash (str): Hash of the configuration the answer was produced with.
+            fingerprint (str): The fingerprint of the collection the context was retrieved from.
+            response (ChatCompletion): The completion.
+            context (QueryResult, optional): The retrieved context.
+        """
+        now = time.time()
+        connection = self._open_connection()
+        connection.execute(
+            queries.DELETE_STALE_ANSWERS, (now - self.ttl, config_hash, fingerprint)
+        )
+        connection.execute(
+            queries.INSERT_ANSWER,
+            (
+                config_hash,
+                fingerprint,
+                question,
+                np.asarray(embedding, dtype=np.float32).tobytes(),
+                response.model_dump_json(),
+                json.dumps(context) if context is not None else None,
+                now,
+                now,
+            ),
+        )
+        connection.execute(queries.DELETE_LEAST_RECENTLY_USED_ANSWERS, (self.maxsize,))
+        connection.commit()
+        connection.close()
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of hits and misses since the server started, the hit rate and the number of stored answers."""
+        connection = self._open_connection()
+        (size,) = connection.execute(queries.COUNT_ANSWERS).fetchone()
+        connection.close()
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": size,
+            }
+
+
+@cache_resource
+def load_answer_cache(
+    version_path: Path,
+    threshold: float = 0.95,
+    maxsize: int = 1000,
+    ttl: float = 604800,
+) -> SemanticAnswerCache:
+    """
+    Get the answer cache of a version.  Cached as a resource, so the hit and miss counts
+    are shared by every RAG built for the version.
+
+    Args:
+        version_path (Path): The version directory.
+        threshold (float, optional): The cosine similarity at which a stored question matches. Defaults to 0.95.
+        maxsize (int, optional): The number of answers kept. Defaults to 1000.
+        ttl (float, optional): Seconds before a stored answer expires. Defaults to one week.
+
+    Returns:
+        SemanticAnswerCache: The answer cache.
+    """
+    return SemanticAnswerCache(version_path, threshold, maxsize, ttl)
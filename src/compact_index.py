@@ -0,0 +1,196 @@
+"""
+Module for a compact, memory-mapped side-index of a collection's embeddings.
+
+The Chroma HNSW index keeps every float32 embedding in RAM in each process that queries the
+collection.  The compact index instead stores scalar-quantized copies of the embeddings
+(int8 with a per-dimension scale, or float16) in a memory-mapped file, which is scanned
+exhaustively for a first pass.  The best candidates are then re-scored exactly against the
+float32 embeddings, also memory-mapped, so only the candidate rows are paged in.
+
+Classes:
+    CompactIndexConfig: Typed dictionary for the compact index configuration.
+    CompactIndex: Quantized, memory-mapped embedding index with exact re-scoring.
+"""
+
+import json
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import List, Optional, Tuple, TypedDict
+
+import numpy as np
+from chromadb.api.models.Collection import Collection
+
+logger = logging.getLogger(__name__)
+
+DTYPES = {"int8": np.int8, "float16": np.float16}
+# Rows dequantized at a time while scanning, bounding the scan's working memory
+BLOCK_SIZE = 4096
+PAGE_SIZE = 1000
+
+
+class CompactIndexConfig(TypedDict, total=False):
+    dtype: str
+    rescore_candidates: int
+
+
+class CompactIndex:
+    """
+    Quantized, memory-mapped copy of a collection's embeddings with exact re-scoring.
+    Distances match Chroma's for the collection's hnsw:space.
+
+    Args:
+        directory (Path): The directory the index folder is stored in, normally the vdb folder.
+        dtype (str, optional): "int8" or "float16". Defaults to "int8".
+    """
+
+    folder = "compact_index"
+
+    def __init__(self, directory: Path, dtype: str = "int8") -> None:
+        assert dtype in DTYPES, f"dtype ({dtype}) must be one of {', '.join(DTYPES)}"
+        self.directory = directory / f"{self.folder}_{dtype}"
+        self.dtype = dtype
+        self.meta = None
+        self.ids: List[str] = []
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """The fingerprint of the collection the index was built from, or None if not built."""
+        meta_path = self.directory / "meta.json"
+        if not meta_path.is_file():
+            return None
+        with open(meta_path, "r") as file:
+            return json.load(file)["fingerprint"]
+
+    def build(self, collection: Collection, fingerprint: str) -> None:
+        """
+        Build the index from the embeddings stored in a collection.  Written to a temporary
+        folder and swapped in, so readers never see a partial index.
+
+        Args:
+            collection (Collection): The collection to index.
+            fingerprint (str): Identifies the collection contents, to detect a stale index.
+        """
+        n = collection.count()
+        logger.info(f"Building {self.dtype} compact index of {n} embeddings")
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        tmp_dir = self.directory.with_name(f"{self.directory.name}.{uuid.uuid4().hex}")
+        tmp_dir.mkdir(parents=True)
+
+        ids: List[str] = []
+        full = None
+        for offset in range(0, n, PAGE_SIZE):
+            page = collection.get(
+                include=["embeddings"], limit=PAGE_SIZE, offset=offset
+            )
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if space == "cosine":
+                embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+            if full is None:
+                full = np.lib.format.open_memmap(
+                    tmp_dir / "full.npy",
+                    mode="w+",
+                    dtype=np.float32,
+                    shape=(n, embeddings.shape[1]),
+                )
+            full[len(ids) : len(ids) + len(embeddings)] = embeddings
+            ids.extend(page["ids"])
+
+        if full is not None:
+            scale = np.abs(full).max(axis=0) / 127 if self.dtype == "int8" else None
+            codes = np.lib.format.open_memmap(
+                tmp_dir / "codes.npy",
+                mode="w+",
+                dtype=DTYPES[self.dtype],
+                shape=full.shape,
+            )
+            for i in range(0, n, BLOCK_SIZE):
+                block = full[i : i + BLOCK_SIZE]
+                if scale is not None:
+                    block = np.round(block / np.where(scale > 0, scale, 1))
+                codes[i : i + BLOCK_SIZE] = block
+            np.save(tmp_dir / "norms.npy", (full**2).sum(axis=1).astype(np.float32))
+            if scale is not None:
+                np.save(tmp_dir / "scale.npy", scale.astype(np.float32))
+            codes.flush()
+            full.flush()
+            del codes, full
+
+        with open(tmp_dir / "meta.json", "w") as file:
+            json.dump({"fingerprint": fingerprint, "space": space, "ids": ids}, file)
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        os.replace(tmp_dir, self.directory)
+
+    def load(self) -> "CompactIndex":
+        """Memory-map the index files.  Returns the index, for chaining."""
+        with open(self.directory / "meta.json", "r") as file:
+            self.meta = json.load(file)
+        self.ids = self.meta.pop("ids")
+        if self.ids:
+            self.codes = np.load(self.directory / "codes.npy", mmap_mode="r")
+            self.full = np.load(self.directory / "full.npy", mmap_mode="r")
+            self.norms = np.load(self.directory / "norms.npy")
+            scale_path = self.directory / "scale.npy"
+            self.scale = np.load(scale_path) if scale_path.is_file() else None
+        return self
+
+    def _distances(
+        self, dots: np.ndarray, norms: np.ndarray, query_norm: float
+    ) -> np.ndarray:
+        # Chroma distances: squared l2, 1 - cosine similarity, 1 - inner product
+        if self.meta["space"] == "l2":
+            return norms - 2 * dots + query_norm
+        return 1 - dots
+
+    def _first_pass(self, query: np.ndarray, n_candidates: int) -> np.ndarray:
+        """Scan the quantized embeddings, returning the rows of the approximate nearest candidates."""
+        weights = query * self.scale if self.scale is not None else query
+        approximate = np.empty(len(self.ids), dtype=np.float32)
+        for i in range(0, len(self.ids), BLOCK_SIZE):
+            block = self.codes[i : i + BLOCK_SIZE].astype(np.float32)
+            approximate[i : i + BLOCK_SIZE] = block @ weights
+        distances = self._distances(approximate, self.norms, 0.0)
+        if n_candidates >= len(distances):
+            return np.arange(len(distances))
+        return np.argpartition(distances, n_candidates)[:n_candidates]
+
+    def search(
+        self,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        rescore_candidates: Optional[int] = None,
+    ) -> Tuple[List[List[str]], List[List[float]]]:
+        """
+        Find the nearest chunks to each query embedding.
+
+        Args:
+            query_embeddings (np.ndarray): The query embeddings, one per row.
+            n_results (int): The number of results per query.
+            rescore_candidates (int, optional): First-pass candidates re-scored at full precision. Defaults to 5 * n_results.
+
+        Returns:
+            Tuple[List[List[str]], List[List[float]]]: The ids and distances of the results of each query, nearest first.
+        """
+        n_candidates = max(rescore_candidates or 5 * n_results, n_results)
+        all_ids, all_distances = [], []
+        for query in np.asarray(query_embeddings, dtype=np.float32):
+            if not self.ids:
+                all_ids.append([])
+                all_distances.append([])
+                continue
+            if self.meta["space"] == "cosine":
+                query = query / np.linalg.norm(query)
+            # Sorted rows read the full precision memmap sequentially
+            candidates = np.sort(self._first_pass(query, n_candidates))
+            distances = self._distances(
+                self.full[candidates] @ query,
+                self.norms[candidates],
+                float(query @ query),
+            )
+            order = np.argsort(distances)[:n_results]
+            all_ids.append([self.ids[i] for i in candidates[order]])
+            all_distances.append(distances[order].tolist())
+        return all_ids, all_distances
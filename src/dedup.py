@@ -0,0 +1,160 @@
+"""
+Module for detecting near-duplicate chunks at ingestion.
+
+Each chunk is fingerprinted with a 64-bit SimHash over word shingles, so chunks that differ
+by a few words have fingerprints a few bits apart.  Fingerprints are split into
+max_distance + 1 bands: two fingerprints within max_distance bits must agree exactly on at
+least one band, so candidates are found by band lookup instead of comparing every pair.
+
+Classes:
+    DedupConfig: Typed dictionary for the deduplication configuration.
+    SimHashIndex: Band index of chunk fingerprints for near-duplicate lookup.
+    DedupReport: Counts of the chunks removed as duplicates during an ingestion run.
+
+Functions:
+    simhash: Compute the 64-bit SimHash of a text.
+"""
+
+import hashlib
+import json
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+HASH_BITS = 64
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class DedupConfig(TypedDict, total=False):
+    max_distance: int
+    shingle_size: int
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """
+    Compute the 64-bit SimHash of a text from its word shingles, ignoring case and punctuation.
+
+    Args:
+        text (str): The text to fingerprint.
+        shingle_size (int, optional): The number of words per shingle. Defaults to 3.
+
+    Returns:
+        int: The fingerprint.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    shingles = [
+        " ".join(words[i : i + shingle_size])
+        for i in range(max(1, len(words) - shingle_size + 1))
+    ]
+    weights = [0] * HASH_BITS
+    for shingle in shingles:
+        h = int.from_bytes(
+            hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little"
+        )
+        for bit in range(HASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+class SimHashIndex:
+    """
+    Band index of chunk fingerprints.
+
+    Args:
+        max_distance (int, optional): Maximum number of differing bits for two chunks to be near-duplicates. Defaults to 3.
+    """
+
+    def __init__(self, max_distance: int = 3) -> None:
+        self.max_distance = max_distance
+        self.n_bands = max_distance + 1
+        self.band_bits = HASH_BITS // self.n_bands
+        self.buckets: Dict[Tuple[int, int], List[Tuple[str, int]]] = defaultdict(list)
+
+    def _bands(self, fingerprint: int) -> List[Tuple[int, int]]:
+        mask = (1 << self.band_bits) - 1
+        return [
+            (band, fingerprint >> (band * self.band_bits) & mask)
+            for band in range(self.n_bands)
+        ]
+
+    def add(self, chunk_id: str, fingerprint: int) -> None:
+        for key in self._bands(fingerprint):
+            self.buckets[key].append((chunk_id, fingerprint))
+
+    def find(self, fingerprint: int) -> Optional[Tuple[str, int]]:
+        """
+        Find the closest indexed chunk within max_distance bits of a fingerprint.
+
+        Args:
+            fingerprint (int): The fingerprint to look up.
+
+        Returns:
+            Optional[Tuple[str, int]]: The id of the closest chunk and its distance, or None if there is none.
+        """
+        best = None
+        for key in self._bands(fingerprint):
+            for chunk_id, other in self.buckets.get(key, []):
+                distance = (fingerprint ^ other).bit_count()
+                if distance <= self.max_distance and (
+                    best is None or distance < best[1]
+                ):
+                    best = (chunk_id, distance)
+        return best
+
+
+@dataclass
+class DedupReport:
+    """
+    Counts of the chunks removed as duplicates during an ingestion run.
+
+    Attributes:
+        chunks (int): Chunks checked.
+        exact (int): Chunks removed with an identical fingerprint to a kept chunk.
+        near (int): Chunks removed within max_distance bits of a kept chunk.
+        characters_removed (int): Total length of the removed chunks.
+        files (Dict[str, Dict[str, int]]): Chunks checked and removed per file.
+        canonical_counts (Counter): Number of duplicates collapsed into each kept chunk.
+    """
+
+    chunks: int = 0
+    exact: int = 0
+    near: int = 0
+    characters_removed: int = 0
+    files: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    canonical_counts: Counter = field(default_factory=Counter)
+
+    def record(
+        self, filename: str, text: str, duplicate: Optional[Tuple[str, int]]
+    ) -> None:
+        file_counts = self.files.setdefault(filename, {"chunks": 0, "duplicates": 0})
+        file_counts["chunks"] += 1
+        self.chunks += 1
+        if duplicate is None:
+            return
+        canonical_id, distance = duplicate
+        file_counts["duplicates"] += 1
+        self.canonical_counts[canonical_id] += 1
+        self.characters_removed += len(text)
+        if distance == 0:
+            self.exact += 1
+        else:
+            self.near += 1
+
+    def to_dict(self) -> Dict:
+        removed = self.exact + self.near
+        return {
+            "chunks": self.chunks,
+            "removed": removed,
+            "removed_fraction": round(removed / self.chunks, 4) if self.chunks else 0.0,
+            "exact": self.exact,
+            "near": self.near,
+            "characters_removed": self.characters_removed,
+            "files": self.files,
+            "most_duplicated": dict(self.canonical_counts.most_common(20)),
+        }
+
+    def save(self, path: Path) -> None:
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
@@ -0,0 +1,150 @@
+"""
+Module for caching embeddings on disk, shared between pipeline versions.
+
+Embeddings are content addressed: they are keyed by the embedding model name and the
+sha256 hash of the embedded text, so any version that embeds byte-identical text with the
+same model re-uses the stored vector instead of calling the embedding endpoint.
+
+Classes:
+    EmbeddingCache: SQLite store of embeddings keyed by (model, text hash).
+    CachedEmbeddingFunction: Chroma embedding function wrapper that reads and writes the cache.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+from src import queries
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_MAX_LOOKUP = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite store of embeddings keyed by (model, text hash).
+
+    Args:
+        directory (Path): The directory the cache database is stored in.
+    """
+
+    file_name = "embeddings.db"
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        connection = self._open_connection()
+        connection.execute(queries.CREATE_EMBEDDINGS_TABLE)
+        connection.commit()
+        connection.close()
+
+    def _open_connection(self):
+        return sqlite3.connect(self.directory / self.file_name, timeout=30)
+
+    def get_many(
+        self, model: str, hashes: List[str], max_age: Optional[float] = None
+    ) -> Dict[str, List[float]]:
+        """
+        Look up embeddings for the given text hashes.
+
+        Args:
+            model (str): The embedding model name.
+            hashes (List[str]): The text hashes to look up.
+            max_age (float, optional): Ignore entries older than this many seconds. Defaults to no limit.
+
+        Returns:
+            Dict[str, List[float]]: The embeddings found, keyed by text hash.
+        """
+        found = {}
+        oldest = time.time() - max_age if max_age is not None else None
+        connection = self._open_connection()
+        for i in range(0, len(hashes), _MAX_LOOKUP):
+            batch = hashes[i : i + _MAX_LOOKUP]
+            rows = connection.execute(
+                queries.GET_EMBEDDINGS.format(",".join("?" * len(batch))),
+                (model, *batch),
+            ).fetchall()
+            for h, blob, created_at in rows:
+                if oldest is None or created_at >= oldest:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+        connection.close()
+        return found
+
+    def put_many(self, model: str, embeddings: Dict[str, List[float]]) -> None:
+        """
+        Store embeddings keyed by text hash.
+
+        Args:
+            model (str): The embedding model name.
+            embeddings (Dict[str, List[float]]): The embeddings to store, keyed by text hash.
+        """
+        now = time.time()
+        connection = self._open_connection()
+        connection.executemany(
+            queries.INSERT_EMBEDDING,
+            [
+                (model, h, np.asarray(e, dtype=np.float32).tobytes(), now)
+                for h, e in embeddings.items()
+            ],
+        )
+        connection.commit()
+        connection.close()
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Wraps an embedding function so that only texts missing from the cache are embedded.
+
+    Args:
+        embedding_function (EmbeddingFunction): The embedding function to call on cache misses.
+        model_name (str): The embedding model name, used as part of the cache key.
+        cache (EmbeddingCache): The cache to read from and write to.
+    """
+
+    def __init__(
+        self,
+        embedding_function: EmbeddingFunction,
+        model_name: str,
+        cache: EmbeddingCache,
+    ) -> None:
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, input: Documents) -> Embeddings:
+        hashes = [text_hash(t) for t in input]
+        found = self.cache.get_many(self.model_name, list(set(hashes)))
+        missing = {h: t for h, t in zip(hashes, input) if h not in found}
+        n_missing = sum(h in missing for h in hashes)
+        self.hits += len(hashes) - n_missing
+        self.misses += n_missing
+        if missing:
+            new = dict(
+                zip(missing.keys(), self.embedding_function(list(missing.values())))
+            )
+            self.cache.put_many(self.model_name, new)
+            found.update(new)
+        return [list(found[h]) for h in hashes]
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of cache hits and misses, and the hit rate, since creation."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
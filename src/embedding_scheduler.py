@@ -0,0 +1,213 @@
+"""
+Module for embedding large numbers of texts within an endpoint's rate limits.
+
+Texts are packed into batches by token count, and the batches are sent concurrently while
+leaky-bucket limiters keep usage within the configured tokens-per-minute and
+requests-per-minute budget.  Throttled or failed requests are retried with exponential
+backoff, honouring the endpoint's retry-after header when present.
+
+Classes:
+    SchedulerConfig: Typed dictionary for the scheduler configuration.
+    RateLimitedEmbeddingFunction: Chroma embedding function that schedules embedding requests.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+from typing import List, Optional, TypedDict
+
+import openai
+import tiktoken
+from aiolimiter import AsyncLimiter
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+class SchedulerConfig(TypedDict, total=False):
+    tokens_per_minute: int
+    requests_per_minute: int
+    max_tokens_per_batch: int
+    max_texts_per_batch: int
+    max_concurrency: int
+    max_retries: int
+    endpoint: str
+
+
+def _encoding(model_name: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        # Deployment names need not match a known model, e.g. a local fake endpoint
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def pack_batches(
+    token_counts: List[int], max_tokens_per_batch: int, max_texts_per_batch: int
+) -> List[List[int]]:
+    """
+    Greedily pack texts, in order, into batches that stay under the token and text limits.
+    A single text over the token limit gets a batch of its own.
+
+    Args:
+        token_counts (List[int]): The token count of each text.
+        max_tokens_per_batch (int): Maximum total tokens per batch.
+        max_texts_per_batch (int): Maximum number of texts per batch.
+
+    Returns:
+        List[List[int]]: The indices of the texts in each batch.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, n_tokens in enumerate(token_counts):
+        if current and (
+            current_tokens + n_tokens > max_tokens_per_batch
+            or len(current) >= max_texts_per_batch
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class RateLimitedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Embeds texts through an Azure OpenAI deployment using token-packed, concurrent,
+    rate-limited requests.
+
+    Args:
+        model_name (str): The embedding deployment name.
+        api_version (str): The Azure OpenAI API version.
+        scheduler_config (SchedulerConfig): Rate limits and concurrency.  Set endpoint to
+            override AZURE_OPENAI_ENDPOINT, e.g. to point at a local fake endpoint.
+    """
+
+    def __init__(
+        self, model_name: str, api_version: str, scheduler_config: SchedulerConfig
+    ) -> None:
+        self.model_name = model_name
+        self.api_version = api_version
+        self.endpoint = scheduler_config.get(
+            "endpoint", os.getenv("AZURE_OPENAI_ENDPOINT")
+        )
+        self.tokens_per_minute = scheduler_config.get("tokens_per_minute", 240000)
+        self.max_tokens_per_batch = min(
+            scheduler_config.get("max_tokens_per_batch", 8000), self.tokens_per_minute
+        )
+        self.max_texts_per_batch = scheduler_config.get("max_texts_per_batch", 256)
+        self.max_concurrency = scheduler_config.get("max_concurrency", 8)
+        self.max_retries = scheduler_config.get("max_retries", 6)
+        self.token_limiter = AsyncLimiter(self.tokens_per_minute, 60)
+        self.request_limiter = AsyncLimiter(
+            scheduler_config.get("requests_per_minute", 1440), 60
+        )
+        self.encoding = _encoding(model_name)
+        self.retries = 0
+        # The client owns an HTTP connection pool bound to an event loop, so both are kept
+        # for the life of the instance rather than created on every call
+        self.loop = asyncio.new_event_loop()
+        self.lock = threading.Lock()
+        self.client: Optional[openai.AsyncAzureOpenAI] = None
+
+    def __call__(self, input: Documents) -> Embeddings:
+        with self.lock:
+            return self.loop.run_until_complete(self.aembed(list(input)))
+
+    async def aembed(self, texts: List[str]) -> Embeddings:
+        """
+        Embed texts concurrently within the configured rate limits.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            Embeddings: The embeddings, in the same order as the texts.
+        """
+        # Chunk text can contain special tokens such as <|endoftext|>, count them as text
+        token_counts = [
+            len(t) for t in self.encoding.encode_batch(texts, disallowed_special=())
+        ]
+        batches = pack_batches(
+            token_counts, self.max_tokens_per_batch, self.max_texts_per_batch
+        )
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.client is None:
+            self.client = openai.AsyncAzureOpenAI(
+                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                api_version=self.api_version,
+                azure_endpoint=self.endpoint,
+                max_retries=0,
+            )
+        results = await asyncio.gather(
+            *(
+                self._embed_batch(
+                    self.client,
+                    semaphore,
+                    [texts[i] for i in batch],
+                    sum(token_counts[i] for i in batch),
+                )
+                for batch in batches
+            )
+        )
+        embeddings: Embeddings = [None] * len(texts)  # type: ignore
+        for batch, batch_embeddings in zip(batches, results):
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+        return embeddings
+
+    async def _embed_batch(
+        self,
+        client: openai.AsyncAzureOpenAI,
+        semaphore: asyncio.Semaphore,
+        texts: List[str],
+        n_tokens: int,
+    ) -> Embeddings:
+        async with semaphore:
+            attempt = 0
+            while True:
+                await self.token_limiter.acquire(min(n_tokens, self.tokens_per_minute))
+                await self.request_limiter.acquire()
+                try:
+                    response = await client.embeddings.create(
+                        input=texts, model=self.model_name
+                    )
+                    return [
+                        d.embedding
+                        for d in sorted(response.data, key=lambda d: d.index)
+                    ]
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff_delay(attempt, e)
+                    logger.warning(
+                        f"Embedding request failed ({type(e).__name__}), retrying in {delay:.1f}s"
+                    )
+                    self.retries += 1
+                    attempt += 1
+                    await asyncio.sleep(delay)
+
+    @staticmethod
+    def _backoff_delay(attempt: int, error: Exception) -> float:
+        retry_after: Optional[str] = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(60.0, 2**attempt) + random.uniform(0, 1)
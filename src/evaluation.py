@@ -61,7 +61,7 @@ def update_q_dict(
 def load_all_evaluation_data(version_dir: Path):
     df = pd.DataFrame()
     for v in version_dir.glob("*"):
-        if v.is_dir():
+        if v.is_dir() and not v.name.startswith("."):
             eval_df = pd.read_csv(v / "evaluation.csv")
             eval_df["version"] = v.name
             df = pd.concat([df, eval_df])
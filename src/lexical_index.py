@@ -0,0 +1,258 @@
+"""
+Module for a BM25 lexical index over a VectorDB's chunks.
+
+Dense retrieval ranks exact terms (clause numbers, party names, defined terms) poorly.  The
+lexical index is an inverted index of the same chunk ids, stored in SQLite in the vdb
+folder and kept up to date at ingestion, and scored with Okapi BM25.  The Retriever
+fuses its ranking with the vector search ranking by reciprocal rank fusion.
+
+Classes:
+    HybridConfig: Typed dictionary for the hybrid retrieval configuration.
+    LexicalIndex: SQLite inverted index of chunk terms, searched with BM25.
+
+Functions:
+    tokenize: Split text into lowercase index terms.
+    reciprocal_rank_fusion: Fuse several rankings of ids.
+"""
+
+import logging
+import math
+import re
+import sqlite3
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, TypedDict
+
+from chromadb.api.models.Collection import Collection
+
+from src import queries
+
+logger = logging.getLogger(__name__)
+
+# Keeps clause numbers (12.3), dates and hyphenated terms whole; their parts are also indexed
+TOKEN_PATTERN = re.compile(r"\w+(?:[./-]\w+)*")
+SEPARATOR_PATTERN = re.compile(r"[./-]")
+STOPWORDS = frozenset(
+    "a an and are as at be been by can do does for from has have how if in into is it "
+    "its of on or our shall should that the their there these this those to was we "
+    "were what when where which who why will with would you your".split()
+)
+# SQLite limits the number of bound parameters per statement
+_MAX_LOOKUP = 500
+PAGE_SIZE = 1000
+
+
+class HybridConfig(TypedDict, total=False):
+    lexical_candidates: int
+    rrf_k: int
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase index terms, dropping common English stopwords.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        List[str]: The terms, in order, with the parts of compound terms after each compound.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        parts = SEPARATOR_PATTERN.split(token)
+        for term in [token, *parts] if len(parts) > 1 else [token]:
+            if term and term not in STOPWORDS:
+                terms.append(term)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[str]:
+    """
+    Fuse rankings by reciprocal rank: each id scores the sum of 1 / (k + rank) over the
+    rankings it appears in.
+
+    Args:
+        rankings (Iterable[List[str]]): The rankings, best first.
+        k (int, optional): Damps the weight of the top ranks. Defaults to 60.
+
+    Returns:
+        List[str]: The fused ranking, best first.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] += 1 / (k + rank)
+    return sorted(scores, key=lambda chunk_id: scores[chunk_id], reverse=True)
+
+
+class LexicalIndex:
+    """
+    SQLite inverted index of chunk terms, searched with Okapi BM25.
+
+    Args:
+        directory (Path): The directory the index database is stored in, normally the vdb folder.
+        k1 (float, optional): BM25 term frequency saturation. Defaults to 1.2.
+        b (float, optional): BM25 length normalisation. Defaults to 0.75.
+    """
+
+    file_name = "lexical_index.db"
+
+    def __init__(self, directory: Path, k1: float = 1.2, b: float = 0.75) -> None:
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.directory.mkdir(parents=True, exist_ok=True)
+        connection = self._open_connection()
+        connection.execute(queries.CREATE_LEXICAL_CHUNKS_TABLE)
+        connection.execute(queries.CREATE_LEXICAL_POSTINGS_TABLE)
+        connection.execute(queries.CREATE_LEXICAL_POSTINGS_CHUNK_INDEX)
+        connection.execute(queries.CREATE_LEXICAL_META_TABLE)
+        connection.commit()
+        connection.close()
+
+    def _open_connection(self):
+        return sqlite3.connect(self.directory / self.file_name, timeout=30)
+
+    def count(self) -> int:
+        """The number of indexed chunks."""
+        connection = self._open_connection()
+        n, _ = connection.execute(queries.GET_LEXICAL_STATS).fetchone()
+        connection.close()
+        return n
+
+    def ids(self) -> Set[str]:
+        """The ids of the indexed chunks."""
+        connection = self._open_connection()
+        rows = connection.execute(queries.GET_LEXICAL_CHUNK_IDS).fetchall()
+        connection.close()
+        return {chunk_id for (chunk_id,) in rows}
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """The fingerprint of the VectorDB the index was last checked against, or None if never checked."""
+        connection = self._open_connection()
+        row = connection.execute(queries.GET_LEXICAL_META, ("fingerprint",)).fetchone()
+        connection.close()
+        return row[0] if row else None
+
+    def set_fingerprint(self, fingerprint: str) -> None:
+        """Record that the index holds the same chunks as the VectorDB with this fingerprint."""
+        connection = self._open_connection()
+        connection.execute(queries.SET_LEXICAL_META, ("fingerprint", fingerprint))
+        connection.commit()
+        connection.close()
+
+    def _delete(self, connection, ids: List[str]) -> None:
+        for i in range(0, len(ids), _MAX_LOOKUP):
+            batch = ids[i : i + _MAX_LOOKUP]
+            placeholders = ",".join("?" * len(batch))
+            connection.execute(
+                queries.DELETE_LEXICAL_POSTINGS.format(placeholders), batch
+            )
+            connection.execute(
+                queries.DELETE_LEXICAL_CHUNKS.format(placeholders), batch
+            )
+
+    def add(self, ids: List[str], documents: List[str], shard: str = "") -> None:
+        """
+        Index chunks, replacing any already indexed with the same ids.
+
+        Args:
+            ids (List[str]): The chunk ids.
+            documents (List[str]): The chunk texts.
+            shard (str, optional): The shard the chunks are stored in. Defaults to unsharded.
+        """
+        connection = self._open_connection()
+        self._delete(connection, ids)
+        chunks, postings = [], []
+        for chunk_id, document in zip(ids, documents):
+            terms = Counter(tokenize(document))
+            chunks.append((chunk_id, shard, sum(terms.values())))
+            postings.extend((term, chunk_id, n) for term, n in terms.items())
+        connection.executemany(queries.INSERT_LEXICAL_CHUNK, chunks)
+        connection.executemany(queries.INSERT_LEXICAL_POSTING, postings)
+        connection.commit()
+        connection.close()
+
+    def delete(self, ids: List[str]) -> None:
+        """Remove chunks from the index."""
+        connection = self._open_connection()
+        self._delete(connection, ids)
+        connection.commit()
+        connection.close()
+
+    def rebuild(self, collections: Dict[str, Collection]) -> None:
+        """
+        Re-index every chunk of the given collections, e.g. for a VectorDB vectorised before the index was enabled.
+
+        Args:
+            collections (Dict[str, Collection]): The collections, keyed by shard.
+        """
+        logger.info("Rebuilding lexical index")
+        connection = self._open_connection()
+        connection.execute(queries.CLEAR_LEXICAL_POSTINGS)
+        connection.execute(queries.CLEAR_LEXICAL_CHUNKS)
+        connection.commit()
+        connection.close()
+        for shard, collection in collections.items():
+            for offset in range(0, collection.count(), PAGE_SIZE):
+                page = collection.get(
+                    include=["documents"], limit=PAGE_SIZE, offset=offset
+                )
+                self.add(page["ids"], page["documents"], shard)
+
+    def search(
+        self, text: str, n_results: int, shards: Optional[List[str]] = None
+    ) -> List[Tuple[str, str, float]]:
+        """
+        Find the chunks with the highest BM25 score for a query.
+
+        Args:
+            text (str): The query text.
+            n_results (int): The number of results.
+            shards (List[str], optional): Only return chunks from these shards. Defaults to all.
+
+        Returns:
+            List[Tuple[str, str, float]]: The id, shard and score of each result, best first.
+        """
+        terms = list(dict.fromkeys(tokenize(text)))
+        if not terms:
+            return []
+        connection = self._open_connection()
+        n, average_length = connection.execute(queries.GET_LEXICAL_STATS).fetchone()
+        rows = []
+        for i in range(0, len(terms), _MAX_LOOKUP):
+            batch = terms[i : i + _MAX_LOOKUP]
+            rows.extend(
+                connection.execute(
+                    queries.GET_LEXICAL_POSTINGS.format(",".join("?" * len(batch))),
+                    batch,
+                ).fetchall()
+            )
+        connection.close()
+        if not rows:
+            return []
+
+        document_frequency = Counter(term for term, *_ in rows)
+        scores: Dict[str, float] = defaultdict(float)
+        chunk_shards: Dict[str, str] = {}
+        for term, chunk_id, frequency, length, shard in rows:
+            if shards is not None and shard not in shards:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            scores[chunk_id] += (
+                idf
+                * frequency
+                * (self.k1 + 1)
+                / (
+                    frequency
+                    + self.k1 * (1 - self.b + self.b * length / (average_length or 1))
+                )
+            )
+            chunk_shards[chunk_id] = shard
+        best = sorted(scores, key=lambda chunk_id: scores[chunk_id], reverse=True)
+        return [
+            (chunk_id, chunk_shards[chunk_id], scores[chunk_id])
+            for chunk_id in best[:n_results]
+        ]
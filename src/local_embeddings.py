@@ -0,0 +1,56 @@
+"""
+Module for embedding texts with a local sentence-transformers bi-encoder.
+
+Runs the embedding model in-process (batched, on CPU by default) instead of calling the
+Azure OpenAI endpoint, so query embedding needs no network round trip and ingestion can
+run offline.  Model weights are downloaded once into MODEL_CACHE.
+
+Classes:
+    LocalEmbeddingFunction: Chroma embedding function backed by a sentence-transformers model.
+"""
+
+import os
+from typing import Optional
+
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from sentence_transformers import SentenceTransformer
+
+from src.util import cache_resource
+
+
+@cache_resource
+def _load_model(
+    model_name: str, device: str, cache_folder: Optional[str]
+) -> SentenceTransformer:
+    return SentenceTransformer(model_name, device=device, cache_folder=cache_folder)
+
+
+class LocalEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Embeds texts with a sentence-transformers model loaded in this process.
+
+    Args:
+        model_name (str): The sentence-transformers model name, e.g. sentence-transformers/all-MiniLM-L6-v2.
+        batch_size (int, optional): Texts encoded per forward pass. Defaults to 32.
+        device (str, optional): The torch device. Defaults to "cpu".
+        normalize_embeddings (bool, optional): Scale embeddings to unit length. Defaults to True.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 32,
+        device: str = "cpu",
+        normalize_embeddings: bool = True,
+    ) -> None:
+        self.model = _load_model(model_name, device, os.getenv("MODEL_CACHE"))
+        self.batch_size = batch_size
+        self.normalize_embeddings = normalize_embeddings
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.model.encode(
+            list(input),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize_embeddings,
+        ).tolist()
@@ -0,0 +1,308 @@
+"""
+Module for tracking which files have been ingested into a vector database collection.
+
+The manifest records, for every ingested file, the hash of its content, the hash of the
+partition/chunking configuration that produced its chunks and the ids of those chunks.
+This allows re-vectorisation to only process new or changed files and to remove the
+chunks of files that no longer exist.  When chunks are deduplicated, each file also records
+which of its chunks were collapsed into which kept chunk, so that removing or changing the
+file owning a kept chunk re-processes the files that depended on it.
+
+The checkpoint records the chunk batches already committed for files that are still being
+ingested, so an interrupted run resumes from the last committed batch instead of
+re-embedding those files from the start.  Batches are appended to a log, so recording one
+costs the same however many batches of the file came before it.
+
+Classes:
+    FileRecord: Typed dictionary for the manifest entry of a single file.
+    CheckpointRecord: Typed dictionary for the checkpoint entry of a partially ingested file.
+    SyncPlan: The files to add and remove to bring a collection up to date.
+    IngestionManifest: Persistent manifest stored alongside the vector database.
+    IngestionCheckpoint: Persistent record of committed batches of partially ingested files.
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, TypedDict
+
+from typing_extensions import NotRequired
+
+from src.util import file_hash
+
+logger = logging.getLogger(__name__)
+
+
+class FileRecord(TypedDict):
+    file_hash: str
+    config_hash: str
+    ids: List[str]
+    duplicate_of: NotRequired[Dict[str, str]]
+    shard: NotRequired[str]
+
+
+class CheckpointRecord(TypedDict):
+    file_hash: str
+    config_hash: str
+    committed: List[str]
+
+
+@dataclass
+class SyncPlan:
+    """
+    Attributes:
+        to_add (List[Path]): Files that are new or whose content or config has changed.
+        to_remove (List[str]): Names of tracked files that have changed or no longer exist, whose chunks must be deleted.
+        unchanged (List[str]): Names of tracked files that can be left as they are.
+    """
+
+    to_add: List[Path] = field(default_factory=list)
+    to_remove: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+
+class IngestionManifest:
+    """
+    Persistent record of the files ingested into a collection.
+
+    Args:
+        directory (Path): The directory the manifest is stored in, normally the vdb folder.
+    """
+
+    file_name = "manifest.json"
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.records: Dict[str, FileRecord] = self._load()
+
+    @property
+    def storage_path(self) -> Path:
+        return self.directory / self.file_name
+
+    def _load(self) -> Dict[str, FileRecord]:
+        if not self.storage_path.is_file():
+            return {}
+        with open(self.storage_path, "r") as file:
+            return json.load(file)
+
+    def save(self) -> None:
+        """Write the manifest atomically, so an interrupted run never leaves a partial file."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.storage_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(self.records, file, indent=2)
+        os.replace(tmp_path, self.storage_path)
+
+    @property
+    def tracked_ids(self) -> List[str]:
+        return [i for record in self.records.values() for i in record["ids"]]
+
+    def record(
+        self,
+        name: str,
+        content_hash: str,
+        config_hash: str,
+        ids: List[str],
+        duplicate_of: Optional[Dict[str, str]] = None,
+        shard: Optional[str] = None,
+    ) -> None:
+        self.records[name] = {
+            "file_hash": content_hash,
+            "config_hash": config_hash,
+            "ids": ids,
+        }
+        if duplicate_of:
+            self.records[name]["duplicate_of"] = duplicate_of
+        if shard:
+            self.records[name]["shard"] = shard
+
+    def remove(self, name: str) -> List[str]:
+        """Remove a file from the manifest, returning the ids of its chunks."""
+        return self.records.pop(name)["ids"]
+
+    def plan(self, paths: List[Path], config_hash: str) -> SyncPlan:
+        """
+        Compare the given files against the manifest.  Unchanged files with chunks collapsed
+        into chunks of a file being removed are re-processed too.
+
+        Args:
+            paths (List[Path]): All files that should be in the collection.
+            config_hash (str): Hash of the configuration the chunks should be produced with.
+
+        Returns:
+            SyncPlan: The files to add, remove and leave unchanged.
+        """
+        plan = SyncPlan()
+        names = {p.name for p in paths}
+        for path in paths:
+            record = self.records.get(path.name)
+            if (
+                record
+                and record["config_hash"] == config_hash
+                and record["file_hash"] == file_hash(path)
+            ):
+                plan.unchanged.append(path.name)
+                continue
+            if record:
+                plan.to_remove.append(path.name)
+            plan.to_add.append(path)
+        plan.to_remove.extend(n for n in self.records if n not in names)
+
+        paths_by_name = {p.name: p for p in paths}
+        dependents = True
+        while dependents:
+            removed_ids = {
+                i for name in plan.to_remove for i in self.records[name]["ids"]
+            }
+            dependents = [
+                name
+                for name in plan.unchanged
+                if removed_ids.intersection(
+                    self.records[name].get("duplicate_of", {}).values()
+                )
+            ]
+            for name in dependents:
+                logger.info(
+                    f"Re-processing {name}, its duplicate chunks' kept copies are being removed"
+                )
+                plan.unchanged.remove(name)
+                plan.to_remove.append(name)
+                plan.to_add.append(paths_by_name[name])
+        return plan
+
+
+class IngestionCheckpoint:
+    """
+    Persistent record of the chunk batches committed to a collection for files whose
+    ingestion has not finished.  Each batch is appended to a JSON lines log; the log is
+    compacted when a file is complete and its entry removed.
+
+    Args:
+        directory (Path): The directory the checkpoint is stored in, normally the vdb folder.
+    """
+
+    file_name = "checkpoint.jsonl"
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.records: Dict[str, CheckpointRecord] = self._load()
+
+    @property
+    def storage_path(self) -> Path:
+        return self.directory / self.file_name
+
+    def _load(self) -> Dict[str, CheckpointRecord]:
+        records: Dict[str, CheckpointRecord] = {}
+        if not self.storage_path.is_file():
+            return records
+        with open(self.storage_path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line of an interrupted run may be incomplete, its batch
+                    # was not recorded as committed
+                    continue
+                self._add(
+                    records,
+                    entry["name"],
+                    entry["file_hash"],
+                    entry["config_hash"],
+                    entry["ids"],
+                )
+        return records
+
+    @staticmethod
+    def _add(
+        records: Dict[str, CheckpointRecord],
+        name: str,
+        content_hash: str,
+        config_hash: str,
+        ids: List[str],
+    ) -> None:
+        record = records.get(name)
+        if (
+            not record
+            or record["file_hash"] != content_hash
+            or record["config_hash"] != config_hash
+        ):
+            record = records[name] = {
+                "file_hash": content_hash,
+                "config_hash": config_hash,
+                "committed": [],
+            }
+        record["committed"].extend(ids)
+
+    def _append(
+        self, name: str, content_hash: str, config_hash: str, ids: List[str]
+    ) -> None:
+        with open(self.storage_path, "a") as file:
+            file.write(
+                json.dumps(
+                    {
+                        "name": name,
+                        "file_hash": content_hash,
+                        "config_hash": config_hash,
+                        "ids": ids,
+                    }
+                )
+                + "\n"
+            )
+
+    def save(self) -> None:
+        """Rewrite the log atomically with one line per file, removing it once no file is in progress."""
+        if not self.records:
+            self.storage_path.unlink(missing_ok=True)
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.storage_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            for name, record in self.records.items():
+                file.write(
+                    json.dumps(
+                        {
+                            "name": name,
+                            "file_hash": record["file_hash"],
+                            "config_hash": record["config_hash"],
+                            "ids": record["committed"],
+                        }
+                    )
+                    + "\n"
+                )
+        os.replace(tmp_path, self.storage_path)
+
+    def committed_ids(self, name: str, content_hash: str, config_hash: str) -> Set[str]:
+        """
+        The ids already committed for a file, if they were produced from the same content and config.
+
+        Args:
+            name (str): The file name.
+            content_hash (str): Hash of the file's current content.
+            config_hash (str): Hash of the current partition/chunking config.
+
+        Returns:
+            Set[str]: The committed chunk ids, empty if the file has no matching checkpoint.
+        """
+        record = self.records.get(name)
+        if (
+            record
+            and record["file_hash"] == content_hash
+            and record["config_hash"] == config_hash
+        ):
+            return set(record["committed"])
+        return set()
+
+    def commit(
+        self, name: str, content_hash: str, config_hash: str, ids: List[str]
+    ) -> None:
+        """Record a batch of ids as committed to the collection, appending it to the log."""
+        self._add(self.records, name, content_hash, config_hash, ids)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._append(name, content_hash, config_hash, ids)
+
+    def complete(self, name: str) -> None:
+        """Drop a file's entry once it is recorded in the manifest."""
+        if self.records.pop(name, None) is not None:
+            self.save()
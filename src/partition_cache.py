@@ -0,0 +1,76 @@
+"""
+Module for caching partitioned PDF elements on disk, shared between pipeline versions.
+
+Partitioning (particularly with the hi_res strategy) is the most expensive ingestion step,
+but its output only depends on the file content, the partition configuration and the
+unstructured version.  Elements are serialised to JSON keyed by those, so versions that
+only change the chunking configuration re-chunk from cached elements.
+
+Classes:
+    PartitionCache: Directory of serialised element lists keyed by file and partition config.
+"""
+
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from unstructured.__version__ import __version__ as unstructured_version
+from unstructured.documents.elements import Element
+from unstructured.staging.base import elements_from_json, elements_to_json
+
+from src.util import config_hash, file_hash
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionCache:
+    """
+    Directory of serialised element lists keyed by (file content hash, partition config).
+
+    Args:
+        directory (Path): The directory the serialised elements are stored in.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _key_path(self, filepath: Path, partition_config: Dict) -> Path:
+        key = config_hash(file_hash(filepath), partition_config, unstructured_version)
+        return self.directory / f"{key}.json"
+
+    def get(self, filepath: Path, partition_config: Dict) -> Optional[List[Element]]:
+        """
+        Load the cached elements for a file, if present.
+
+        Args:
+            filepath (Path): The path to the PDF file.
+            partition_config (Dict): The partition configuration.
+
+        Returns:
+            Optional[List[Element]]: The cached elements, or None on a cache miss.
+        """
+        path = self._key_path(filepath, partition_config)
+        if not path.is_file():
+            return None
+        logger.info(f"Loading cached partitions for {filepath.name}")
+        return elements_from_json(filename=str(path))
+
+    def put(
+        self, filepath: Path, partition_config: Dict, elements: List[Element]
+    ) -> None:
+        """
+        Store the elements for a file.  Written atomically, as several ingestion workers
+        may share the cache.
+
+        Args:
+            filepath (Path): The path to the PDF file.
+            partition_config (Dict): The partition configuration.
+            elements (List[Element]): The partitioned elements.
+        """
+        path = self._key_path(filepath, partition_config)
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        elements_to_json(elements, filename=str(tmp_path))
+        os.replace(tmp_path, path)
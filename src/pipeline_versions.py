@@ -20,7 +20,13 @@ class VersionManager:
 
     @property
     def app_versions(self):
-        return sorted([d.name for d in self.version_directory.glob("*") if d.is_dir()])
+        return sorted(
+            [
+                d.name
+                for d in self.version_directory.glob("*")
+                if d.is_dir() and not d.name.startswith(".")
+            ]
+        )
 
     @property
     def storage_file_exists(self):
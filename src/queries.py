@@ -39,3 +39,81 @@ FROM Messages AS mh
 WHERE up.UserId = ?
 AND mh.ExperimentId = ?
 """
+
+CREATE_EMBEDDINGS_TABLE = """
+CREATE TABLE IF NOT EXISTS Embeddings(
+    Model TEXT NOT NULL,
+    TextHash TEXT NOT NULL,
+    Embedding BLOB NOT NULL,
+    CreatedAt REAL NOT NULL,
+    PRIMARY KEY (Model, TextHash)
+)
+"""
+GET_EMBEDDINGS = "SELECT TextHash, Embedding, CreatedAt FROM Embeddings WHERE Model = ? AND TextHash IN ({})"
+INSERT_EMBEDDING = "INSERT OR REPLACE INTO Embeddings(Model, TextHash, Embedding, CreatedAt) VALUES (?, ?, ?, ?)"
+
+CREATE_LEXICAL_CHUNKS_TABLE = """
+CREATE TABLE IF NOT EXISTS LexicalChunks(
+    ChunkId TEXT PRIMARY KEY,
+    Shard TEXT NOT NULL,
+    Length INTEGER NOT NULL
+)
+"""
+CREATE_LEXICAL_POSTINGS_TABLE = """
+CREATE TABLE IF NOT EXISTS LexicalPostings(
+    Term TEXT NOT NULL,
+    ChunkId TEXT NOT NULL,
+    Frequency INTEGER NOT NULL,
+    PRIMARY KEY (Term, ChunkId)
+) WITHOUT ROWID
+"""
+CREATE_LEXICAL_POSTINGS_CHUNK_INDEX = (
+    "CREATE INDEX IF NOT EXISTS LexicalPostingsChunk ON LexicalPostings(ChunkId)"
+)
+INSERT_LEXICAL_CHUNK = (
+    "INSERT OR REPLACE INTO LexicalChunks(ChunkId, Shard, Length) VALUES (?, ?, ?)"
+)
+INSERT_LEXICAL_POSTING = (
+    "INSERT INTO LexicalPostings(Term, ChunkId, Frequency) VALUES (?, ?, ?)"
+)
+DELETE_LEXICAL_CHUNKS = "DELETE FROM LexicalChunks WHERE ChunkId IN ({})"
+DELETE_LEXICAL_POSTINGS = "DELETE FROM LexicalPostings WHERE ChunkId IN ({})"
+CLEAR_LEXICAL_CHUNKS = "DELETE FROM LexicalChunks"
+CLEAR_LEXICAL_POSTINGS = "DELETE FROM LexicalPostings"
+GET_LEXICAL_STATS = "SELECT COUNT(*), AVG(Length) FROM LexicalChunks"
+GET_LEXICAL_CHUNK_IDS = "SELECT ChunkId FROM LexicalChunks"
+CREATE_LEXICAL_META_TABLE = (
+    "CREATE TABLE IF NOT EXISTS LexicalMeta(Key TEXT PRIMARY KEY, Value TEXT NOT NULL)"
+)
+GET_LEXICAL_META = "SELECT Value FROM LexicalMeta WHERE Key = ?"
+SET_LEXICAL_META = "INSERT OR REPLACE INTO LexicalMeta(Key, Value) VALUES (?, ?)"
+GET_LEXICAL_POSTINGS = """
+SELECT p.Term, p.ChunkId, p.Frequency, c.Length, c.Shard
+FROM LexicalPostings AS p
+    JOIN LexicalChunks AS c ON p.ChunkId = c.ChunkId
+WHERE p.Term IN ({})
+"""
+
+CREATE_ANSWERS_TABLE = """
+CREATE TABLE IF NOT EXISTS Answers(
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    ConfigHash TEXT NOT NULL,
+    Fingerprint TEXT NOT NULL,
+    Question TEXT NOT NULL,
+    Embedding BLOB NOT NULL,
+    Response TEXT NOT NULL,
+    Context TEXT,
+    CreatedAt REAL NOT NULL,
+    LastUsedAt REAL NOT NULL,
+    Hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+GET_ANSWER_EMBEDDINGS = "SELECT ID, Embedding FROM Answers WHERE ConfigHash = ? AND Fingerprint = ? AND CreatedAt >= ?"
+GET_ANSWER = "SELECT Response, Context FROM Answers WHERE ID = ?"
+UPDATE_ANSWER_HIT = "UPDATE Answers SET LastUsedAt = ?, Hits = Hits + 1 WHERE ID = ?"
+INSERT_ANSWER = "INSERT INTO Answers(ConfigHash, Fingerprint, Question, Embedding, Response, Context, CreatedAt, LastUsedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+DELETE_STALE_ANSWERS = (
+    "DELETE FROM Answers WHERE CreatedAt < ? OR ConfigHash != ? OR Fingerprint != ?"
+)
+DELETE_LEAST_RECENTLY_USED_ANSWERS = "DELETE FROM Answers WHERE ID NOT IN (SELECT ID FROM Answers ORDER BY LastUsedAt DESC LIMIT ?)"
+COUNT_ANSWERS = "SELECT COUNT(*) FROM Answers"
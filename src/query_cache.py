@@ -0,0 +1,216 @@
+"""
+Module for caching query embeddings and retrieval results in process.
+
+Questions are often asked verbatim more than once (e.g. the canned prompts on the chat
+page), and each one would otherwise be re-embedded by the embedding endpoint.  Query
+embeddings are kept in a size-bounded LRU cache whose entries expire after a time to live,
+keyed by the embedding model and the normalised query text.  With persist set, misses fall
+through to the shared on-disk EmbeddingCache, so embeddings survive app restarts.
+
+Retrieval results (after re-ranking) are cached the same way, keyed by the version, the
+normalised query, the Where clause and the retrieval configuration.  Each entry records the
+fingerprint of the collection it was retrieved from and is discarded once the collection
+changes.
+
+Classes:
+    QueryCacheConfig: Typed dictionary for the query embedding cache configuration.
+    ResultCacheConfig: Typed dictionary for the retrieval result cache configuration.
+    QueryEmbeddingCache: LRU + TTL cache of query embeddings with hit-rate counters.
+    QueryResultCache: LRU + TTL cache of retrieval results, invalidated when the collection changes.
+"""
+
+import copy
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+from cachetools import TTLCache
+from chromadb.api.types import EmbeddingFunction, Embeddings, QueryResult, Where
+
+from src.embedding_cache import EmbeddingCache, text_hash
+from src.util import normalise_query
+
+
+class QueryCacheConfig(TypedDict, total=False):
+    maxsize: int
+    ttl: float
+    persist: bool
+
+
+class ResultCacheConfig(TypedDict, total=False):
+    maxsize: int
+    ttl: float
+
+
+class QueryEmbeddingCache:
+    """
+    LRU + TTL cache of query embeddings for one embedding model.
+
+    Args:
+        model_name (str): The embedding model name, used as part of the cache key.
+        maxsize (int, optional): The number of embeddings kept in memory, least recently used evicted first. Defaults to 1024.
+        ttl (float, optional): Seconds before a cached embedding expires. Defaults to one day.
+        disk (EmbeddingCache, optional): On-disk cache consulted on in-memory misses. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        maxsize: int = 1024,
+        ttl: float = 86400,
+        disk: Optional[EmbeddingCache] = None,
+    ) -> None:
+        self.model_name = model_name
+        self.ttl = ttl
+        self.disk = disk
+        self.cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # TTLCache is not thread safe, and the app serves sessions from several threads
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def embed(
+        self, texts: List[str], embedding_function: EmbeddingFunction
+    ) -> Embeddings:
+        """
+        Embed query texts, calling the embedding function only for those not cached.
+        Texts are looked up by their normalised form and the original text is embedded on a
+        miss.  Texts that only differ in case, whitespace or HTML markup share the embedding
+        of whichever was embedded first, which may differ slightly from that of the other.
+
+        Args:
+            texts (List[str]): The query texts.
+            embedding_function (EmbeddingFunction): The embedding function to call on cache misses.
+
+        Returns:
+            Embeddings: One embedding per text.
+        """
+        keys = [text_hash(normalise_query(t)) for t in texts]
+        found: Dict[str, List[float]] = {}
+        with self.lock:
+            for key in keys:
+                if key in self.cache:
+                    found[key] = self.cache[key]
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        from_disk: Dict[str, List[float]] = {}
+        if missing and self.disk is not None:
+            from_disk = self.disk.get_many(self.model_name, missing, max_age=self.ttl)
+            missing = [key for key in missing if key not in from_disk]
+        new: Dict[str, List[float]] = {}
+        if missing:
+            to_embed: Dict[str, str] = {}
+            for key, text in zip(keys, texts):
+                if key in missing:
+                    to_embed.setdefault(key, text)
+            new = dict(
+                zip(to_embed.keys(), embedding_function(list(to_embed.values())))
+            )
+            if self.disk is not None:
+                self.disk.put_many(self.model_name, new)
+        with self.lock:
+            for key, embedding in {**from_disk, **new}.items():
+                self.cache[key] = list(embedding)
+            for key in keys:
+                if key in new:
+                    self.misses += 1
+                elif key in from_disk:
+                    self.disk_hits += 1
+                else:
+                    self.hits += 1
+        found.update(from_disk)
+        found.update(new)
+        return [list(found[key]) for key in keys]
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of in-memory hits, on-disk hits and misses, the hit rate and the number of cached embeddings."""
+        with self.lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+                "size": len(self.cache),
+            }
+
+
+class QueryResultCache:
+    """
+    LRU + TTL cache of retrieval results.  Results are copied in and out, as callers modify them.
+
+    Args:
+        maxsize (int, optional): The number of results kept, least recently used evicted first. Defaults to 256.
+        ttl (float, optional): Seconds before a cached result expires. Defaults to one hour.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600) -> None:
+        self.cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def key(
+        version: str, text: str, where: Optional[Where], config_hash: str
+    ) -> Tuple[str, str, str, str]:
+        """
+        Build the cache key of a query.
+
+        Args:
+            version (str): Identifies the pipeline version, e.g. its path.
+            text (str): The query text, normalised here.
+            where (Where, optional): The Where clause of the query.
+            config_hash (str): Hash of the query and retrieval configuration.
+
+        Returns:
+            Tuple[str, str, str, str]: The key.
+        """
+        return (
+            version,
+            normalise_query(text),
+            json.dumps(where, sort_keys=True, default=str),
+            config_hash,
+        )
+
+    def get(self, key: Tuple[str, ...], fingerprint: str) -> Optional[QueryResult]:
+        """
+        Look up the result of a query.
+
+        Args:
+            key (Tuple[str, ...]): The cache key, from QueryResultCache.key.
+            fingerprint (str): The current fingerprint of the collection.
+
+        Returns:
+            Optional[QueryResult]: A copy of the cached result, or None if missing, expired or retrieved from an older collection.
+        """
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] != fingerprint:
+                del self.cache[key]
+                self.invalidated += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, key: Tuple[str, ...], fingerprint: str, result: QueryResult) -> None:
+        """Store a copy of the result of a query, retrieved from the collection with the given fingerprint."""
+        entry: Tuple[str, Any] = (fingerprint, copy.deepcopy(result))
+        with self.lock:
+            self.cache[key] = entry
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of hits, misses and entries invalidated by a collection change, the hit rate and the number of cached results."""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidated": self.invalidated,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.cache),
+            }
@@ -18,17 +18,24 @@ Note:
     - This module requires `chromadb`, `openai`, `src.messages`, and `src.retriever` modules to be imported.
 """
 
+import copy
 import logging
 import math
 from typing import Dict, Optional
 
-from chromadb.api.types import Where
+from chromadb.api.types import QueryResult, Where
 from openai import AzureOpenAI
 
+from src.answer_cache import AnswerCacheConfig, load_answer_cache
 from src.model_params import model_params
 from src.messages import MessageHistory, RAGMessage
 from src.retriever import Retriever
-from src.util import cache_resource, check_within_token_limit, estimate_token_count
+from src.util import (
+    cache_resource,
+    check_within_token_limit,
+    config_hash,
+    estimate_token_count,
+)
 
 logger = logging.getLogger("__main__")
 logger.addHandler(logging.StreamHandler())
@@ -100,6 +107,7 @@ class RAG:
     model (str): The name of the model to be used.
     system_prompt_template (str): The system prompt template for generating responses.
     model_settings (Dict[str, str]): Additional settings for the model.
+    answer_cache (SemanticAnswerCache): The semantic answer cache, if configured.
 
     Methods:
     __init__: Initializes the RAG model with the specified parameters.
@@ -115,6 +123,7 @@ class RAG:
         model: str,
         system_prompt_template: str,
         model_settings: Dict[str, str],
+        answer_cache: Optional[AnswerCacheConfig] = None,
     ) -> None:
         """
         Initializes the RAG model with the specified parameters.
@@ -126,6 +135,7 @@ class RAG:
         model (str): The name of the model to be used.
         system_prompt_template (str): The system prompt template for generating responses.
         model_settings (Dict[str, str]): Additional settings for the model.
+        answer_cache (Optional[AnswerCacheConfig]): Answer first-turn questions similar to earlier ones from a cache. Defaults to None.
         """
 
         self.client = _create_client(client_config)
@@ -134,6 +144,15 @@ class RAG:
         self.model_settings = model_settings
         self.system_prompt_template = system_prompt_template
         self.message_manager = message_manager
+        self.answer_cache = (
+            load_answer_cache(retriever.vdb.path, **answer_cache)
+            if answer_cache is not None
+            else None
+        )
+        # Cached answers are only valid for the settings that produced them
+        self.config_hash = config_hash(
+            model, system_prompt_template, model_settings, retriever.config_hash
+        )
 
     def _create_context_message(self, retrieved_chunks):
         """
@@ -163,6 +182,7 @@ class RAG:
         file_content: Optional[str] = None,
         where: Optional[Where] = None,
         with_retrieval: bool = False,
+        retrieved_chunks: Optional[QueryResult] = None,
     ):
         """
         Performs a query using the RAG model with optional retrieval and system prompt generation.
@@ -171,16 +191,50 @@ class RAG:
         prompt (str): The user prompt for the query.
         where (Optional[Where]): The optional 'where' condition for retrieval.
         with_retrieval (bool): Flag indicating whether retrieval should be performed.
+        retrieved_chunks (Optional[QueryResult]): Chunks already retrieved for the prompt, e.g. by Retriever.query_many.  Implies retrieval, without querying the retriever.
 
         Returns:
         Tuple: A tuple containing the response from the RAG model and the retrieved chunks (if retrieval was performed).
         """
         assert self.message_manager.instance, "No instance"
 
+        prefetched_chunks = retrieved_chunks
         use_retrieval = (
-            len(self.message_manager.instance.messages) == 0 or with_retrieval
+            len(self.message_manager.instance.messages) == 0
+            or with_retrieval
+            or prefetched_chunks is not None
         )
-        retrieved_chunks = None
+
+        # First-turn questions without a file or filter may be answered from the answer cache
+        use_answer_cache = (
+            self.answer_cache is not None
+            and len(self.message_manager.instance.messages) == 0
+            and not file_content
+            and where is None
+            and prefetched_chunks is None
+        )
+        question_embedding = None
+        if use_answer_cache:
+            question_embedding = self.retriver.embed_query(prompt)
+            fingerprint = self.retriver.vdb.fingerprint
+            cached = self.answer_cache.get(
+                question_embedding, self.config_hash, fingerprint
+            )
+            if cached is not None:
+                response, retrieved_chunks = cached
+                self.message_manager.log_message(
+                    RAGMessage(
+                        role="system",
+                        content=self._create_context_message(retrieved_chunks),
+                    )
+                )
+                self.message_manager.log_message(
+                    RAGMessage(role="user", content=prompt)
+                )
+                self.message_manager.log_message(
+                    MessageHistory.completion_to_message(response, retrieved_chunks)
+                )
+                return response, retrieved_chunks
 
         if file_content:
             n_chunks = math.ceil(
@@ -197,6 +251,9 @@ class RAG:
                 ]
                 responses = []
                 all_retrieved_chunks = None
+                # Every section is answered for the same prompt, so retrieve once
+                if use_retrieval and prefetched_chunks is None:
+                    prefetched_chunks = self.retriver.query(text=prompt, where=where)
                 for chunk in document_chunks:
                     if use_retrieval:
                         sub_prompt = " ".join(
@@ -206,7 +263,7 @@ class RAG:
                                 chunk,
                             ]
                         )
-                        retrieved_chunks = self.retriver.query(text=prompt, where=where)
+                        retrieved_chunks = copy.deepcopy(prefetched_chunks)
                         if all_retrieved_chunks is None:
                             all_retrieved_chunks = retrieved_chunks
                         else:
@@ -265,7 +322,11 @@ class RAG:
                 return response, all_retrieved_chunks
 
         if use_retrieval:
-            retrieved_chunks = self.retriver.query(text=prompt, where=where)
+            if prefetched_chunks is None:
+                # Retrieval re-uses the embedding computed for the answer cache lookup
+                retrieved_chunks = self.retriver.query(
+                    text=prompt, where=where, query_embedding=question_embedding
+                )
             system_prompt = self._create_context_message(retrieved_chunks)
             self.message_manager.log_message(
                 RAGMessage(role="system", content=system_prompt)
@@ -298,4 +359,13 @@ class RAG:
         except Exception as e:
             logger.error(e)
             raise ValueError(response)
+        if use_answer_cache:
+            self.answer_cache.put(
+                prompt,
+                question_embedding,
+                self.config_hash,
+                fingerprint,
+                response,
+                retrieved_chunks,
+            )
         return response, retrieved_chunks
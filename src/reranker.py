@@ -0,0 +1,233 @@
+"""
+Module for cross-encoder rerankers run with PyTorch or ONNX Runtime.
+
+The "onnx" backend exports the Hugging Face model behind a sentence-transformers
+CrossEncoder to ONNX once, optionally with int8 dynamic quantization of its weights, and
+scores sentence pairs with an onnxruntime session whose intra-op thread count is set
+explicitly.  Exported models are stored under MODEL_CACHE, so later processes load them
+without importing PyTorch's export machinery.  Scores match CrossEncoder.predict,
+including its sigmoid activation for single-label models.
+
+Classes:
+    RerankerConfig: Typed dictionary for the reranking configuration.
+    CascadeConfig: Typed dictionary for the first stage of cascade reranking.
+    ONNXCrossEncoder: Cross-encoder scored with onnxruntime, with the same predict interface as CrossEncoder.
+
+Functions:
+    export_cross_encoder: Export a cross-encoder to ONNX, optionally quantized.
+    load_cross_encoder: Load a cross-encoder for a backend.
+"""
+
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, TypedDict, Union
+
+import numpy as np
+import onnxruntime as ort
+from sentence_transformers import CrossEncoder
+from typing_extensions import NotRequired
+
+from src.util import cache_resource
+
+logger = logging.getLogger(__name__)
+
+RERANKER_BACKENDS = ["torch", "onnx"]
+ONNX_FOLDER = "onnx"
+# The inputs a BERT-style model may take, in the order of its forward arguments
+MODEL_INPUTS = ["input_ids", "attention_mask", "token_type_ids"]
+
+
+class CascadeConfig(TypedDict):
+    candidates: int
+    model: NotRequired[str]
+    backend: NotRequired[str]
+    quantize: NotRequired[bool]
+    intra_op_threads: NotRequired[int]
+    early_exit_margin: NotRequired[float]
+
+
+class RerankerConfig(TypedDict):
+    model: str
+    top_k: int
+    backend: NotRequired[str]
+    quantize: NotRequired[bool]
+    intra_op_threads: NotRequired[int]
+    batch_size: NotRequired[int]
+    cascade: NotRequired[CascadeConfig]
+
+
+def _onnx_directory(model_name: str) -> Path:
+    cache = Path(os.getenv("MODEL_CACHE", Path.home() / ".cache"))
+    return cache / ONNX_FOLDER / model_name.replace("/", "--")
+
+
+def export_cross_encoder(model_name: str, quantize: bool = False) -> Path:
+    """
+    Export a cross-encoder to ONNX with dynamic batch and sequence axes, unless already
+    exported.  Files are written under a temporary name and renamed, so concurrent
+    processes never load a partial model.
+
+    Args:
+        model_name (str): The sentence-transformers cross-encoder name, e.g. cross-encoder/stsb-roberta-base.
+        quantize (bool, optional): Also quantize the weights to int8 with dynamic quantization. Defaults to False.
+
+    Returns:
+        Path: The path of the ONNX model.
+    """
+    directory = _onnx_directory(model_name)
+    path = directory / "model.onnx"
+    if not path.is_file():
+        import torch
+
+        logger.info(f"Exporting cross-encoder {model_name} to ONNX")
+        directory.mkdir(parents=True, exist_ok=True)
+        cross_encoder = CrossEncoder(model_name, device="cpu")
+        model = cross_encoder.model.eval()
+        dummy = cross_encoder.tokenizer(["query"], ["document"], return_tensors="pt")
+        input_names = [name for name in MODEL_INPUTS if name in dummy]
+
+        class _Logits(torch.nn.Module):
+            def __init__(self) -> None:
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs):
+                return self.model(**dict(zip(input_names, inputs))).logits
+
+        tmp_path = directory / f"model.{uuid.uuid4().hex}.onnx"
+        with torch.no_grad():
+            torch.onnx.export(
+                _Logits(),
+                tuple(dummy[name] for name in input_names),
+                str(tmp_path),
+                input_names=input_names,
+                output_names=["logits"],
+                dynamic_axes={
+                    **{name: {0: "batch", 1: "sequence"} for name in input_names},
+                    "logits": {0: "batch"},
+                },
+                opset_version=14,
+            )
+        os.replace(tmp_path, path)
+        cross_encoder.tokenizer.save_pretrained(str(directory))
+        cross_encoder.config.save_pretrained(str(directory))
+
+    if not quantize:
+        return path
+    quantized_path = directory / "model_int8.onnx"
+    if not quantized_path.is_file():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing ONNX cross-encoder {model_name} to int8")
+        tmp_path = directory / f"model_int8.{uuid.uuid4().hex}.onnx"
+        quantize_dynamic(str(path), str(tmp_path), weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+
+class ONNXCrossEncoder:
+    """
+    Cross-encoder exported to ONNX and scored with onnxruntime on CPU.
+
+    Args:
+        model_name (str): The sentence-transformers cross-encoder name.
+        quantize (bool, optional): Use the int8 dynamically quantized model. Defaults to False.
+        intra_op_threads (int, optional): Threads used within each operator. Defaults to onnxruntime's choice, one per physical core.
+        max_length (int, optional): Maximum tokens per sentence pair. Defaults to the tokenizer's maximum.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = False,
+        intra_op_threads: Optional[int] = None,
+        max_length: Optional[int] = None,
+    ) -> None:
+        from transformers import AutoConfig, AutoTokenizer
+
+        path = export_cross_encoder(model_name, quantize=quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(path.parent))
+        self.num_labels = AutoConfig.from_pretrained(str(path.parent)).num_labels
+        self.max_length = max_length
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(
+            str(path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def predict(
+        self,
+        sentences: Sequence[Union[Tuple[str, str], List[str]]],
+        batch_size: int = 32,
+    ) -> np.ndarray:
+        """
+        Score sentence pairs, as CrossEncoder.predict.
+
+        Args:
+            sentences (Sequence): The [query, document] pairs.
+            batch_size (int, optional): Pairs scored per session run. Defaults to 32.
+
+        Returns:
+            np.ndarray: One score per pair, or one row of label scores per pair for multi-label models.
+        """
+        logits = []
+        for i in range(0, len(sentences), batch_size):
+            batch = sentences[i : i + batch_size]
+            features = self.tokenizer(
+                [pair[0] for pair in batch],
+                [pair[1] for pair in batch],
+                padding=True,
+                truncation="longest_first",
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            logits.append(
+                self.session.run(
+                    None,
+                    {
+                        name: features[name].astype(np.int64)
+                        for name in self.input_names
+                    },
+                )[0]
+            )
+        if not logits:
+            return np.empty(0, dtype=np.float32)
+        scores = np.concatenate(logits)
+        if self.num_labels == 1:
+            return 1 / (1 + np.exp(-scores[:, 0]))
+        return scores
+
+
+@cache_resource
+def load_cross_encoder(
+    model: str,
+    backend: str = "torch",
+    quantize: bool = False,
+    intra_op_threads: Optional[int] = None,
+) -> Union[CrossEncoder, ONNXCrossEncoder]:
+    """
+    Load a cross-encoder for a reranking backend.
+
+    Args:
+        model (str): The sentence-transformers cross-encoder name.
+        backend (str, optional): "torch" or "onnx". Defaults to "torch".
+        quantize (bool, optional): Use int8 dynamic quantization, for the onnx backend. Defaults to False.
+        intra_op_threads (int, optional): Threads used within each operator, for the onnx backend. Defaults to onnxruntime's choice.
+
+    Returns:
+        Union[CrossEncoder, ONNXCrossEncoder]: The cross-encoder.
+    """
+    assert (
+        backend in RERANKER_BACKENDS
+    ), f"Reranker backend ({backend}) must be one of {', '.join(RERANKER_BACKENDS)}"
+    if backend == "onnx":
+        return ONNXCrossEncoder(
+            model, quantize=quantize, intra_op_threads=intra_op_threads
+        )
+    assert not quantize, "quantize only applies to the onnx reranker backend"
+    return CrossEncoder(model)
@@ -3,24 +3,323 @@ This module provides a Retriever class for querying and re-ranking text data usi
 
 The Retriever class includes methods for initializing the retriever, instantiating a cross-encoder model, re-ranking search results, and querying the VectorDB.
 
-Attributes: RetrievalConfig (TypedDict): A type hint representing the retrieval configuration, including reranking parameters if provided.
+Attributes: RetrievalConfig (TypedDict): A type hint representing the retrieval configuration, including reranking, compact index, shard routing, query embedding cache, result cache, hybrid retrieval and MMR parameters if provided.
+    MMRConfig (TypedDict): A type hint representing the maximal marginal relevance configuration.
 
 Classes: Retriever: A class for querying and re-ranking text data using a VectorDB and a cross-encoder model.
 
-Functions: No public functions are included in this module.
+Functions: section_filter: Builds a Where clause restricting retrieval to a chapter and/or section.
+    shards_from_where: Finds the shards a Where clause restricts retrieval to.
+    merge_query_results: Merges the results of querying several collections by distance.
+    split_query_results: Splits the results of a multi-query VectorDB call into one result per query.
+    reorder_query_result: Reorders and truncates the results of a single query.
+    vector_distances: Computes Chroma's distances between a query embedding and embeddings.
+    maximal_marginal_relevance: Selects a relevant and diverse subset of embeddings.
+    load_query_cache: Gets the query embedding cache shared by Retrievers with the same settings.
+    load_result_cache: Gets the retrieval result cache shared by Retrievers with the same settings.
 """
 
-from typing import Any, Dict, Optional, TypedDict
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, TypedDict, Union
 
+import numpy as np
 from chromadb.api.types import QueryResult, Where
+from filelock import FileLock
 from sentence_transformers import CrossEncoder
+from typing_extensions import NotRequired
 
-from src.util import cache_resource
+from src.compact_index import CompactIndex, CompactIndexConfig
+from src.embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+from src.lexical_index import (
+    PAGE_SIZE,
+    HybridConfig,
+    LexicalIndex,
+    reciprocal_rank_fusion,
+)
+from src.query_cache import (
+    QueryCacheConfig,
+    QueryEmbeddingCache,
+    QueryResultCache,
+    ResultCacheConfig,
+)
+from src.reranker import (
+    CascadeConfig,
+    ONNXCrossEncoder,
+    RerankerConfig,
+    load_cross_encoder,
+)
+from src.util import cache_resource, config_hash
 from src.vectordb import VDB
 
+# Shared by every Retriever, so sessions don't each keep idle threads alive
+EXECUTOR = ThreadPoolExecutor(thread_name_prefix="retriever")
+
+DEFAULT_INCLUDE = ["metadatas", "documents", "distances"]
+QUERY_RESULT_KEYS = [
+    "ids",
+    "distances",
+    "embeddings",
+    "documents",
+    "uris",
+    "data",
+    "metadatas",
+]
+
+
+class MMRConfig(TypedDict):
+    top_k: int
+    lambda_mult: NotRequired[float]
+
 
 class RetrievalConfig(TypedDict):
-    reranking: Optional[Dict[str, Any]]
+    reranking: Optional[RerankerConfig]
+    compact_index: NotRequired[CompactIndexConfig]
+    shard_routing: NotRequired[Dict[str, List[str]]]
+    query_cache: NotRequired[QueryCacheConfig]
+    result_cache: NotRequired[ResultCacheConfig]
+    hybrid: NotRequired[HybridConfig]
+    mmr: NotRequired[MMRConfig]
+
+
+@cache_resource
+def _load_compact_index(path: str, dtype: str, fingerprint: str) -> CompactIndex:
+    return CompactIndex(Path(path), dtype).load()
+
+
+@cache_resource
+def _load_query_cache(
+    model_name: str, maxsize: int, ttl: float, disk_directory: Optional[str]
+) -> QueryEmbeddingCache:
+    # Shared by every Retriever with the same settings, so repeated questions hit across sessions
+    return QueryEmbeddingCache(
+        model_name,
+        maxsize=maxsize,
+        ttl=ttl,
+        disk=EmbeddingCache(Path(disk_directory)) if disk_directory else None,
+    )
+
+
+def load_query_cache(
+    version_directory: Path,
+    model_name: str,
+    maxsize: int = 1024,
+    ttl: float = 86400,
+    persist: bool = False,
+) -> QueryEmbeddingCache:
+    """
+    Gets the query embedding cache for an embedding model, shared by all Retrievers with the same settings.
+
+    Args:
+        version_directory (Path): The directory containing the versions, whose cache folder holds the on-disk embedding cache.
+        model_name (str): The embedding model name.
+        maxsize (int, optional): The number of query embeddings kept in memory. Defaults to 1024.
+        ttl (float, optional): Seconds before a cached embedding expires. Defaults to one day.
+        persist (bool, optional): Also read and write the on-disk embedding cache shared between versions. Defaults to False.
+
+    Returns:
+        QueryEmbeddingCache: The cache.
+    """
+    disk_directory = str(version_directory / VDB.cache_folder) if persist else None
+    return _load_query_cache(model_name, maxsize, ttl, disk_directory)
+
+
+@cache_resource
+def load_result_cache(maxsize: int = 256, ttl: float = 3600) -> QueryResultCache:
+    """
+    Gets the retrieval result cache, shared by all Retrievers with the same settings.
+    Entries are keyed by version, so versions can share a cache.
+
+    Args:
+        maxsize (int, optional): The number of results kept. Defaults to 256.
+        ttl (float, optional): Seconds before a cached result expires. Defaults to one hour.
+
+    Returns:
+        QueryResultCache: The cache.
+    """
+    return QueryResultCache(maxsize=maxsize, ttl=ttl)
+
+
+def section_filter(
+    chapter: Optional[str] = None, section: Optional[str] = None
+) -> Optional[Where]:
+    """
+    Builds a Where clause restricting retrieval to chunks from a chapter and/or section,
+    as recorded in chunk metadata at ingestion.
+
+    Args:
+        chapter (str, optional): The chapter heading, e.g. "Chapter 2". Defaults to None.
+        section (str, optional): The section title. Defaults to None.
+
+    Returns:
+        Optional[Where]: The Where clause, or None if neither is given.
+    """
+    clauses: List[Where] = [
+        {key: value}
+        for key, value in (("chapter", chapter), ("section", section))
+        if value
+    ]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def shards_from_where(where: Optional[Where]) -> Optional[Set[str]]:
+    """
+    Finds the shards a Where clause restricts retrieval to, from a condition on the shard
+    metadata key at the top level or inside an $and.
+
+    Args:
+        where (Where, optional): The Where clause.
+
+    Returns:
+        Optional[Set[str]]: The shard names, or None if the clause does not restrict the shard.
+    """
+    if not where:
+        return None
+    if "$and" in where:
+        restrictions = [shards_from_where(clause) for clause in where["$and"]]
+        restrictions = [r for r in restrictions if r is not None]
+        return set.intersection(*restrictions) if restrictions else None
+    condition = where.get("shard")
+    if isinstance(condition, str):
+        return {condition}
+    if isinstance(condition, dict):
+        if "$eq" in condition:
+            return {condition["$eq"]}
+        if "$in" in condition:
+            return set(condition["$in"])
+    return None
+
+
+def merge_query_results(results: List[QueryResult], n_results: int) -> QueryResult:
+    """
+    Merges the results of the same single query against several collections, keeping the
+    n_results nearest by distance.
+
+    Args:
+        results (List[QueryResult]): The results from each collection, including distances.
+        n_results (int): The number of results to keep.
+
+    Returns:
+        QueryResult: The merged results, nearest first.
+    """
+    hits = [
+        (distance, result, i)
+        for result in results
+        for i, distance in enumerate(result["distances"][0])
+    ]
+    hits = sorted(hits, key=lambda hit: hit[0])[:n_results]
+    merged: QueryResult = {}
+    for key in QUERY_RESULT_KEYS:
+        if all(result.get(key) for result in results):
+            merged[key] = [[result[key][0][i] for _, result, i in hits]]
+        else:
+            merged[key] = None
+    return merged
+
+
+def split_query_results(results: QueryResult) -> List[QueryResult]:
+    """
+    Splits the results of a multi-query VectorDB call into one result per query.
+
+    Args:
+        results (QueryResult): The results, with one list per query for each included field.
+
+    Returns:
+        List[QueryResult]: One single-query result per query.
+    """
+    return [
+        {
+            key: [results[key][i]] if results.get(key) is not None else None
+            for key in QUERY_RESULT_KEYS
+        }
+        for i in range(len(results["ids"]))
+    ]
+
+
+def reorder_query_result(result: QueryResult, order: List[int]) -> QueryResult:
+    """
+    Reorders the results of a single query in place, keeping only the given positions.
+
+    Args:
+        result (QueryResult): The results of one query.
+        order (List[int]): The positions to keep, in their new order.
+
+    Returns:
+        QueryResult: The reordered results.
+    """
+    for key in result.keys():
+        if result[key]:
+            result[key][0] = [result[key][0][i] for i in order]
+    return result
+
+
+def vector_distances(
+    query_embedding: List[float], embeddings: List[List[float]], space: str
+) -> List[float]:
+    """
+    Computes Chroma's distances between a query embedding and embeddings: squared l2,
+    1 - cosine similarity or 1 - inner product.
+
+    Args:
+        query_embedding (List[float]): The query embedding.
+        embeddings (List[List[float]]): The embeddings.
+        space (str): The collection's hnsw:space, "l2", "cosine" or "ip".
+
+    Returns:
+        List[float]: One distance per embedding.
+    """
+    query = np.asarray(query_embedding, dtype=np.float32)
+    vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, len(query))
+    if space == "l2":
+        return ((vectors - query) ** 2).sum(axis=1).tolist()
+    if space == "cosine":
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        query = query / np.linalg.norm(query)
+    return (1 - vectors @ query).tolist()
+
+
+def maximal_marginal_relevance(
+    query_embedding: List[float],
+    embeddings: List[List[float]],
+    top_k: int,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Selects embeddings greedily by maximal marginal relevance: each step takes the one
+    maximising lambda_mult * its cosine similarity to the query minus (1 - lambda_mult) *
+    its highest cosine similarity to those already selected.
+
+    Args:
+        query_embedding (List[float]): The query embedding.
+        embeddings (List[List[float]]): The candidate embeddings.
+        top_k (int): The number of embeddings to select.
+        lambda_mult (float, optional): 1 ranks by relevance only, 0 by diversity only. Defaults to 0.5.
+
+    Returns:
+        List[int]: The indices of the selected embeddings, in order of selection.
+    """
+    query = np.asarray(query_embedding, dtype=np.float32)
+    vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, len(query))
+    if not len(vectors) or top_k < 1:
+        return []
+    vectors = vectors / np.maximum(
+        np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+    )
+    query = query / max(np.linalg.norm(query), 1e-12)
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    while len(selected) < min(top_k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
 
 
 class Retriever:
@@ -33,8 +332,15 @@ class Retriever:
 
     Methods:
         __init__: Initializes the Retriever with the specified VectorDB, query configuration, and retrieval configuration.
-        _instantiate_cross_encoder: Instantiates a cross-encoder model with the given model name.
-        _rerank: Re-ranks the retrieved search results using a cross-encoder model.
+        _instantiate_cross_encoder: Instantiates a cross-encoder model with the given model name and backend.
+        _setup_compact_index: Builds the compact index if missing or stale, and memory-maps it.
+        _setup_lexical_index: Opens the lexical index, rebuilding it if out of step with the VectorDB.
+        _embed: Embeds query texts, through the query embedding cache if configured.
+        embed_query: Embeds a query text exactly as query does.
+        _diversify: Keeps a relevant and diverse subset of the retrieved search results by maximal marginal relevance.
+        _cascade_first_stage: Prunes the retrieved search results with a cheap first stage ranking before re-ranking.
+        _rerank: Re-ranks the retrieved search results of several queries in one cross-encoder batch.
+        query_many: Queries the VectorDB with several texts in batched calls, and returns the results of each.
         query: Queries the VectorDB with the given text and optional Where clause, and returns the query results.
 
     """
@@ -51,7 +357,8 @@ class Retriever:
             retrieval_config (RetrievalConfig, optional): A dictionary representing the retrieval configuration, including reranking parameters if provided. Defaults to {}.
 
         Raises:
-            AssertionError: If the top_k value specified in retrieval_config['reranking'] exceeds the n_results value specified in query_config.
+            AssertionError: If the top_k value specified in retrieval_config['reranking'] exceeds the n_results value specified in query_config,
+                or the top_k value specified in retrieval_config['mmr'].
 
         Returns:
             None
@@ -64,72 +371,708 @@ class Retriever:
                 self.retrieval_config["reranking"]["top_k"]
                 <= self.query_config["n_results"]
             ), f"top_k ({self.retrieval_config['reranking']['top_k']} > n_results {self.query_config['n_results']})"
+        self.drop_embeddings = False
+        if "mmr" in self.retrieval_config:
+            mmr_top_k = self.retrieval_config["mmr"]["top_k"]
+            assert (
+                mmr_top_k <= self.query_config["n_results"]
+            ), f"mmr top_k ({mmr_top_k} > n_results {self.query_config['n_results']})"
+            if "reranking" in self.retrieval_config:
+                assert (
+                    self.retrieval_config["reranking"]["top_k"] <= mmr_top_k
+                ), f"top_k ({self.retrieval_config['reranking']['top_k']} > mmr top_k {mmr_top_k})"
+            include = list(self.query_config.get("include", DEFAULT_INCLUDE))
+            # MMR needs the candidates' embeddings; they are dropped afterwards unless requested
+            self.drop_embeddings = "embeddings" not in include
+            if self.drop_embeddings:
+                self.query_config = {
+                    **self.query_config,
+                    "include": [*include, "embeddings"],
+                }
+        if "cascade" in (self.retrieval_config.get("reranking") or {}):
+            cascade = self.retrieval_config["reranking"]["cascade"]
+            assert (
+                self.retrieval_config["reranking"]["top_k"] <= cascade["candidates"]
+            ), f"top_k ({self.retrieval_config['reranking']['top_k']} > cascade candidates {cascade['candidates']})"
+            assert "model" in cascade or "distances" in self.query_config.get(
+                "include", DEFAULT_INCLUDE
+            ), "A cascade without a first stage model ranks by distance, which requires distances in query_config.include"
+        if self.vdb.shards:
+            assert (
+                "compact_index" not in self.retrieval_config
+            ), "The compact index does not support a sharded VDB"
+            assert "distances" in self.query_config.get(
+                "include", DEFAULT_INCLUDE
+            ), "Merging shard results requires distances in query_config.include"
+        self.compact_index = (
+            self._setup_compact_index(**self.retrieval_config["compact_index"])
+            if "compact_index" in self.retrieval_config
+            else None
+        )
+        self.query_cache = (
+            load_query_cache(
+                self.vdb.path.parent,
+                self.vdb.embedding_config["model_name"],
+                **self.retrieval_config["query_cache"],
+            )
+            if "query_cache" in self.retrieval_config
+            else None
+        )
+        self.result_cache = (
+            load_result_cache(**self.retrieval_config["result_cache"])
+            if "result_cache" in self.retrieval_config
+            else None
+        )
+        self.lexical_index = (
+            self._setup_lexical_index() if "hybrid" in self.retrieval_config else None
+        )
+        self.config_hash = config_hash(query_config, self.retrieval_config)
+
+    def _embed(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        """
+        Embeds query texts with the VectorDB's embedding model, through the query embedding cache if configured.
+
+        Args:
+            texts (List[str]): The query texts.
+            use_cache (bool, optional): Whether to read and write the query and embedding caches. Defaults to True.
+
+        Returns:
+            List[List[float]]: One embedding per text.
+        """
+        embedding_model = self.vdb.embedding_model
+        if not use_cache:
+            if isinstance(embedding_model, CachedEmbeddingFunction):
+                embedding_model = embedding_model.embedding_function
+            return embedding_model(texts)
+        if self.query_cache is None:
+            return embedding_model(texts)
+        return self.query_cache.embed(texts, embedding_model)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a query text exactly as query does, so that callers can use the embedding
+        (e.g. for their own cache lookups) and pass it on to query to avoid embedding twice.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        return self._embed([text])[0]
+
+    def _setup_compact_index(
+        self, dtype: str = "int8", rescore_candidates: Optional[int] = None
+    ) -> CompactIndex:
+        """
+        Builds the compact index of the collection's embeddings if it is missing or the
+        collection has changed since it was built, then memory-maps it.
+
+        Args:
+            dtype (str, optional): "int8" or "float16". Defaults to "int8".
+            rescore_candidates (int, optional): First-pass candidates re-scored at full precision, used at query time.
+
+        Returns:
+            CompactIndex: The loaded index.
+        """
+        # The version's own vdb folder, so a version sharing a parent's store never writes to it
+        directory = self.vdb.path / self.vdb.vdb_folder
+        fingerprint = self.vdb.fingerprint
+        index = CompactIndex(directory, dtype)
+        if index.fingerprint != fingerprint:
+            directory.mkdir(parents=True, exist_ok=True)
+            # Sessions starting together would otherwise build the same index at once
+            with FileLock(index.directory.with_name(f"{index.directory.name}.lock")):
+                if index.fingerprint != fingerprint:
+                    index.build(self.vdb.collection, fingerprint)
+        return _load_compact_index(str(directory), dtype, fingerprint)
+
+    def _setup_lexical_index(self) -> LexicalIndex:
+        """
+        Opens the lexical index in the vdb folder, rebuilding it from the collections if it
+        does not index the same chunk ids, e.g. if the VectorDB was vectorised without
+        VDB.ingestion_config.lexical_index set.  The ids are only compared once per change
+        of the VectorDB's fingerprint.
+
+        Returns:
+            LexicalIndex: The index.
+        """
+        # The version's own vdb folder, so a version sharing a parent's store never writes to it
+        index = LexicalIndex(self.vdb.path / self.vdb.vdb_folder)
+        fingerprint = self.vdb.fingerprint
+        if index.fingerprint != fingerprint:
+            # Sessions starting together would otherwise rebuild the same index at once
+            with FileLock(index.directory / f"{index.file_name}.lock"):
+                if index.fingerprint != fingerprint:
+                    ids = {
+                        chunk_id
+                        for collection in self.vdb.collections.values()
+                        for offset in range(0, collection.count(), PAGE_SIZE)
+                        for chunk_id in collection.get(
+                            include=[], limit=PAGE_SIZE, offset=offset
+                        )["ids"]
+                    }
+                    if index.ids() != ids:
+                        index.rebuild(self.vdb.collections)
+                    index.set_fingerprint(fingerprint)
+        return index
 
-    @cache_resource
-    def _instantiate_cross_encoder(_self, model: str) -> CrossEncoder:
+    def _instantiate_cross_encoder(
+        self,
+        model: str,
+        backend: str = "torch",
+        quantize: bool = False,
+        intra_op_threads: Optional[int] = None,
+    ) -> Union[CrossEncoder, ONNXCrossEncoder]:
         """
-        Instantiates a cross-encoder model with the given model name.
+        Instantiates a cross-encoder model with the given model name and backend.
 
         Args:
             model (str): The name of the cross-encoder model.
+            backend (str, optional): "torch" for sentence-transformers, or "onnx" to run an ONNX export with onnxruntime. Defaults to "torch".
+            quantize (bool, optional): Use int8 dynamic quantization, for the onnx backend. Defaults to False.
+            intra_op_threads (int, optional): Threads used within each operator, for the onnx backend. Defaults to onnxruntime's choice.
 
         Returns:
-            CrossEncoder: An instance of the cross-encoder model.
+            Union[CrossEncoder, ONNXCrossEncoder]: An instance of the cross-encoder model.
         """
-        return CrossEncoder(model)
+        return load_cross_encoder(model, backend, quantize, intra_op_threads)
+
+    def _cascade_first_stage(
+        self,
+        queries: List[str],
+        retrieved_chunks: List[QueryResult],
+        top_k: int,
+        batch_size: int,
+        candidates: int,
+        model: Optional[str] = None,
+        backend: str = "torch",
+        quantize: bool = False,
+        intra_op_threads: Optional[int] = None,
+        early_exit_margin: Optional[float] = None,
+    ) -> List[int]:
+        """
+        Ranks the retrieved search results of each query with a cheap first stage, a small cross-encoder
+        or else the embedding distances, and keeps the best candidates for the expensive cross-encoder.
+        A query exits early, keeping its first stage top_k, when the first stage score of its top_k-th
+        result beats the next result by at least early_exit_margin.
+
+        Args:
+            queries (List[str]): The query texts.
+            retrieved_chunks (List[QueryResult]): The retrieved search results of each query, pruned in place.
+            top_k (int): The number of top results to retain after re-ranking.
+            batch_size (int): Sentence pairs scored per forward pass.
+            candidates (int): The number of results per query passed on to the expensive cross-encoder.
+            model (str, optional): The name of the first stage cross-encoder. Defaults to ranking by distance.
+            backend (str, optional): "torch" or "onnx", for the first stage cross-encoder. Defaults to "torch".
+            quantize (bool, optional): Use int8 dynamic quantization, for the onnx backend. Defaults to False.
+            intra_op_threads (int, optional): Threads used within each operator, for the onnx backend. Defaults to onnxruntime's choice.
+            early_exit_margin (float, optional): The first stage score margin that decides a query. Defaults to never exiting early.
+
+        Returns:
+            List[int]: The positions of the queries still to be re-ranked by the expensive cross-encoder.
+        """
+        if model is None:
+            # Lower distances are better
+            first_stage_scores = [
+                -np.asarray(chunks["distances"][0], dtype=np.float32)
+                for chunks in retrieved_chunks
+            ]
+        else:
+            cross_encoder_model = self._instantiate_cross_encoder(
+                model, backend, quantize, intra_op_threads
+            )
+            sentence_pairs = [
+                [query, text]
+                for query, chunks in zip(queries, retrieved_chunks)
+                for text in chunks["documents"][0]
+            ]
+            similarity_scores = np.asarray(
+                (
+                    cross_encoder_model.predict(sentence_pairs, batch_size=batch_size)
+                    if sentence_pairs
+                    else []
+                ),
+                dtype=np.float32,
+            )
+            offsets = np.cumsum(
+                [0] + [len(chunks["documents"][0]) for chunks in retrieved_chunks]
+            )
+            first_stage_scores = [
+                similarity_scores[start:end]
+                for start, end in zip(offsets[:-1], offsets[1:])
+            ]
+
+        pending = []
+        for i, (chunks, scores) in enumerate(zip(retrieved_chunks, first_stage_scores)):
+            order = np.argsort(-scores, kind="stable").tolist()
+            if (
+                early_exit_margin is not None
+                and len(order) > top_k
+                and scores[order[top_k - 1]] - scores[order[top_k]] >= early_exit_margin
+            ):
+                reorder_query_result(chunks, order[:top_k])
+            else:
+                reorder_query_result(chunks, order[:candidates])
+                pending.append(i)
+        return pending
 
     def _rerank(
-        self, query: str, retrieved_chunks: QueryResult, model: str, top_k: int
+        self,
+        queries: List[str],
+        retrieved_chunks: List[QueryResult],
+        model: str,
+        top_k: int,
+        backend: str = "torch",
+        quantize: bool = False,
+        intra_op_threads: Optional[int] = None,
+        batch_size: int = 32,
+        cascade: Optional[CascadeConfig] = None,
     ):
         """
-        Re-ranks the retrieved search results using a cross-encoder model.
+        Re-ranks the retrieved search results of several queries using a cross-encoder model,
+        scoring the (query, chunk) pairs of all the queries in one batch.
 
         Args:
-            query (str): The query text.
-            retrieved_chunks (QueryResult): The retrieved search results.
+            queries (List[str]): The query texts.
+            retrieved_chunks (List[QueryResult]): The retrieved search results of each query.
             model (str): The name of the cross-encoder model.
             top_k (int): The number of top results to retain after re-ranking.
+            backend (str, optional): "torch" or "onnx". Defaults to "torch".
+            quantize (bool, optional): Use int8 dynamic quantization, for the onnx backend. Defaults to False.
+            intra_op_threads (int, optional): Threads used within each operator, for the onnx backend. Defaults to onnxruntime's choice.
+            batch_size (int, optional): Sentence pairs scored per forward pass. Defaults to 32.
+            cascade (CascadeConfig, optional): A cheap first stage pruning the results before the cross-encoder. Defaults to None.
 
         Returns:
-            QueryResult: The re-ranked search results.
+            List[QueryResult]: The re-ranked search results of each query.
         """
-        hits = retrieved_chunks["documents"][0]
-        hits = [{"text": h, "original_index": i} for i, h in enumerate(hits)]
-        cross_encoder_model = self._instantiate_cross_encoder(model)
+        pending = (
+            self._cascade_first_stage(
+                queries, retrieved_chunks, top_k, batch_size, **cascade
+            )
+            if cascade is not None
+            else list(range(len(retrieved_chunks)))
+        )
+        if not pending:
+            return retrieved_chunks
+        cross_encoder_model = self._instantiate_cross_encoder(
+            model, backend, quantize, intra_op_threads
+        )
         # Now, do the re-ranking with the cross-encoder
-        sentence_pairs = [[query, hit["text"]] for hit in hits]
-        similarity_scores = cross_encoder_model.predict(sentence_pairs)
-
-        for idx in range(len(hits)):
-            hits[idx]["cross-encoder_score"] = similarity_scores[idx]
-
-        # Sort list by CrossEncoder scores
-        hits = sorted(hits, key=lambda x: x["cross-encoder_score"], reverse=True)
-        new_index_order = [h["original_index"] for h in hits][:top_k]
-        for key in retrieved_chunks.keys():
-            if retrieved_chunks[key]:
-                retrieved_chunks[key][0] = [
-                    retrieved_chunks[key][0][i] for i in new_index_order
-                ]
+        sentence_pairs = [
+            [queries[i], text]
+            for i in pending
+            for text in retrieved_chunks[i]["documents"][0]
+        ]
+        similarity_scores = (
+            cross_encoder_model.predict(sentence_pairs, batch_size=batch_size)
+            if sentence_pairs
+            else []
+        )
+
+        offset = 0
+        for chunks in [retrieved_chunks[i] for i in pending]:
+            hits = chunks["documents"][0]
+            hits = [{"text": h, "original_index": i} for i, h in enumerate(hits)]
+            for idx in range(len(hits)):
+                hits[idx]["cross-encoder_score"] = similarity_scores[offset + idx]
+            offset += len(hits)
+
+            # Sort list by CrossEncoder scores
+            hits = sorted(hits, key=lambda x: x["cross-encoder_score"], reverse=True)
+            new_index_order = [h["original_index"] for h in hits][:top_k]
+            reorder_query_result(chunks, new_index_order)
         return retrieved_chunks
 
-    def query(self, text: str, where: Optional[Where] = None) -> QueryResult:
+    def _query_compact_index(self, query_embeddings: List[List[float]]) -> QueryResult:
         """
-        Queries the VectorDB with the given text and optional Where clause, and returns the query results.
-        Applies optional post processing if defined in config.
+        Queries the compact index with the query embedding, then fetches the included fields of the results from the VectorDB.
+
+        Args:
+            query_embeddings (List[List[float]]): The embedding of the query text.
+
+        Returns:
+            QueryResult: The query results, in the same format as a VectorDB query.
+        """
+        include = self.query_config.get("include", DEFAULT_INCLUDE)
+        ids, distances = self.compact_index.search(
+            np.asarray(query_embeddings),
+            n_results=self.query_config["n_results"],
+            rescore_candidates=self.retrieval_config["compact_index"].get(
+                "rescore_candidates"
+            ),
+        )
+        fetched = (
+            self.vdb.collection.get(
+                ids=ids[0], include=[i for i in include if i != "distances"]
+            )
+            if ids[0]
+            else {"ids": []}
+        )
+        # get does not preserve the order of the requested ids
+        position = {chunk_id: i for i, chunk_id in enumerate(fetched["ids"])}
+        order = [position[chunk_id] for chunk_id in ids[0]]
+        retrieved_chunks: QueryResult = {
+            "ids": ids,
+            "distances": distances if "distances" in include else None,
+        }
+        for key in ["embeddings", "documents", "uris", "data", "metadatas"]:
+            retrieved_chunks[key] = (
+                [[fetched[key][i] for i in order]] if fetched.get(key) else None
+            )
+        return retrieved_chunks
+
+    def _route(self, text: str, where: Optional[Where]) -> List[str]:
+        """
+        Selects the shards to query: those allowed by the Where clause, narrowed to those
+        whose retrieval_config.shard_routing patterns match the text, if any match.
 
         Args:
             text (str): The query text.
-            where (Where, optional): A Where clause to filter the query. Defaults to None.
+            where (Where, optional): The Where clause of the query.
 
         Returns:
-            QueryResult: The query results from the VectorDB.
+            List[str]: The shard names, in config order.
         """
-        retrieved_chunks = self.vdb.collection.query(
-            query_texts=text, where=where, **self.query_config
+        allowed = shards_from_where(where)
+        shards = [
+            shard for shard in self.vdb.shards if allowed is None or shard in allowed
+        ]
+        routed = [
+            shard
+            for shard in shards
+            if any(
+                re.search(pattern, text, re.IGNORECASE)
+                for pattern in self.retrieval_config.get("shard_routing", {}).get(
+                    shard, []
+                )
+            )
+        ]
+        return routed or shards
+
+    def _query_shards(
+        self,
+        texts: List[str],
+        query_embeddings: List[List[float]],
+        where: Optional[Where],
+    ) -> List[QueryResult]:
+        """
+        Queries the selected shards concurrently, each with one call for all the texts routed to it,
+        and merges the results of each text by distance.
+
+        Args:
+            texts (List[str]): The query texts.
+            query_embeddings (List[List[float]]): The embedding of each query text.
+            where (Where, optional): A Where clause to filter the queries.
+
+        Returns:
+            List[QueryResult]: The nearest results across the shards for each text.
+        """
+        routes = [self._route(text, where) for text in texts]
+        queries_by_shard: Dict[str, List[int]] = {}
+        for i, shards in enumerate(routes):
+            for shard in shards:
+                queries_by_shard.setdefault(shard, []).append(i)
+        shard_results = dict(
+            zip(
+                queries_by_shard,
+                EXECUTOR.map(
+                    lambda shard: split_query_results(
+                        self.vdb.collections[shard].query(
+                            query_embeddings=[
+                                query_embeddings[i] for i in queries_by_shard[shard]
+                            ],
+                            where=where,
+                            **self.query_config,
+                        )
+                    ),
+                    queries_by_shard,
+                ),
+            )
         )
-        if "reranking" in self.retrieval_config:
-            retrieved_chunks = self._rerank(
-                text, retrieved_chunks, **self.retrieval_config["reranking"]
+        positions = {
+            shard: {i: position for position, i in enumerate(indices)}
+            for shard, indices in queries_by_shard.items()
+        }
+        results = []
+        for i, shards in enumerate(routes):
+            if not shards:
+                results.append({key: [[]] for key in QUERY_RESULT_KEYS})
+                continue
+            results.append(
+                merge_query_results(
+                    [shard_results[shard][positions[shard][i]] for shard in shards],
+                    self.query_config["n_results"],
+                )
+            )
+        return results
+
+    def _vector_search(
+        self,
+        texts: List[str],
+        query_embeddings: List[List[float]],
+        where: Optional[Where],
+    ) -> List[QueryResult]:
+        """
+        Finds the nearest chunks to each query embedding, in the shards, compact index or collection.
+
+        Args:
+            texts (List[str]): The query texts, for shard routing.
+            query_embeddings (List[List[float]]): The embedding of each query text.
+            where (Where, optional): A Where clause to filter the queries.
+
+        Returns:
+            List[QueryResult]: The nearest results for each text.
+        """
+        if self.vdb.shards:
+            return self._query_shards(texts, query_embeddings, where)
+        # The compact index holds no metadata, so filtered queries go to the VectorDB
+        if (
+            self.compact_index
+            and where is None
+            and "where_document" not in self.query_config
+        ):
+            return [
+                self._query_compact_index([query_embedding])
+                for query_embedding in query_embeddings
+            ]
+        return split_query_results(
+            self.vdb.collection.query(
+                query_embeddings=query_embeddings, where=where, **self.query_config
+            )
+        )
+
+    def _query_lexical(
+        self, text: str, where: Optional[Where]
+    ) -> List[Tuple[str, str]]:
+        """
+        Finds the chunks with the highest BM25 scores for the text in the lexical index,
+        keeping those that match the Where clause and query_config.where_document.
+
+        Args:
+            text (str): The query text.
+            where (Where, optional): A Where clause to filter the query.
+
+        Returns:
+            List[Tuple[str, str]]: The id and shard of each result, best first.
+        """
+        shards = self._route(text, where) if self.vdb.shards else None
+        hits = self.lexical_index.search(
+            text,
+            self.retrieval_config["hybrid"].get(
+                "lexical_candidates", self.query_config["n_results"]
+            ),
+            shards,
+        )
+        where_document = self.query_config.get("where_document")
+        if hits and (where or where_document):
+            allowed = set()
+            for shard in {shard for _, shard, _ in hits}:
+                allowed.update(
+                    self.vdb.collections[shard].get(
+                        ids=[chunk_id for chunk_id, s, _ in hits if s == shard],
+                        where=where,
+                        where_document=where_document,
+                        include=[],
+                    )["ids"]
+                )
+            hits = [hit for hit in hits if hit[0] in allowed]
+        return [(chunk_id, shard) for chunk_id, shard, _ in hits]
+
+    def _fuse(
+        self,
+        vector_chunks: QueryResult,
+        lexical_hits: List[Tuple[str, str]],
+        query_embedding: List[float],
+    ) -> QueryResult:
+        """
+        Fuses the vector and lexical rankings by reciprocal rank, keeping n_results.  Fields
+        of chunks found only by lexical search are fetched from the VectorDB, with their
+        distances computed from their embeddings.
+
+        Args:
+            vector_chunks (QueryResult): The vector search results.
+            lexical_hits (List[Tuple[str, str]]): The id and shard of each lexical search result, best first.
+            query_embedding (List[float]): The query embedding.
+
+        Returns:
+            QueryResult: The fused results, best first.
+        """
+        fused = reciprocal_rank_fusion(
+            [vector_chunks["ids"][0], [chunk_id for chunk_id, _ in lexical_hits]],
+            k=self.retrieval_config["hybrid"].get("rrf_k", 60),
+        )[: self.query_config["n_results"]]
+        include = self.query_config.get("include", DEFAULT_INCLUDE)
+        rows: Dict[str, Dict] = {
+            chunk_id: {
+                key: vector_chunks[key][0][i]
+                for key in QUERY_RESULT_KEYS
+                if vector_chunks.get(key)
+            }
+            for i, chunk_id in enumerate(vector_chunks["ids"][0])
+        }
+        lexical_shards = dict(lexical_hits)
+        missing: Dict[str, List[str]] = {}
+        for chunk_id in fused:
+            if chunk_id not in rows:
+                missing.setdefault(lexical_shards[chunk_id], []).append(chunk_id)
+        fetch = [i for i in include if i != "distances"]
+        if "distances" in include and "embeddings" not in fetch:
+            fetch.append("embeddings")
+        for shard, ids in missing.items():
+            collection = self.vdb.collections[shard]
+            fetched = collection.get(ids=ids, include=fetch)
+            if "distances" in include:
+                fetched["distances"] = vector_distances(
+                    query_embedding,
+                    fetched["embeddings"],
+                    (collection.metadata or {}).get("hnsw:space", "l2"),
+                )
+            for i, chunk_id in enumerate(fetched["ids"]):
+                rows[chunk_id] = {
+                    key: fetched[key][i]
+                    for key in QUERY_RESULT_KEYS
+                    if fetched.get(key) is not None
+                }
+        # Chunks deleted since the lexical index was checked are not returned by get
+        fused = [chunk_id for chunk_id in fused if chunk_id in rows]
+        return {
+            key: (
+                [[rows[chunk_id][key] for chunk_id in fused]]
+                if key == "ids" or key in include
+                else None
             )
+            for key in QUERY_RESULT_KEYS
+        }
+
+    def _diversify(
+        self, retrieved_chunks: QueryResult, query_embedding: List[float]
+    ) -> QueryResult:
+        """
+        Keeps retrieval_config.mmr.top_k of the retrieved search results, selected by maximal marginal relevance
+        so that near-duplicate chunks (e.g. overlapping chunks of one page) do not crowd out the rest.
+
+        Args:
+            retrieved_chunks (QueryResult): The retrieved search results, including their embeddings.
+            query_embedding (List[float]): The query embedding.
+
+        Returns:
+            QueryResult: The selected search results, in order of selection.
+        """
+        new_index_order = maximal_marginal_relevance(
+            query_embedding,
+            retrieved_chunks["embeddings"][0],
+            top_k=self.retrieval_config["mmr"]["top_k"],
+            lambda_mult=self.retrieval_config["mmr"].get("lambda_mult", 0.5),
+        )
+        reorder_query_result(retrieved_chunks, new_index_order)
+        if self.drop_embeddings:
+            retrieved_chunks["embeddings"] = None
         return retrieved_chunks
+
+    def query_many(
+        self,
+        texts: List[str],
+        where: Optional[Where] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+        use_cache: bool = True,
+    ) -> List[QueryResult]:
+        """
+        Queries the VectorDB with several texts and an optional Where clause shared by all of them.
+        The texts are embedded in one call, searched in one multi-query VectorDB call and re-ranked
+        in one cross-encoder batch.  Texts whose results are in the result cache are not re-queried.
+
+        Args:
+            texts (List[str]): The query texts.
+            where (Where, optional): A Where clause to filter the queries. Defaults to None.
+            query_embeddings (List[List[float]], optional): The embedding of each text, from embed_query. Defaults to embedding the texts.
+            use_cache (bool, optional): Whether to read and write the result, query and embedding caches,
+                and count towards their statistics. Defaults to True.
+
+        Returns:
+            List[QueryResult]: The query results of each text, as returned by query.
+        """
+        result_cache = self.result_cache if use_cache else None
+        results: List[Optional[QueryResult]] = [None] * len(texts)
+        if result_cache is not None:
+            fingerprint = self.vdb.fingerprint
+            keys = [
+                result_cache.key(str(self.vdb.path), text, where, self.config_hash)
+                for text in texts
+            ]
+            results = [result_cache.get(key, fingerprint) for key in keys]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if self.vdb.shards:
+            # No shard can match these texts, so there is nothing to embed or search
+            for i in pending:
+                if not self._route(texts[i], where):
+                    results[i] = {key: [[]] for key in QUERY_RESULT_KEYS}
+            pending = [i for i in pending if results[i] is None]
+        if not pending:
+            return results
+        pending_texts = [texts[i] for i in pending]
+        if self.lexical_index is not None:
+            # Lexical search runs alongside query embedding and vector search
+            lexical_hits = [
+                EXECUTOR.submit(self._query_lexical, text, where)
+                for text in pending_texts
+            ]
+        query_embeddings = (
+            [query_embeddings[i] for i in pending]
+            if query_embeddings is not None
+            else self._embed(pending_texts, use_cache)
+        )
+        retrieved = self._vector_search(pending_texts, query_embeddings, where)
+        if self.lexical_index is not None:
+            retrieved = [
+                self._fuse(retrieved_chunks, hits.result(), query_embedding)
+                for retrieved_chunks, hits, query_embedding in zip(
+                    retrieved, lexical_hits, query_embeddings
+                )
+            ]
+        if "mmr" in self.retrieval_config:
+            retrieved = [
+                self._diversify(retrieved_chunks, query_embedding)
+                for retrieved_chunks, query_embedding in zip(
+                    retrieved, query_embeddings
+                )
+            ]
+        if "reranking" in self.retrieval_config:
+            retrieved = self._rerank(
+                pending_texts, retrieved, **self.retrieval_config["reranking"]
+            )
+        for i, retrieved_chunks in zip(pending, retrieved):
+            results[i] = retrieved_chunks
+            if result_cache is not None:
+                result_cache.put(keys[i], fingerprint, retrieved_chunks)
+        return results
+
+    def query(
+        self,
+        text: str,
+        where: Optional[Where] = None,
+        query_embedding: Optional[List[float]] = None,
+        use_cache: bool = True,
+    ) -> QueryResult:
+        """
+        Queries the VectorDB with the given text and optional Where clause, and returns the query results.
+        Applies optional post processing if defined in config.  Served from the result cache if configured
+        and the same query has been retrieved since the collection last changed.
+
+        Args:
+            text (str): The query text.
+            where (Where, optional): A Where clause to filter the query. Defaults to None.
+            query_embedding (List[float], optional): The embedding of the text, from embed_query. Defaults to embedding the text.
+            use_cache (bool, optional): Whether to read and write the result, query and embedding caches,
+                and count towards their statistics. Defaults to True.
+
+        Returns:
+            QueryResult: The query results from the VectorDB.
+        """
+        return self.query_many(
+            [text],
+            where,
+            [query_embedding] if query_embedding is not None else None,
+            use_cache,
+        )[0]
@@ -1,5 +1,10 @@
 from datetime import datetime
+import hashlib
+import json
 import os
+import unicodedata
+from pathlib import Path
+from typing import Any, Mapping, Sequence
 
 import tiktoken
 
@@ -62,6 +67,30 @@ def set_model_cache_env():
     os.environ["TORCH_HOME"] = os.environ["MODEL_CACHE"]
 
 
+def file_hash(path: Path) -> str:
+    """Compute the sha256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def to_plain(obj: Any) -> Any:
+    """Recursively convert mappings (e.g. OmegaConf DictConfig) and sequences to plain dicts and lists."""
+    if isinstance(obj, Mapping):
+        return {str(k): to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, Sequence) and not isinstance(obj, (str, bytes)):
+        return [to_plain(v) for v in obj]
+    return obj
+
+
+def config_hash(*configs: Any) -> str:
+    """Compute a stable sha256 hex digest for one or more configuration objects."""
+    serialised = json.dumps([to_plain(c) for c in configs], sort_keys=True, default=str)
+    return hashlib.sha256(serialised.encode("utf-8")).hexdigest()
+
+
 def cache_resource(func):
     if os.environ.get("STREAMLIT", False):
         return st.cache_resource(func)
@@ -69,6 +98,13 @@ def cache_resource(func):
         return func
 
 
+def normalise_query(text: str) -> str:
+    """Normalise a query for use as a cache key: HTML markup (e.g. the chat input's <p> wrapping) stripped, unicode compatibility form, case folded, whitespace collapsed."""
+    if "<" in text:
+        text = strip_text_out_of_html(text)
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
 def clean_filename(filename):
     return re.sub(r'[<>:"/\\|?*\x00-\x1F]', "", filename)
 
@@ -1,4 +1,4 @@
-from src.util import DeploymentType, cache_resource
+from src.util import DeploymentType, cache_resource, config_hash, file_hash, to_plain
 import os
 
 if DeploymentType[os.environ.get("DEPLOYMENT_TYPE", "LOCAL")] in [
@@ -10,9 +10,36 @@ if DeploymentType[os.environ.get("DEPLOYMENT_TYPE", "LOCAL")] in [
 
     sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
 
+import fnmatch
+import hashlib
+import json
 import logging
+import multiprocessing
+import queue
+import re
+import threading
+import uuid
+from collections import deque
+from contextlib import closing
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, TypedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypedDict,
+    TypeVar,
+)
+
+from typing_extensions import NotRequired
 
 import chromadb
 import tqdm
@@ -20,46 +47,98 @@ from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
 from unstructured.chunking.basic import chunk_elements
 from unstructured.documents.elements import Element
 from unstructured.partition.pdf import partition_pdf
-from unstructured.documents.elements import NarrativeText
+from unstructured.documents.elements import Title
 from chromadb.config import Settings
 from chromadb import QueryResult
+from chromadb.api.models.Collection import Collection
+from omegaconf import OmegaConf
+
+from src.adaptive_partition import ADAPTIVE_STRATEGY, partition_pdf_adaptive
+from src.dedup import DedupConfig, DedupReport, SimHashIndex, simhash
+from src.embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+from src.embedding_scheduler import RateLimitedEmbeddingFunction, SchedulerConfig
+from src.lexical_index import LexicalIndex
+from src.local_embeddings import LocalEmbeddingFunction
+from src.manifest import IngestionCheckpoint, IngestionManifest, SyncPlan
+from src.partition_cache import PartitionCache
 
 logger = logging.getLogger(__name__)
 
+CHAPTER_PATTERN = re.compile(r"chapter\s+\w+", re.IGNORECASE)
+MAX_HEADING_LENGTH = 100
+# Bump when changes to partitioning or chunking code alter the chunks produced for a file
+CHUNK_SCHEMA_VERSION = 2
+# Shard name of the single collection of an unsharded VDB
+UNSHARDED = ""
+READ_ONLY_ERROR = (
+    "Vector store is shared from parent version {}, vectorise the parent instead"
+)
 
-def _partition_pdf(filepath: Path, **kwargs) -> List[Element]:
 
+def _partition_pdf(
+    filepath: Path, partition_cache: Optional[PartitionCache] = None, **kwargs
+) -> List[Element]:
     """
     Partition a PDF file into a list of structured elements.
 
     Args:
         filepath (Path): The path to the PDF file.
-        **kwargs: Additional keyword arguments for partitioning.
+        partition_cache (PartitionCache, optional): Cache of previously partitioned files to read from and write to.
+        **kwargs: Additional keyword arguments for partitioning.  strategy may also be "adaptive" to choose between fast and hi_res per page.
 
     Returns:
         List[Element]: A list of structured elements extracted from the PDF.
     """
-    # Combine all text elements into a single string
-    elements = partition_pdf(filepath, **kwargs)
-    chapter_elements = []
+    elements = partition_cache.get(filepath, kwargs) if partition_cache else None
+    if elements is None:
+        if kwargs.get("strategy") == ADAPTIVE_STRATEGY:
+            elements = partition_pdf_adaptive(filepath, **kwargs)
+        else:
+            elements = partition_pdf(filepath, **kwargs)
+        if partition_cache:
+            partition_cache.put(filepath, kwargs, elements)
+    return elements
 
-    # Combine all text elements into a single string to identify chapters
-    full_text = "\n".join(str(element) for element in elements if isinstance(element, NarrativeText))
 
-    # Split the text by chapters assuming chapters are marked as "Chapter 1", "Chapter 2", etc.
-    chapters = full_text.split('Chapter ')
+def _index_sections(elements: List[Element]) -> List[Tuple[str, str]]:
+    """
+    Assign each element the chapter and section it belongs to, in a single pass.
+    Chapters start at elements whose text begins "Chapter <n>", sections at any other Title.
 
-    # Adjust the chapter indexing because we split by 'Chapter '
-    if len(chapters) > 1:
-        for i in range(1, 2 + 1):
-            if i < len(chapters):
-                chapter_identifier = f"Chapter {i}"
-                for element in elements:
-                    if chapter_identifier in str(element):
-                        chapter_elements.append(element)
+    Args:
+        elements (List[Element]): The partitioned elements, in reading order.
 
-    return chapter_elements
-    # return partition_pdf(filepath, **kwargs)
+    Returns:
+        List[Tuple[str, str]]: The (chapter, section) of each element, empty where none precedes it.
+    """
+    chapter, section = "", ""
+    sections = []
+    for element in elements:
+        text = (element.text or "").strip()
+        if CHAPTER_PATTERN.match(text) and len(text) <= MAX_HEADING_LENGTH:
+            chapter, section = text, ""
+        elif isinstance(element, Title):
+            section = text
+        sections.append((chapter, section))
+    return sections
+
+
+def _chunk_id(chunk: Element, index: int) -> str:
+    """
+    Create a deterministic id for a chunk, so re-running ingestion on the same
+    file and config reproduces the same ids regardless of worker scheduling.
+
+    Args:
+        chunk (Element): The chunked element.
+        index (int): The position of the chunk within its file.
+
+    Returns:
+        str: A UUID string derived from the filename, position and text.
+    """
+    text_hash = hashlib.sha1((chunk.text or "").encode("utf-8")).hexdigest()
+    return str(
+        uuid.uuid5(uuid.NAMESPACE_URL, f"{chunk.metadata.filename}/{index}/{text_hash}")
+    )
 
 
 def _chunk_elements(elements: List[Element], **kwargs) -> List[Element]:
@@ -71,15 +150,23 @@ def _chunk_elements(elements: List[Element], **kwargs) -> List[Element]:
         **kwargs: Additional keyword arguments for chunking.
 
     Returns:
-        List[Element]: A list of chunked elements.
+        List[Element]: A list of chunked elements, with the chapter and section of each chunk in its metadata.
     """
-    chunked = chunk_elements(elements, **kwargs)
-    for c in chunked:
-        c.id_to_uuid()
-    ids = [c.id for c in chunked]
+    # Chunk each run of elements from one section separately, so no chunk spans sections
+    chunked = []
+    chunk_sections = []
+    for (chapter, section), group in groupby(
+        zip(elements, _index_sections(elements)), key=lambda pair: pair[1]
+    ):
+        section_chunks = chunk_elements([e for e, _ in group], **kwargs)
+        chunked.extend(section_chunks)
+        chunk_sections.extend([(chapter, section)] * len(section_chunks))
+    ids = [_chunk_id(c, i) for i, c in enumerate(chunked)]
     meta = [c.metadata.to_dict() for c in chunked]
 
-    for chunk in meta:
+    for chunk, (chapter, section) in zip(meta, chunk_sections):
+        chunk["chapter"] = chapter
+        chunk["section"] = section
         _keys = chunk.keys()
         if "languages" in _keys:
             chunk["languages"] = str(chunk["languages"])
@@ -94,28 +181,233 @@ def _chunk_elements(elements: List[Element], **kwargs) -> List[Element]:
     return (ids, meta, docs)
 
 
+def _process_pdf(
+    path: Path,
+    partition_config: Dict,
+    chunking_config: Dict,
+    partition_cache: Optional[PartitionCache] = None,
+) -> Tuple[List[str], List[Dict], List[str]]:
+    """
+    Partition and chunk a single PDF.  Defined at module level so it can be
+    dispatched to worker processes.
+
+    Args:
+        path (Path): The path to the PDF file.
+        partition_config (Dict): Configuration for partitioning.
+        chunking_config (Dict): Configuration for chunking.
+        partition_cache (PartitionCache, optional): Cache of previously partitioned files.
+
+    Returns:
+        Tuple[List[str], List[Dict], List[str]]: The ids, metadata and documents of the chunks.
+    """
+    partitioned = _partition_pdf(path, partition_cache, **partition_config)
+    return _chunk_elements(partitioned, **chunking_config)
+
+
+class IngestionConfig(TypedDict, total=False):
+    n_workers: int
+    batch_size: int
+    queue_size: int
+    partition_cache: bool
+    dedup: DedupConfig
+    lexical_index: bool
+
+
+@dataclass
+class IngestionBatch:
+    """
+    A batch of chunks from a single file, passed between the stages of the ingestion pipeline.
+
+    Attributes:
+        path (Path): The file the chunks came from.
+        ids (List[str]): The chunk ids.
+        metadatas (List[Dict]): The chunk metadata.
+        documents (List[str]): The chunk texts.
+        last (bool): Whether this is the final batch for the file.
+        embeddings (Optional[List]): The chunk embeddings, set by the embedding stage.
+        file_ids (List[str]): All chunk ids of the file, set on the final batch only.
+        content_hash (str): Hash of the file's content.
+        duplicate_of (Dict[str, str]): Ids of the file's chunks collapsed into kept chunks, mapped to the kept chunk id.  Set on the final batch only.
+        duplicate_sources (Dict[str, List[Dict]]): The filename and page of the collapsed chunks, keyed by kept chunk id.  Set on the final batch only.
+    """
+
+    path: Path
+    ids: List[str]
+    metadatas: List[Dict]
+    documents: List[str]
+    last: bool
+    embeddings: Optional[List] = None
+    file_ids: List[str] = field(default_factory=list)
+    content_hash: str = ""
+    duplicate_of: Dict[str, str] = field(default_factory=dict)
+    duplicate_sources: Dict[str, List[Dict]] = field(default_factory=dict)
+
+
+def _source(metadata: Dict) -> Dict:
+    return {
+        "filename": metadata.get("filename"),
+        "page_number": metadata.get("page_number"),
+    }
+
+
+T = TypeVar("T")
+
+_END = object()
+
+
+def _prefetch(iterable: Iterable[T], maxsize: int) -> Iterator[T]:
+    """
+    Consume an iterable in a background thread, holding at most maxsize items in a queue.
+    Lets a pipeline stage run ahead of its consumer without unbounded buffering.
+    Exceptions raised by the iterable are re-raised in the consumer.  When the consumer
+    stops early (it raised, or closed the generator), the background thread stops and
+    closes the iterable, so a stage holding a process pool shuts it down.
+
+    Args:
+        iterable (Iterable[T]): The stage to run in the background.
+        maxsize (int): Maximum number of items buffered between the stages.
+
+    Yields:
+        T: The items of the iterable, in order.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Time out regularly, so a full queue nobody reads does not block forever
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    break
+        except BaseException as e:
+            put(e)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+        put(_END)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while (item := buffer.get()) is not _END:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+class HNSWConfig(TypedDict, total=False):
+    space: str
+    M: int
+    construction_ef: int
+    search_ef: int
+    num_threads: int
+
+
+def hnsw_metadata(hnsw_config: Optional[HNSWConfig]) -> Dict[str, Any]:
+    """Map an HNSWConfig to the hnsw: prefixed collection metadata Chroma reads index parameters from."""
+    return {f"hnsw:{key}": value for key, value in (hnsw_config or {}).items()}
+
+
 class EmbeddingConfig(TypedDict):
     model_name: str
-    api_version: str
+    api_version: NotRequired[str]
+    backend: NotRequired[str]
+    batch_size: NotRequired[int]
+    device: NotRequired[str]
+    cache: NotRequired[bool]
+    scheduler: NotRequired[SchedulerConfig]
+
+
+EMBEDDING_BACKENDS = ["azure", "local"]
+
+
+def _setup_embedding_model(
+    embedding_config: EmbeddingConfig, cache_dir: Optional[Path] = None
+):
+    backend = embedding_config.get("backend", "azure")
+    assert (
+        backend in EMBEDDING_BACKENDS
+    ), f"Embedding backend ({backend}) must be one of {', '.join(EMBEDDING_BACKENDS)}"
+    if backend == "local":
+        assert (
+            "scheduler" not in embedding_config
+        ), "The scheduler only applies to the azure embedding backend"
+        embedding_function = LocalEmbeddingFunction(
+            model_name=embedding_config["model_name"],
+            batch_size=embedding_config.get("batch_size", 32),
+            device=embedding_config.get("device", "cpu"),
+        )
+    elif "scheduler" in embedding_config:
+        embedding_function = RateLimitedEmbeddingFunction(
+            model_name=embedding_config["model_name"],
+            api_version=embedding_config["api_version"],
+            scheduler_config=embedding_config["scheduler"],
+        )
+    else:
+        embedding_function = OpenAIEmbeddingFunction(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            model_name=embedding_config["model_name"],
+            api_version=embedding_config["api_version"],
+            api_base=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            deployment_id=embedding_config["model_name"],
+            api_type="azure",
+        )
+    if embedding_config.get("cache", False) and cache_dir is not None:
+        return CachedEmbeddingFunction(
+            embedding_function,
+            model_name=embedding_config["model_name"],
+            cache=EmbeddingCache(cache_dir),
+        )
+    return embedding_function
 
 
-def _setup_embedding_model(embedding_config: EmbeddingConfig):
-    return OpenAIEmbeddingFunction(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        model_name=embedding_config["model_name"],
-        api_version=embedding_config["api_version"],
-        api_base=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        deployment_id=embedding_config["model_name"],
-        api_type="azure",
+@cache_resource
+def _create_client(path: str):
+    return chromadb.PersistentClient(
+        path=path,
+        settings=Settings(anonymized_telemetry=False),
     )
 
 
+def resolve_store_path(version_path: Path) -> Path:
+    """
+    Follow VDB.parent links in the version's conf.yml to the version that owns the vector store.
+
+    Args:
+        version_path (Path): The version directory.
+
+    Returns:
+        Path: The directory of the version whose vdb folder holds the collection.
+    """
+    visited = [version_path.name]
+    while parent := OmegaConf.load(version_path / "conf.yml")["VDB"].get("parent"):
+        assert parent not in visited, f"Cycle in version parents: {visited + [parent]}"
+        visited.append(parent)
+        version_path = version_path.parent / parent
+    return version_path
+
+
 class VDB:
     """
     Class for managing a Vector Database (VDB).
     """
 
     vdb_folder = "vdb"
+    # Shared between all versions in the version directory
+    cache_folder = ".cache"
+    batch_size = 100
+    dedup_report_file = "dedup_report.json"
 
     def __init__(
         self,
@@ -124,6 +416,10 @@ class VDB:
         embedding_config: EmbeddingConfig,
         partition_config: Dict,
         chunking_config: Dict,
+        ingestion_config: Optional[IngestionConfig] = None,
+        parent: Optional[str] = None,
+        hnsw_config: Optional[HNSWConfig] = None,
+        shards: Optional[Dict[str, List[str]]] = None,
     ) -> None:
         """
         Initialize the VDB with specified configurations.
@@ -131,62 +427,511 @@ class VDB:
         Args:
             path (Path): The path to the VDB.
             collection (str): The name of the collection in the VDB.
-            embedding_config (EmbeddingConfig): Configuration for embedding function.
+            embedding_config (EmbeddingConfig): Configuration for embedding function.  Set backend to "local" to embed in-process with a sentence-transformers model_name (batch_size, device) instead of Azure OpenAI, cache to True to re-use embeddings of identical text across versions, and scheduler to embed with token-packed, rate-limited concurrent requests.
             partition_config (Dict): Configuration for partitioning.
             chunking_config (Dict): Configuration for chunking.
+            ingestion_config (IngestionConfig, optional): Configuration for the ingestion run, e.g. n_workers for parallel partitioning and partition_cache to re-use partitioned elements across versions, and lexical_index to maintain the BM25 index used for hybrid retrieval. Defaults to sequential ingestion.
+            parent (str, optional): A sibling version whose vector store is re-used read-only instead of building one for this version. Defaults to None.
+            hnsw_config (HNSWConfig, optional): HNSW index parameters (space, M, construction_ef, search_ef, num_threads) for a new collection. Defaults to Chroma's defaults.
+            shards (Dict[str, List[str]], optional): Shard names mapped to filename glob patterns.  Each shard is a separate collection named {collection}_{shard}, and each file goes to the first shard it matches. Defaults to a single unsharded collection.
         """
         self.path = path
+        self.parent = parent
+        self.store_path = (
+            resolve_store_path(self.path.parent / parent) if parent else self.path
+        )
+        self.collection_name = collection
+        self.embedding_config = embedding_config
+        self.shards = {
+            shard: list(patterns) for shard, patterns in (shards or {}).items()
+        }
+        if parent:
+            self._check_parent_compatible(collection, embedding_config)
         self.client = self._setup_client()
-        self.embedding_model = _setup_embedding_model(embedding_config)
-        if collection in [c.name for c in self.client.list_collections()]:
-            logger.info(f"Collection {collection} exists, retrieving...")
-            self.collection = self.client.get_collection(
-                collection, embedding_function=self.embedding_model
-            )
-        else:
-            logger.info(f"Collection {collection} does not exist, creating...")
-            self.collection = self.client.create_collection(
-                collection,
-                embedding_function=self.embedding_model,
-                # metadata={
-                #     "hnsw:construction_ef": 128,
-                #     "hnsw:search_ef": 128,
-                #     "hnsw:M": 128
-                # }
+        self.embedding_model = _setup_embedding_model(
+            embedding_config, cache_dir=self.path.parent / self.cache_folder
+        )
+        metadata = hnsw_metadata(hnsw_config)
+        self.collections: Dict[str, Collection] = {
+            shard: self._get_or_create_collection(
+                self._shard_collection_name(shard), metadata
             )
+            for shard in (self.shards or [UNSHARDED])
+        }
         self.partition_config = partition_config
         self.chunking_config = chunking_config
+        self.ingestion_config: IngestionConfig = (
+            dict(ingestion_config) if ingestion_config else {}
+        )
+        self.manifest = IngestionManifest(self.store_path / self.vdb_folder)
+        self.checkpoint = IngestionCheckpoint(self.store_path / self.vdb_folder)
+        self.partition_cache = (
+            PartitionCache(self.path.parent / self.cache_folder / "partitions")
+            if self.ingestion_config.get("partition_cache", False)
+            else None
+        )
+        self.lexical_index = (
+            LexicalIndex(self.store_path / self.vdb_folder)
+            if self.ingestion_config.get("lexical_index", False) and not self.read_only
+            else None
+        )
+
+    @property
+    def config_hash(self) -> str:
+        """Hash of the configuration that determines the chunks produced for a file."""
+        dedup = self.ingestion_config.get("dedup")
+        return config_hash(
+            self.partition_config,
+            self.chunking_config,
+            CHUNK_SCHEMA_VERSION,
+            *([dedup] if dedup is not None else []),
+            *([self.shards] if self.shards else []),
+        )
 
-    @cache_resource
-    def _setup_client(_self):
-        return chromadb.PersistentClient(
-            path=str(_self.path / _self.vdb_folder),
-            settings=Settings(anonymized_telemetry=False),
+    @property
+    def collection(self) -> Collection:
+        """The collection of an unsharded VDB."""
+        assert (
+            not self.shards
+        ), "A sharded VDB has one collection per shard, use collections instead"
+        return self.collections[UNSHARDED]
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the collections' contents: their count and the manifest's last write."""
+        manifest_path = self.manifest.storage_path
+        mtime = manifest_path.stat().st_mtime_ns if manifest_path.is_file() else 0
+        count = sum(collection.count() for collection in self.collections.values())
+        return f"{count}-{mtime}"
+
+    @property
+    def read_only(self) -> bool:
+        """Whether the vector store belongs to a parent version and must not be modified."""
+        return self.store_path != self.path
+
+    def _check_parent_compatible(
+        self, collection: str, embedding_config: EmbeddingConfig
+    ) -> None:
+        parent_config = OmegaConf.load(self.store_path / "conf.yml")["VDB"]
+        assert (
+            parent_config["collection"] == collection
+        ), f"Collection {collection} does not match parent collection {parent_config['collection']}"
+        assert (
+            to_plain(parent_config.get("shards") or {}) == self.shards
+        ), f"Shards {self.shards} do not match parent shards {parent_config.get('shards')}"
+        assert (
+            parent_config["embedding_config"]["model_name"]
+            == embedding_config["model_name"]
+        ), f"Embedding model {embedding_config['model_name']} does not match parent embedding model {parent_config['embedding_config']['model_name']}"
+
+    def _setup_client(self):
+        return _create_client(str(self.store_path / self.vdb_folder))
+
+    def _shard_collection_name(self, shard: str) -> str:
+        return f"{self.collection_name}_{shard}" if shard else self.collection_name
+
+    def _get_or_create_collection(
+        self, name: str, metadata: Dict[str, Any]
+    ) -> Collection:
+        if name in [c.name for c in self.client.list_collections()]:
+            logger.info(f"Collection {name} exists, retrieving...")
+            collection = self.client.get_collection(
+                name, embedding_function=self.embedding_model
+            )
+            existing = collection.metadata or {}
+            if any(existing.get(key) != value for key, value in metadata.items()):
+                logger.warning(
+                    f"Collection {name} was built with HNSW parameters {existing}, "
+                    f"not {metadata}; delete the vdb folder and re-vectorise to apply them"
+                )
+            return collection
+        assert (
+            not self.read_only
+        ), f"Collection {name} missing from parent version {self.store_path.name}"
+        logger.info(f"Collection {name} does not exist, creating...")
+        return self.client.create_collection(
+            name,
+            embedding_function=self.embedding_model,
+            metadata=metadata or None,
         )
 
+    def shard_of(self, filename: str) -> str:
+        """
+        The shard a file belongs to: the first shard with a matching filename pattern.
+
+        Args:
+            filename (str): The file name.
+
+        Returns:
+            str: The shard name, empty for an unsharded VDB.
+        """
+        if not self.shards:
+            return UNSHARDED
+        for shard, patterns in self.shards.items():
+            if any(fnmatch.fnmatch(filename, pattern) for pattern in patterns):
+                return shard
+        raise AssertionError(f"{filename} matches no shard in VDB.shards {self.shards}")
+
+    def _shard_collection(self, shard: str) -> Collection:
+        """The collection of a shard, including shards since removed from the config whose chunks must be deleted."""
+        if shard in self.collections:
+            return self.collections[shard]
+        return self.client.get_collection(
+            self._shard_collection_name(shard), embedding_function=self.embedding_model
+        )
+
+    def _iter_processed(
+        self, paths: List[Path]
+    ) -> Iterator[Tuple[List[str], List[Dict], List[str]]]:
+        """
+        Partition and chunk the given files, yielding results in input order.
+        Uses a process pool when ingestion_config.n_workers is greater than 1, keeping
+        at most two files per worker in flight so results never pile up in memory.
+
+        Args:
+            paths (List[Path]): List of paths to the PDF documents.
+
+        Yields:
+            Tuple[List[str], List[Dict], List[str]]: The ids, metadata and documents for each file.
+        """
+        n_workers = min(self.ingestion_config.get("n_workers", 1), len(paths))
+        if n_workers <= 1:
+            for path in paths:
+                yield _process_pdf(
+                    path,
+                    self.partition_config,
+                    self.chunking_config,
+                    self.partition_cache,
+                )
+            return
+        logger.info(f"Partitioning {len(paths)} files with {n_workers} workers")
+        # spawn rather than fork, torch and the layout models are not fork safe
+        with ProcessPoolExecutor(
+            max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            pending = deque()
+            try:
+                for path in paths:
+                    pending.append(
+                        executor.submit(
+                            _process_pdf,
+                            path,
+                            self.partition_config,
+                            self.chunking_config,
+                            self.partition_cache,
+                        )
+                    )
+                    if len(pending) >= 2 * n_workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # Don't partition files nobody will consume if ingestion stopped early
+                for future in pending:
+                    future.cancel()
+
+    def _iter_batches(self, paths: List[Path]) -> Iterator[IngestionBatch]:
+        """
+        Split the chunks of each processed file into batches for embedding.  Chunks the
+        checkpoint records as already committed by an interrupted run are left out.
+        """
+        batch_size = self.ingestion_config.get("batch_size", self.batch_size)
+        current_config_hash = self.config_hash
+        for path, (ids, meta, docs) in zip(paths, self._iter_processed(paths)):
+            if self.shards:
+                shard = self.shard_of(path.name)
+                for chunk in meta:
+                    chunk["shard"] = shard
+            content_hash = file_hash(path)
+            committed = self.checkpoint.committed_ids(
+                path.name, content_hash, current_config_hash
+            )
+            if committed:
+                logger.info(
+                    f"Resuming {path.name}: {len(committed)} of {len(ids)} chunks already committed"
+                )
+            starts = range(0, len(ids), batch_size) if ids else [0]
+            for i in starts:
+                last = i + batch_size >= len(ids)
+                keep = [
+                    j
+                    for j in range(i, min(i + batch_size, len(ids)))
+                    if ids[j] not in committed
+                ]
+                yield IngestionBatch(
+                    path=path,
+                    ids=[ids[j] for j in keep],
+                    metadatas=[meta[j] for j in keep],
+                    documents=[docs[j] for j in keep],
+                    last=last,
+                    file_ids=ids if last else [],
+                    content_hash=content_hash,
+                )
+
+    def _dedup_batches(
+        self, batches: Iterable[IngestionBatch], dedup_config: DedupConfig
+    ) -> Iterator[IngestionBatch]:
+        """
+        Drop chunks that are near-duplicates of a chunk already in the collection or earlier
+        in this run, before they are embedded.  Kept chunks record their SimHash and sources
+        in metadata; the sources of dropped chunks are added to the kept chunk once the file
+        is committed.
+        """
+        shingle_size = dedup_config.get("shingle_size", 3)
+        # Chunks are only collapsed into chunks of the same shard
+        indexes = {}
+        for shard, collection in self.collections.items():
+            indexes[shard] = SimHashIndex(dedup_config.get("max_distance", 3))
+            for chunk_id, metadata in zip(
+                *self._get_all(
+                    collection, include=["metadatas"], keys=["ids", "metadatas"]
+                )
+            ):
+                if metadata and metadata.get("simhash"):
+                    indexes[shard].add(chunk_id, int(metadata["simhash"], 16))
+        self.dedup_report = DedupReport()
+        duplicate_of: Dict[str, str] = {}
+        duplicate_sources: Dict[str, List[Dict]] = {}
+        for batch in batches:
+            index = indexes[self.shard_of(batch.path.name)]
+            keep = []
+            for j, (chunk_id, metadata, document) in enumerate(
+                zip(batch.ids, batch.metadatas, batch.documents)
+            ):
+                fingerprint = simhash(document, shingle_size)
+                duplicate = index.find(fingerprint)
+                self.dedup_report.record(batch.path.name, document, duplicate)
+                if duplicate is None:
+                    index.add(chunk_id, fingerprint)
+                    metadata["simhash"] = f"{fingerprint:016x}"
+                    metadata["sources"] = json.dumps([_source(metadata)])
+                    keep.append(j)
+                else:
+                    duplicate_of[chunk_id] = duplicate[0]
+                    duplicate_sources.setdefault(duplicate[0], []).append(
+                        _source(metadata)
+                    )
+            batch.ids = [batch.ids[j] for j in keep]
+            batch.metadatas = [batch.metadatas[j] for j in keep]
+            batch.documents = [batch.documents[j] for j in keep]
+            if batch.last:
+                batch.file_ids = [i for i in batch.file_ids if i not in duplicate_of]
+                batch.duplicate_of = duplicate_of
+                batch.duplicate_sources = duplicate_sources
+                duplicate_of, duplicate_sources = {}, {}
+            yield batch
+
+    def _get_all(
+        self, collection: Collection, include: List[str], keys: List[str]
+    ) -> List[List]:
+        """Page through a whole collection, returning the requested keys of every chunk."""
+        results: List[List] = [[] for _ in keys]
+        for offset in range(0, collection.count(), 1000):
+            page = collection.get(include=include, limit=1000, offset=offset)
+            for values, key in zip(results, keys):
+                values.extend(page[key])
+        return results
+
+    def _update_sources(
+        self,
+        collection: Collection,
+        ids: List[str],
+        update: Callable[[str, List[Dict]], List[Dict]],
+    ) -> None:
+        """Rewrite the sources metadata of kept chunks."""
+        for i in range(0, len(ids), self.batch_size):
+            existing = collection.get(
+                ids=ids[i : i + self.batch_size], include=["metadatas"]
+            )
+            collection.update(
+                ids=existing["ids"],
+                metadatas=[
+                    {
+                        **metadata,
+                        "sources": json.dumps(
+                            update(chunk_id, json.loads(metadata.get("sources", "[]")))
+                        ),
+                    }
+                    for chunk_id, metadata in zip(
+                        existing["ids"], existing["metadatas"]
+                    )
+                ],
+            )
+
+    def _embed_batches(
+        self, batches: Iterable[IngestionBatch], group_size: int
+    ) -> Iterator[IngestionBatch]:
+        """
+        Embed the documents of each batch.  Up to group_size consecutive batches, across
+        files, are embedded in one call, so a rate-limited scheduler can pack their chunks
+        into requests and send them concurrently instead of one round trip per batch.
+        """
+        group: List[IngestionBatch] = []
+        for batch in batches:
+            group.append(batch)
+            if len(group) >= group_size:
+                yield from self._embed_group(group)
+                group = []
+        yield from self._embed_group(group)
+
+    def _embed_group(self, group: List[IngestionBatch]) -> List[IngestionBatch]:
+        documents = [document for batch in group for document in batch.documents]
+        if documents:
+            embeddings = self.embedding_model(documents)
+            offset = 0
+            for batch in group:
+                if batch.documents:
+                    batch.embeddings = embeddings[
+                        offset : offset + len(batch.documents)
+                    ]
+                    offset += len(batch.documents)
+        return group
+
+    def _delete_ids(self, collection: Collection, ids: List[str]) -> None:
+        for i in range(0, len(ids), self.batch_size):
+            collection.delete(ids=ids[i : i + self.batch_size])
+        if self.lexical_index is not None:
+            self.lexical_index.delete(ids)
+
     def add_pdfs(self, paths: List[Path]):
         """
         Add PDF documents to the collection after partitioning and chunking.
+        Runs as a streaming pipeline: partition/chunk, embed and add run concurrently,
+        connected by bounded queues, so memory stays flat regardless of the number of files.
+        Each committed batch is written to the checkpoint, so an interrupted run resumes
+        from the last committed batch, and each file is recorded in the manifest once all
+        of its chunks are in the collection.
 
         Args:
             paths (List[Path]): List of paths to the PDF documents.
         """
-        ids = []
-        meta = []
-        docs = []
-        for path in tqdm.tqdm(paths, "Chunking documents"):
-            partitioned = _partition_pdf(path, **self.partition_config)
-            new_ids, new_meta, new_docs = _chunk_elements(
-                partitioned, **self.chunking_config
+        assert not self.read_only, READ_ONLY_ERROR.format(self.store_path.name)
+        queue_size = self.ingestion_config.get("queue_size", 4)
+        current_config_hash = self.config_hash
+        dedup_config = self.ingestion_config.get("dedup")
+        batches = self._iter_batches(paths)
+        if dedup_config is not None:
+            batches = self._dedup_batches(batches, dedup_config)
+        batches = _prefetch(
+            self._embed_batches(_prefetch(batches, queue_size), queue_size),
+            queue_size,
+        )
+        with tqdm.tqdm(
+            total=len(paths), desc="Vectorising documents"
+        ) as progress, closing(batches):
+            for batch in batches:
+                shard = self.shard_of(batch.path.name)
+                collection = self.collections[shard]
+                if batch.ids:
+                    collection.add(
+                        ids=batch.ids,
+                        metadatas=batch.metadatas,
+                        documents=batch.documents,
+                        embeddings=batch.embeddings,
+                    )
+                    if self.lexical_index is not None:
+                        self.lexical_index.add(batch.ids, batch.documents, shard)
+                    self.checkpoint.commit(
+                        batch.path.name,
+                        batch.content_hash,
+                        current_config_hash,
+                        batch.ids,
+                    )
+                if batch.last:
+                    if batch.duplicate_sources:
+                        self._update_sources(
+                            collection,
+                            list(batch.duplicate_sources),
+                            lambda chunk_id, sources: sources
+                            + batch.duplicate_sources[chunk_id],
+                        )
+                    self.manifest.record(
+                        batch.path.name,
+                        batch.content_hash,
+                        current_config_hash,
+                        batch.file_ids,
+                        batch.duplicate_of,
+                        shard,
+                    )
+                    self.manifest.save()
+                    self.checkpoint.complete(batch.path.name)
+                    progress.update()
+        if isinstance(self.embedding_model, CachedEmbeddingFunction):
+            logger.info(f"Embedding cache: {self.embedding_model.stats()}")
+        if dedup_config is not None:
+            report = self.dedup_report.to_dict()
+            logger.info(
+                f"Dedup removed {report['removed']} of {report['chunks']} chunks "
+                f"({report['exact']} exact, {report['near']} near duplicates)"
+            )
+            self.dedup_report.save(
+                self.store_path / self.vdb_folder / self.dedup_report_file
+            )
+
+    def sync_pdfs(self, paths: List[Path]) -> SyncPlan:
+        """
+        Bring the collection up to date with the given PDF documents.  Only files that are
+        new, or whose content or partition/chunking config has changed, are processed.
+        Chunks of changed and removed files, and any chunks not tracked by the manifest,
+        are deleted, except those the checkpoint records as committed by an interrupted
+        run for files that are still to be added.
+
+        Args:
+            paths (List[Path]): List of paths to all PDF documents that should be in the collection.
+
+        Returns:
+            SyncPlan: The files that were added, removed and left unchanged.
+        """
+        assert not self.read_only, READ_ONLY_ERROR.format(self.store_path.name)
+        plan = self.manifest.plan(paths, self.config_hash)
+        logger.info(
+            f"{len(plan.to_add)} files to vectorise, {len(plan.to_remove)} to remove, "
+            f"{len(plan.unchanged)} unchanged"
+        )
+        stale: Dict[str, List[str]] = {}
+        kept_ids: Dict[str, Tuple[str, Set[str]]] = {}
+        for name in plan.to_remove:
+            record = self.manifest.records[name]
+            shard = record.get("shard", UNSHARDED)
+            kept_ids[name] = (shard, set(record.get("duplicate_of", {}).values()))
+            stale.setdefault(shard, []).extend(self.manifest.remove(name))
+        stale_ids = {i for ids in stale.values() for i in ids}
+        current_config_hash = self.config_hash
+        resumable = set()
+        for path in plan.to_add:
+            resumable |= self.checkpoint.committed_ids(
+                path.name, file_hash(path), current_config_hash
+            )
+        to_add_names = {path.name for path in plan.to_add}
+        for name in list(self.checkpoint.records):
+            if name not in to_add_names:
+                self.checkpoint.complete(name)
+        if resumable:
+            logger.info(
+                f"Resuming from checkpoint, {len(resumable)} chunks already committed"
             )
-            ids.extend(new_ids)
-            meta.extend(new_meta)
-            docs.extend(new_docs)
-        chunk_size = 100
-        for i in tqdm.tqdm(range(0, len(ids), chunk_size), "Vectorising documents"):
-            # time.sleep(10)
-            self.collection.add(
-                ids=ids[i : i + chunk_size],
-                metadatas=meta[i : i + chunk_size],
-                documents=docs[i : i + chunk_size],
+        tracked = set(self.manifest.tracked_ids) | stale_ids | resumable
+        for shard, collection in self.collections.items():
+            untracked = [
+                i for i in collection.get(include=[])["ids"] if i not in tracked
+            ]
+            if untracked:
+                logger.warning(
+                    f"Removing {len(untracked)} chunks not tracked by the manifest"
+                )
+            stale.setdefault(shard, []).extend(untracked)
+        for shard, ids in stale.items():
+            self._delete_ids(self._shard_collection(shard), ids)
+        # Removed files no longer contribute sources to the chunks their duplicates collapsed into
+        for name, (shard, ids) in kept_ids.items():
+            self._update_sources(
+                self._shard_collection(shard),
+                list(ids.difference(stale_ids)),
+                lambda chunk_id, sources: [
+                    source for source in sources if source["filename"] != name
+                ],
             )
+        self.manifest.save()
+        if plan.to_add:
+            self.add_pdfs(plan.to_add)
+        return plan
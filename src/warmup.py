@@ -0,0 +1,206 @@
+"""
+Module for warming up app versions in the background when the server starts.
+
+The cross-encoder, the Chroma client and its HNSW index, and the tiktoken encoding are all
+loaded lazily, so after a deploy or restart the first question would otherwise wait for
+them.  Warm-up builds each version's VDB and Retriever in a background thread, loads
+the cross-encoders, and runs a dummy query through Retriever.query, so every configured
+stage is exercised (compact or HNSW index, lexical index, reranking).  The dummy query
+bypasses the query, result and embedding caches, so it leaves no entries and no hits or
+misses in them.  The
+loaded resources are shared through cache_resource, so later sessions reuse them.  The
+dummy query costs one embedding call per version.  Versions with a compact index never
+load Chroma's HNSW index, which keeps the memory saving of the compact index.
+
+Which versions are warmed up is set with the RAG_WARMUP environment variable: DEFAULT (the
+VersionManager default version), ALL or OFF.
+
+Classes:
+    WarmupMode: Enum for the versions warmed up at server start.
+    WarmupStatus: Progress and stage timings of the warm-up of each version.
+
+Functions:
+    warm_up_version: Load a version's pipeline and run a dummy query through each stage.
+    start_warmup: Start warming up versions in a background thread, once per server process.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from omegaconf import OmegaConf
+
+from src.pipeline_versions import VersionManager
+from src.retriever import Retriever
+from src.util import cache_resource, estimate_token_count
+from src.vectordb import VDB
+
+logger = logging.getLogger(__name__)
+
+WARMUP_QUERY = "warm up"
+
+
+class WarmupMode(Enum):
+    """
+    Enum for the versions warmed up at server start, read from the RAG_WARMUP environment variable.
+    """
+
+    DEFAULT = 0
+    ALL = 1
+    OFF = 2
+
+
+class WarmupStatus:
+    """
+    Progress and stage timings of the warm-up of each version, updated by the warm-up thread.
+
+    Args:
+        versions (List[str]): The versions to warm up, in order.
+    """
+
+    def __init__(self, versions: List[str]) -> None:
+        self.versions = versions
+        self.lock = threading.Lock()
+        self.timings: Dict[str, Dict[str, float]] = {v: {} for v in versions}
+        self.errors: Dict[str, str] = {}
+        self.current: Optional[str] = None
+        self.started = time.time()
+        self.finished: Optional[float] = None
+
+    def record(self, version: str, stage: str, seconds: float) -> None:
+        """Record how long a stage of a version's warm-up took."""
+        with self.lock:
+            self.timings[version][stage] = round(seconds, 3)
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        """Return the state, total seconds and seconds per stage of each version."""
+        with self.lock:
+            stats = {}
+            for version in self.versions:
+                if version in self.errors:
+                    state = f"failed: {self.errors[version]}"
+                elif version == self.current:
+                    state = "running"
+                elif self.timings[version]:
+                    state = "done"
+                else:
+                    state = "pending"
+                stats[version] = {
+                    "state": state,
+                    "total": round(sum(self.timings[version].values()), 3),
+                    **self.timings[version],
+                }
+            return stats
+
+
+def warm_up_version(
+    version_directory: Path, version: str, status: Optional[WarmupStatus] = None
+) -> Dict[str, float]:
+    """
+    Load a version's VDB, Retriever, cross-encoders and tokenizer, and run a dummy query through each.
+
+    Args:
+        version_directory (Path): The directory containing the versions.
+        version (str): The version to warm up.
+        status (WarmupStatus, optional): Records each stage's timing as it completes. Defaults to None.
+
+    Returns:
+        Dict[str, float]: Seconds taken by each stage.
+    """
+    timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(name: str):
+        start = time.perf_counter()
+        yield
+        timings[name] = time.perf_counter() - start
+        if status is not None:
+            status.record(version, name, timings[name])
+
+    config = OmegaConf.load(version_directory / version / "conf.yml")
+    with stage("vectordb"):
+        vdb = VDB(path=version_directory / version, **config["VDB"])
+    with stage("retriever"):
+        retriever = Retriever(vdb, **config["Retriever"])
+    if retriever.compact_index is None:
+        with stage("hnsw_index"):
+            # Chroma loads a collection's HNSW index on its first query
+            for collection in vdb.collections.values():
+                stored = collection.get(limit=1, include=["embeddings"])
+                if stored["ids"]:
+                    collection.query(
+                        query_embeddings=stored["embeddings"],
+                        n_results=1,
+                        include=["distances"],
+                    )
+    reranking = config["Retriever"].get("retrieval_config", {}).get("reranking")
+    if reranking:
+        with stage("cross_encoder"):
+            for reranker in [reranking, reranking.get("cascade")]:
+                if reranker and reranker.get("model"):
+                    retriever._instantiate_cross_encoder(
+                        reranker["model"],
+                        reranker.get("backend", "torch"),
+                        reranker.get("quantize", False),
+                        reranker.get("intra_op_threads"),
+                    ).predict([[WARMUP_QUERY, WARMUP_QUERY]])
+    with stage("query"):
+        # Bypasses the caches, so the dummy query is neither served to users nor counted in cache stats
+        retriever.query(WARMUP_QUERY, use_cache=False)
+    with stage("tokenizer"):
+        estimate_token_count(WARMUP_QUERY, model=config["RAG"]["model"])
+    return timings
+
+
+def _warm_up(version_directory: Path, status: WarmupStatus) -> None:
+    for version in status.versions:
+        status.current = version
+        try:
+            timings = warm_up_version(version_directory, version, status)
+            logger.info(
+                f"Warmed up {version} in {sum(timings.values()):.1f}s: {timings}"
+            )
+        except Exception as e:
+            logger.exception(f"Warm-up of {version} failed")
+            with status.lock:
+                status.errors[version] = repr(e)
+    status.current = None
+    status.finished = time.time()
+
+
+@cache_resource
+def start_warmup(version_directory: Path) -> WarmupStatus:
+    """
+    Start warming up the versions selected by RAG_WARMUP in a daemon thread.  Cached as a
+    resource, so the thread is started once per server process whichever page loads first.
+
+    Args:
+        version_directory (Path): The directory containing the versions.
+
+    Returns:
+        WarmupStatus: The warm-up progress, updated as the thread runs.
+    """
+    mode = WarmupMode[os.environ.get("RAG_WARMUP", "DEFAULT").upper()]
+    if mode == WarmupMode.OFF:
+        versions = []
+    else:
+        version_manager = VersionManager(version_directory)
+        versions = (
+            version_manager.app_versions
+            if mode == WarmupMode.ALL
+            else [version_manager.default]
+        )
+    status = WarmupStatus(versions)
+    threading.Thread(
+        target=_warm_up, args=(version_directory, status), name="warmup", daemon=True
+    ).start()
+    return status
@@ -0,0 +1,77 @@
+import time
+
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+
+from src.answer_cache import SemanticAnswerCache
+
+CONTEXT = {"ids": [["a"]], "documents": [["Payment is due in 30 days."]]}
+
+
+def completion(content="Within 30 days."):
+    return ChatCompletion(
+        id="test",
+        choices=[
+            Choice(
+                finish_reason="stop",
+                index=0,
+                message=ChatCompletionMessage(role="assistant", content=content),
+            )
+        ],
+        created=0,
+        model="gpt-35-turbo-16k",
+        object="chat.completion",
+        usage=CompletionUsage(
+            prompt_tokens=100, completion_tokens=10, total_tokens=110
+        ),
+    )
+
+
+def test_similar_question_hits_with_zero_usage(tmp_path):
+    cache = SemanticAnswerCache(tmp_path, threshold=0.9)
+    cache.put("when is payment due", [1.0, 0.0], "config", "1", completion(), CONTEXT)
+    response, context = cache.get([0.95, 0.1], "config", "1")
+    assert response.choices[0].message.content == "Within 30 days."
+    assert response.usage.prompt_tokens == 0
+    assert response.usage.completion_tokens == 0
+    assert context == CONTEXT
+    assert cache.stats()["hits"] == 1
+
+
+def test_question_below_threshold_misses(tmp_path):
+    cache = SemanticAnswerCache(tmp_path, threshold=0.9)
+    cache.put("when is payment due", [1.0, 0.0], "config", "1", completion(), CONTEXT)
+    assert cache.get([0.7, 0.7], "config", "1") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_config_hash_mismatch_misses(tmp_path):
+    cache = SemanticAnswerCache(tmp_path)
+    cache.put("when is payment due", [1.0, 0.0], "config", "1", completion(), CONTEXT)
+    assert cache.get([1.0, 0.0], "other config", "1") is None
+
+
+def test_fingerprint_change_invalidates(tmp_path):
+    cache = SemanticAnswerCache(tmp_path)
+    cache.put("when is payment due", [1.0, 0.0], "config", "1", completion(), CONTEXT)
+    assert cache.get([1.0, 0.0], "config", "2") is None
+    # Answers retrieved from an earlier collection are deleted on the next insert
+    cache.put("who signs", [0.0, 1.0], "config", "2", completion("Both."), None)
+    assert cache.stats()["size"] == 1
+    response, context = cache.get([0.0, 1.0], "config", "2")
+    assert response.choices[0].message.content == "Both."
+    assert context is None
+
+
+def test_expired_and_least_recently_used_answers_are_evicted(tmp_path):
+    cache = SemanticAnswerCache(tmp_path, maxsize=2, ttl=60)
+    cache.put("first", [1.0, 0.0, 0.0], "config", "1", completion("1"), None)
+    cache.put("second", [0.0, 1.0, 0.0], "config", "1", completion("2"), None)
+    assert cache.get([1.0, 0.0, 0.0], "config", "1") is not None
+    cache.put("third", [0.0, 0.0, 1.0], "config", "1", completion("3"), None)
+    assert cache.get([0.0, 1.0, 0.0], "config", "1") is None
+    assert cache.get([1.0, 0.0, 0.0], "config", "1") is not None
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get([0.0, 0.0, 1.0], "config", "1") is None
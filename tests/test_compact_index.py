@@ -0,0 +1,65 @@
+import uuid
+
+import chromadb
+import numpy as np
+import pytest
+from chromadb.config import Settings
+
+from src.compact_index import CompactIndex
+
+
+def make_collection(space, embeddings):
+    client = chromadb.EphemeralClient(Settings(anonymized_telemetry=False))
+    collection = client.create_collection(
+        f"test_{uuid.uuid4().hex}", metadata={"hnsw:space": space}
+    )
+    collection.add(
+        ids=[str(i) for i in range(len(embeddings))],
+        embeddings=embeddings.tolist(),
+    )
+    return collection
+
+
+def exact_neighbours(embeddings, query, space, k):
+    if space == "cosine":
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        distances = 1 - embeddings @ (query / np.linalg.norm(query))
+    else:
+        distances = ((embeddings - query) ** 2).sum(axis=1)
+    order = np.argsort(distances)[:k]
+    return [str(i) for i in order], distances[order]
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine"])
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_search_matches_exact_neighbours(tmp_path, space, dtype):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(300, 16)).astype(np.float32)
+    index = CompactIndex(tmp_path, dtype)
+    index.build(make_collection(space, embeddings), "v1")
+    index.load()
+    queries = rng.normal(size=(3, 16)).astype(np.float32)
+    ids, distances = index.search(queries, n_results=5, rescore_candidates=100)
+    for query, result_ids, result_distances in zip(queries, ids, distances):
+        expected_ids, expected_distances = exact_neighbours(embeddings, query, space, 5)
+        assert result_ids == expected_ids
+        np.testing.assert_allclose(result_distances, expected_distances, rtol=1e-4)
+
+
+def test_fingerprint_identifies_the_build(tmp_path):
+    index = CompactIndex(tmp_path)
+    assert index.fingerprint is None
+    embeddings = np.eye(4, dtype=np.float32)
+    index.build(make_collection("l2", embeddings), "v1")
+    assert index.fingerprint == "v1"
+    index.build(make_collection("l2", embeddings), "v2")
+    assert index.fingerprint == "v2"
+    assert [path.name for path in tmp_path.iterdir()] == ["compact_index_int8"]
+
+
+def test_empty_collection(tmp_path):
+    client = chromadb.EphemeralClient(Settings(anonymized_telemetry=False))
+    collection = client.create_collection(f"test_{uuid.uuid4().hex}")
+    index = CompactIndex(tmp_path)
+    index.build(collection, "empty")
+    assert index.load().search(np.ones((1, 4)), n_results=3) == ([[]], [[]])
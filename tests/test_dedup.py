@@ -0,0 +1,59 @@
+from src.dedup import DedupReport, SimHashIndex, simhash
+
+CLAUSE = (
+    "This agreement is confidential. The receiving party shall not disclose confidential "
+    "information of the disclosing party to any third party without prior written "
+    "consent, and shall use it only for the purpose of performing its obligations under "
+    "this agreement. These obligations survive termination of this agreement for a "
+    "period of five years."
+)
+OTHER_CLAUSE = (
+    "The supplier shall deliver the goods to the premises of the customer within thirty "
+    "days of the purchase order, at its own cost and risk, packed in accordance with good "
+    "industry practice."
+)
+
+
+def test_simhash_ignores_case_whitespace_and_punctuation():
+    assert simhash(CLAUSE) == simhash("  " + CLAUSE.upper().replace(".", "!"))
+
+
+def test_simhash_of_near_duplicates_is_close():
+    near = (simhash(CLAUSE) ^ simhash(CLAUSE.replace("five", "seven"))).bit_count()
+    far = (simhash(CLAUSE) ^ simhash(OTHER_CLAUSE)).bit_count()
+    assert near <= 8 < far
+
+
+def test_index_collapses_near_duplicates_into_closest_chunk():
+    index = SimHashIndex(max_distance=8)
+    index.add("clause", simhash(CLAUSE))
+    index.add("other", simhash(OTHER_CLAUSE))
+    assert index.find(simhash(CLAUSE)) == ("clause", 0)
+    chunk_id, distance = index.find(simhash(CLAUSE.replace("five", "seven")))
+    assert chunk_id == "clause" and 0 < distance <= 8
+    assert index.find(simhash("Payment is due within sixty days of invoice.")) is None
+
+
+def test_index_finds_every_fingerprint_within_max_distance():
+    index = SimHashIndex(max_distance=3)
+    fingerprint = simhash(CLAUSE)
+    index.add("clause", fingerprint)
+    # Flip bits spread over different bands, and all in one band
+    for bits in [(0, 20, 40), (1, 2, 3), (63,)]:
+        flipped = fingerprint
+        for bit in bits:
+            flipped ^= 1 << bit
+        assert index.find(flipped) == ("clause", len(bits))
+    assert index.find(fingerprint ^ 0b1111) is None
+
+
+def test_report_counts_exact_and_near_duplicates():
+    report = DedupReport()
+    report.record("a.pdf", "kept", None)
+    report.record("b.pdf", "copy", ("a0", 0))
+    report.record("b.pdf", "close copy", ("a0", 2))
+    summary = report.to_dict()
+    assert summary["removed"] == 2 and summary["exact"] == 1 and summary["near"] == 1
+    assert summary["characters_removed"] == len("copy") + len("close copy")
+    assert summary["files"]["b.pdf"] == {"chunks": 2, "duplicates": 2}
+    assert summary["most_duplicated"] == {"a0": 2}
@@ -0,0 +1,70 @@
+from src import embedding_scheduler
+from src.embedding_scheduler import RateLimitedEmbeddingFunction, pack_batches
+
+
+def test_pack_batches_respects_token_limit():
+    assert pack_batches([3, 3, 3, 3], 6, 10) == [[0, 1], [2, 3]]
+
+
+def test_pack_batches_respects_text_limit():
+    assert pack_batches([1] * 5, 100, 2) == [[0, 1], [2, 3], [4]]
+
+
+def test_pack_batches_gives_oversized_text_its_own_batch():
+    assert pack_batches([2, 10, 2], 5, 10) == [[0], [1], [2]]
+
+
+def test_pack_batches_keeps_every_text_in_order():
+    token_counts = [5, 1, 7, 2, 2, 9, 1, 3]
+    batches = pack_batches(token_counts, 8, 3)
+    assert [i for batch in batches for i in batch] == list(range(len(token_counts)))
+    for batch in batches:
+        assert len(batch) <= 3
+        assert len(batch) == 1 or sum(token_counts[i] for i in batch) <= 8
+
+
+class CharacterEncoding:
+    """Stands in for a tiktoken encoding, which also rejects special tokens by default."""
+
+    def encode_batch(self, texts, disallowed_special="all"):
+        if disallowed_special and any("<|endoftext|>" in text for text in texts):
+            raise ValueError(
+                "Encountered text corresponding to disallowed special token"
+            )
+        return [list(text) for text in texts]
+
+
+def fake_embedding_function(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "test")
+    monkeypatch.setattr(embedding_scheduler, "_encoding", lambda _: CharacterEncoding())
+    embedding_function = RateLimitedEmbeddingFunction(
+        "text-embedding-ada-002",
+        "2023-12-01-preview",
+        {"endpoint": "http://localhost:8765", "max_texts_per_batch": 2},
+    )
+    requests = []
+
+    async def embed_batch(client, semaphore, texts, n_tokens):
+        requests.append((client, texts))
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(embedding_function, "_embed_batch", embed_batch)
+    return embedding_function, requests
+
+
+def test_embeddings_keep_text_order(monkeypatch):
+    embedding_function, requests = fake_embedding_function(monkeypatch)
+    assert embedding_function(["a", "bb", "ccc"]) == [[1.0], [2.0], [3.0]]
+    assert [texts for _, texts in requests] == [["a", "bb"], ["ccc"]]
+
+
+def test_special_tokens_are_embedded_as_text(monkeypatch):
+    embedding_function, _ = fake_embedding_function(monkeypatch)
+    assert embedding_function(["end of page <|endoftext|>"]) == [[25.0]]
+
+
+def test_client_is_reused_between_calls(monkeypatch):
+    embedding_function, requests = fake_embedding_function(monkeypatch)
+    embedding_function(["a"])
+    embedding_function(["b"])
+    assert requests[0][0] is requests[1][0]
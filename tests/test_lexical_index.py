@@ -0,0 +1,55 @@
+from src.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_compound_terms_and_their_parts():
+    assert tokenize("The Clause 12.3 of the Co-Borrower") == [
+        "clause",
+        "12.3",
+        "12",
+        "3",
+        "co-borrower",
+        "co",
+        "borrower",
+    ]
+
+
+def test_reciprocal_rank_fusion_orders_by_summed_reciprocal_rank():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b", "d"]], k=1)
+    # b: 1/3 + 1/3, c: 1/4 + 1/2, a: 1/2, d: 1/4
+    assert fused == ["c", "b", "a", "d"]
+
+
+def test_reciprocal_rank_fusion_breaks_ties_by_first_seen():
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "a"]]) == ["a", "b"]
+
+
+def test_search_ranks_rare_terms_higher(tmp_path):
+    index = LexicalIndex(tmp_path)
+    index.add(
+        ["a", "b", "c"],
+        ["payment terms of the loan", "payment of interest", "termination clause 12.3"],
+        "s",
+    )
+    assert [chunk_id for chunk_id, _, _ in index.search("clause 12.3", 3)] == ["c"]
+    hits = index.search("loan payment", 3)
+    assert [chunk_id for chunk_id, _, _ in hits] == ["a", "b"]
+    assert hits[0][1] == "s"
+    assert index.search("loan", 3, shards=["other"]) == []
+    assert index.search("the of", 3) == []
+
+
+def test_add_replaces_and_delete_removes(tmp_path):
+    index = LexicalIndex(tmp_path)
+    index.add(["a", "b"], ["old text", "other text"])
+    index.add(["a"], ["new text"])
+    assert index.count() == 2
+    assert index.search("old", 1) == []
+    index.delete(["b"])
+    assert index.ids() == {"a"}
+
+
+def test_fingerprint_is_stored(tmp_path):
+    index = LexicalIndex(tmp_path)
+    assert index.fingerprint is None
+    index.set_fingerprint("3-1.0")
+    assert LexicalIndex(tmp_path).fingerprint == "3-1.0"
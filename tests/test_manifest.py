@@ -0,0 +1,126 @@
+import json
+
+from src.manifest import IngestionCheckpoint, IngestionManifest
+from src.util import file_hash
+
+
+def write(path, text):
+    path.write_text(text)
+    return path
+
+
+def test_plan_sorts_files_into_add_remove_and_unchanged(tmp_path):
+    files = tmp_path / "files"
+    files.mkdir()
+    unchanged = write(files / "unchanged.pdf", "same")
+    changed = write(files / "changed.pdf", "old")
+    manifest = IngestionManifest(tmp_path / "vdb")
+    for path in [unchanged, changed]:
+        manifest.record(path.name, file_hash(path), "config", [f"{path.stem}-0"])
+    manifest.record("removed.pdf", "hash", "config", ["removed-0"])
+    write(changed, "new")
+    new = write(files / "new.pdf", "new file")
+
+    plan = manifest.plan([unchanged, changed, new], "config")
+    assert plan.unchanged == ["unchanged.pdf"]
+    assert plan.to_add == [changed, new]
+    assert sorted(plan.to_remove) == ["changed.pdf", "removed.pdf"]
+
+
+def test_plan_re_adds_files_when_config_changes(tmp_path):
+    path = write(tmp_path / "a.pdf", "text")
+    manifest = IngestionManifest(tmp_path / "vdb")
+    manifest.record(path.name, file_hash(path), "config", ["a-0"])
+    plan = manifest.plan([path], "other config")
+    assert plan.to_add == [path]
+    assert plan.to_remove == ["a.pdf"]
+    assert plan.unchanged == []
+
+
+def test_save_and_reload(tmp_path):
+    manifest = IngestionManifest(tmp_path / "vdb")
+    manifest.record("a.pdf", "hash", "config", ["a-0", "a-1"])
+    manifest.record("b.pdf", "hash", "config", ["b-0"])
+    manifest.save()
+    reloaded = IngestionManifest(tmp_path / "vdb")
+    assert reloaded.records == manifest.records
+    assert reloaded.remove("a.pdf") == ["a-0", "a-1"]
+    assert reloaded.tracked_ids == ["b-0"]
+
+
+def test_checkpoint_resumes_committed_ids(tmp_path):
+    checkpoint = IngestionCheckpoint(tmp_path)
+    checkpoint.commit("a.pdf", "file-1", "config-1", ["a0", "a1"])
+    checkpoint.commit("a.pdf", "file-1", "config-1", ["a2"])
+    checkpoint.commit("b.pdf", "file-2", "config-1", ["b0"])
+    reloaded = IngestionCheckpoint(tmp_path)
+    assert reloaded.committed_ids("a.pdf", "file-1", "config-1") == {"a0", "a1", "a2"}
+    assert reloaded.committed_ids("b.pdf", "file-2", "config-1") == {"b0"}
+
+
+def test_checkpoint_ignores_changed_file_or_config(tmp_path):
+    checkpoint = IngestionCheckpoint(tmp_path)
+    checkpoint.commit("a.pdf", "file-1", "config-1", ["a0"])
+    assert checkpoint.committed_ids("a.pdf", "file-2", "config-1") == set()
+    assert checkpoint.committed_ids("a.pdf", "file-1", "config-2") == set()
+    checkpoint.commit("a.pdf", "file-2", "config-1", ["a1"])
+    reloaded = IngestionCheckpoint(tmp_path)
+    assert reloaded.committed_ids("a.pdf", "file-2", "config-1") == {"a1"}
+
+
+def test_checkpoint_appends_one_line_per_batch(tmp_path):
+    checkpoint = IngestionCheckpoint(tmp_path)
+    for i in range(3):
+        checkpoint.commit("a.pdf", "file-1", "config-1", [f"a{i}"])
+    lines = checkpoint.storage_path.read_text().splitlines()
+    assert [json.loads(line)["ids"] for line in lines] == [["a0"], ["a1"], ["a2"]]
+
+
+def test_checkpoint_skips_incomplete_last_line(tmp_path):
+    checkpoint = IngestionCheckpoint(tmp_path)
+    checkpoint.commit("a.pdf", "file-1", "config-1", ["a0"])
+    with open(checkpoint.storage_path, "a") as file:
+        file.write('{"name": "a.pdf", "file_ha')
+    reloaded = IngestionCheckpoint(tmp_path)
+    assert reloaded.committed_ids("a.pdf", "file-1", "config-1") == {"a0"}
+
+
+def test_checkpoint_compacts_and_removes_completed_files(tmp_path):
+    checkpoint = IngestionCheckpoint(tmp_path)
+    checkpoint.commit("a.pdf", "file-1", "config-1", ["a0"])
+    checkpoint.commit("a.pdf", "file-1", "config-1", ["a1"])
+    checkpoint.commit("b.pdf", "file-2", "config-1", ["b0"])
+    checkpoint.complete("b.pdf")
+    assert len(checkpoint.storage_path.read_text().splitlines()) == 1
+    assert IngestionCheckpoint(tmp_path).records == {
+        "a.pdf": {
+            "file_hash": "file-1",
+            "config_hash": "config-1",
+            "committed": ["a0", "a1"],
+        }
+    }
+    checkpoint.complete("a.pdf")
+    assert not checkpoint.storage_path.exists()
+
+
+def test_plan_reprocesses_files_whose_kept_chunks_are_removed(tmp_path):
+    paths = []
+    for name in ["a.pdf", "b.pdf", "c.pdf"]:
+        path = tmp_path / name
+        path.write_text(name)
+        paths.append(path)
+    manifest = IngestionManifest(tmp_path / "vdb")
+    manifest.record("a.pdf", file_hash(paths[0]), "config", ["a0"])
+    # b's duplicate chunk was collapsed into a's, c's into b's
+    manifest.record("b.pdf", file_hash(paths[1]), "config", ["b1"], {"b0": "a0"})
+    manifest.record("c.pdf", file_hash(paths[2]), "config", ["c1"], {"c0": "b1"})
+    manifest.record("d.pdf", "missing", "config", ["d0"])
+
+    plan = manifest.plan(paths[1:], "config")
+    assert sorted(plan.to_remove) == ["a.pdf", "b.pdf", "c.pdf", "d.pdf"]
+    assert plan.to_add == [paths[1], paths[2]]
+    assert plan.unchanged == []
+
+    plan = manifest.plan(paths, "config")
+    assert sorted(plan.to_remove) == ["d.pdf"]
+    assert plan.unchanged == ["a.pdf", "b.pdf", "c.pdf"]
@@ -0,0 +1,102 @@
+import time
+
+from src.embedding_cache import EmbeddingCache
+from src.query_cache import QueryEmbeddingCache, QueryResultCache
+
+
+class CountingEmbeddingFunction:
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), float(text.count(" "))] for text in texts]
+
+
+def test_repeated_query_is_embedded_once():
+    cache = QueryEmbeddingCache("model")
+    embed = CountingEmbeddingFunction()
+    first = cache.embed(["What is the notice period?"], embed)
+    assert cache.embed(["What is the notice period?"], embed) == first
+    assert embed.embedded == ["What is the notice period?"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_original_text_is_embedded_and_shared_by_normalised_variants():
+    cache = QueryEmbeddingCache("model")
+    embed = CountingEmbeddingFunction()
+    embeddings = cache.embed(["What  is X?", "what is x?"], embed)
+    assert embed.embedded == ["What  is X?"]
+    assert embeddings[0] == embeddings[1] == [11.0, 3.0]
+
+
+def test_entries_expire_after_ttl():
+    cache = QueryEmbeddingCache("model", ttl=0.05)
+    embed = CountingEmbeddingFunction()
+    cache.embed(["question"], embed)
+    time.sleep(0.1)
+    cache.embed(["question"], embed)
+    assert embed.embedded == ["question", "question"]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryEmbeddingCache("model", maxsize=2)
+    embed = CountingEmbeddingFunction()
+    cache.embed(["a"], embed)
+    cache.embed(["b"], embed)
+    cache.embed(["a"], embed)
+    cache.embed(["c"], embed)
+    cache.embed(["a"], embed)
+    cache.embed(["b"], embed)
+    assert embed.embedded == ["a", "b", "c", "b"]
+
+
+def test_misses_fall_through_to_disk(tmp_path):
+    embed = CountingEmbeddingFunction()
+    QueryEmbeddingCache("model", disk=EmbeddingCache(tmp_path)).embed(["q"], embed)
+    restarted = QueryEmbeddingCache("model", disk=EmbeddingCache(tmp_path))
+    assert restarted.embed(["q"], embed) == [[1.0, 0.0]]
+    assert embed.embedded == ["q"]
+    assert restarted.stats()["disk_hits"] == 1
+    QueryEmbeddingCache("other-model", disk=EmbeddingCache(tmp_path)).embed(
+        ["q"], embed
+    )
+    assert embed.embedded == ["q", "q"]
+
+
+RESULT = {"ids": [["a", "b"]], "documents": [["A", "B"]]}
+
+
+def test_result_is_shared_by_normalised_variants():
+    cache = QueryResultCache()
+    cache.put(QueryResultCache.key("v1", "<p>What is X?</p>", None, "c"), "f", RESULT)
+    assert (
+        cache.get(QueryResultCache.key("v1", "what  is x?", None, "c"), "f") == RESULT
+    )
+    assert cache.stats()["hits"] == 1
+
+
+def test_result_key_includes_version_where_and_config():
+    key = QueryResultCache.key("v1", "q", {"chapter": "1"}, "c")
+    assert key != QueryResultCache.key("v2", "q", {"chapter": "1"}, "c")
+    assert key != QueryResultCache.key("v1", "q", {"chapter": "2"}, "c")
+    assert key != QueryResultCache.key("v1", "q", {"chapter": "1"}, "d")
+
+
+def test_result_is_invalidated_when_collection_changes():
+    cache = QueryResultCache()
+    key = QueryResultCache.key("v1", "q", None, "c")
+    cache.put(key, "f1", RESULT)
+    assert cache.get(key, "f2") is None
+    assert cache.get(key, "f1") is None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_result_is_copied_in_and_out():
+    cache = QueryResultCache()
+    key = QueryResultCache.key("v1", "q", None, "c")
+    result = {"ids": [["a"]]}
+    cache.put(key, "f", result)
+    result["ids"][0].append("b")
+    cache.get(key, "f")["ids"][0].append("c")
+    assert cache.get(key, "f") == {"ids": [["a"]]}
@@ -0,0 +1,319 @@
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+import chromadb
+import numpy as np
+import pytest
+from chromadb.config import Settings
+
+from src.embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+from src.lexical_index import LexicalIndex
+from src.retriever import (
+    Retriever,
+    maximal_marginal_relevance,
+    merge_query_results,
+    shards_from_where,
+)
+
+DIMENSION = 8
+
+
+def make_collection(ids, embeddings, metadatas=None, documents=None):
+    client = chromadb.EphemeralClient(Settings(anonymized_telemetry=False))
+    collection = client.create_collection(f"test_{uuid.uuid4().hex}")
+    collection.add(
+        ids=ids,
+        embeddings=embeddings,
+        documents=documents or ids,
+        metadatas=metadatas or [{"page_number": 1} for _ in ids],
+    )
+    return collection
+
+
+def test_compact_index_of_child_version_is_built_in_its_own_folder(tmp_path):
+    collection = make_collection(["a", "b"], np.eye(2).tolist())
+    parent, child = tmp_path / "parent", tmp_path / "child"
+    (parent / "vdb").mkdir(parents=True)
+    vdb = SimpleNamespace(
+        shards={},
+        path=child,
+        store_path=parent,
+        vdb_folder="vdb",
+        collection=collection,
+        fingerprint="parent-1",
+    )
+    retriever = Retriever(vdb, {"n_results": 1}, {"compact_index": {}})
+    assert retriever.compact_index.search(np.array([[1.0, 0.0]]), 1)[0] == [["a"]]
+    assert (child / "vdb" / "compact_index_int8").is_dir()
+    assert list((parent / "vdb").iterdir()) == []
+
+
+def test_shards_from_where():
+    assert shards_from_where(None) is None
+    assert shards_from_where({"page_number": 1}) is None
+    assert shards_from_where({"shard": "a"}) == {"a"}
+    assert shards_from_where({"shard": {"$eq": "a"}}) == {"a"}
+    assert shards_from_where({"shard": {"$in": ["a", "b"]}}) == {"a", "b"}
+    assert shards_from_where({"shard": {"$in": []}}) == set()
+    assert shards_from_where(
+        {"$and": [{"shard": {"$in": ["a", "b"]}}, {"shard": "b"}, {"page_number": 1}]}
+    ) == {"b"}
+
+
+def test_merge_query_results_keeps_nearest():
+    results = [
+        {"ids": [["a1", "a2"]], "distances": [[0.1, 0.5]], "documents": [["A1", "A2"]]},
+        {"ids": [["b1", "b2"]], "distances": [[0.2, 0.3]], "documents": [["B1", "B2"]]},
+    ]
+    merged = merge_query_results(results, 3)
+    assert merged["ids"] == [["a1", "b1", "b2"]]
+    assert merged["distances"] == [[0.1, 0.2, 0.3]]
+    assert merged["documents"] == [["A1", "B1", "B2"]]
+    assert merged["metadatas"] is None
+
+
+@pytest.fixture
+def sharded_vdb():
+    calls = []
+
+    def embed(texts):
+        calls.append(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+    shards = {
+        "contracts": make_collection(
+            ["c1", "c2"], [[1.0, 0.0], [0.0, 1.0]], [{"shard": "contracts"}] * 2
+        ),
+        "other": make_collection(["o1"], [[0.9, 0.1]], [{"shard": "other"}]),
+    }
+    return SimpleNamespace(
+        shards=shards, collections=shards, embedding_model=embed, calls=calls
+    )
+
+
+def test_sharded_query_merges_shards(sharded_vdb):
+    retriever = Retriever(sharded_vdb, {"n_results": 2})
+    assert retriever.query("payment")["ids"] == [["c1", "o1"]]
+    assert retriever.query("payment", {"shard": "other"})["ids"] == [["o1"]]
+
+
+def test_sharded_query_routes_by_pattern(sharded_vdb):
+    retriever = Retriever(
+        sharded_vdb, {"n_results": 2}, {"shard_routing": {"contracts": ["clause"]}}
+    )
+    assert retriever.query("which clause")["ids"] == [["c1", "c2"]]
+
+
+def test_sharded_query_with_no_allowed_shard_is_empty(sharded_vdb):
+    retriever = Retriever(sharded_vdb, {"n_results": 2})
+    result = retriever.query("payment", {"shard": {"$in": []}})
+    assert result["ids"] == [[]]
+    assert sharded_vdb.calls == []
+
+
+def test_query_many_matches_query_with_one_embedding_call(sharded_vdb):
+    retriever = Retriever(
+        sharded_vdb, {"n_results": 2}, {"shard_routing": {"contracts": ["clause"]}}
+    )
+    texts = ["which clause", "payment", "nothing"]
+    results = retriever.query_many(texts, {"shard": {"$in": ["contracts", "other"]}})
+    assert sharded_vdb.calls == [texts]
+    assert [result["ids"] for result in results] == [
+        [["c1", "c2"]],
+        [["c1", "o1"]],
+        [["c1", "o1"]],
+    ]
+    assert results == [retriever.query(text) for text in texts]
+    assert retriever.query_many(["payment"], {"shard": {"$in": []}})[0]["ids"] == [[]]
+
+
+def test_query_with_embedding_from_embed_query_embeds_once(sharded_vdb):
+    retriever = Retriever(sharded_vdb, {"n_results": 2})
+    embedding = retriever.embed_query("payment")
+    result = retriever.query("payment", query_embedding=embedding)
+    assert sharded_vdb.calls == [["payment"]]
+    assert result == retriever.query("payment")
+
+
+@pytest.fixture
+def hybrid_vdb(tmp_path):
+    collection = make_collection(
+        ["a", "b"],
+        [[1.0, 0.0], [0.0, 1.0]],
+        documents=["payment terms", "termination clause"],
+    )
+    return SimpleNamespace(
+        shards={},
+        collections={"": collection},
+        collection=collection,
+        path=tmp_path / "child",
+        store_path=tmp_path / "parent",
+        vdb_folder="vdb",
+        fingerprint="2-1.0",
+        embedding_model=lambda texts: [[1.0, 0.0] for _ in texts],
+    )
+
+
+def test_hybrid_rebuilds_lexical_index_with_different_ids(hybrid_vdb):
+    index = LexicalIndex(hybrid_vdb.path / "vdb")
+    index.add(["x", "y"], ["stale", "stale"])
+    retriever = Retriever(hybrid_vdb, {"n_results": 2}, {"hybrid": {}})
+    assert retriever.lexical_index.ids() == {"a", "b"}
+    assert retriever.lexical_index.fingerprint == "2-1.0"
+    assert retriever.query("termination")["ids"] == [["b", "a"]]
+    assert not hybrid_vdb.store_path.exists()
+
+
+def test_hybrid_skips_lexical_hits_missing_from_collection(hybrid_vdb):
+    retriever = Retriever(hybrid_vdb, {"n_results": 2}, {"hybrid": {}})
+    retriever.lexical_index.add(["gone"], ["termination notice"])
+    assert retriever.query("termination notice")["ids"] == [["b", "a"]]
+
+
+def test_maximal_marginal_relevance_skips_near_duplicates():
+    embeddings = [[1.0, 0.0], [0.99, 0.01], [0.7, 0.7]]
+    assert maximal_marginal_relevance([1.0, 0.0], embeddings, 2, 0.3) == [0, 2]
+    assert maximal_marginal_relevance([1.0, 0.0], embeddings, 2, lambda_mult=1) == [
+        0,
+        1,
+    ]
+    assert maximal_marginal_relevance([1.0, 0.0], [], 2) == []
+
+
+def test_mmr_keeps_top_k_and_drops_embeddings():
+    collection = make_collection(
+        ["a", "a_copy", "b"], [[1.0, 0.0], [0.99, 0.01], [0.7, 0.7]]
+    )
+    vdb = SimpleNamespace(
+        shards={},
+        collection=collection,
+        embedding_model=lambda texts: [[1.0, 0.0] for _ in texts],
+    )
+    retriever = Retriever(
+        vdb, {"n_results": 3}, {"mmr": {"top_k": 2, "lambda_mult": 0.3}}
+    )
+    result = retriever.query("payment")
+    assert result["ids"] == [["a", "b"]]
+    assert result["embeddings"] is None
+    assert len(result["distances"][0]) == 2
+
+
+def embed(texts):
+    """Deterministic bag-of-words embeddings, so similar texts have similar vectors."""
+    embeddings = []
+    for text in texts:
+        vector = np.zeros(DIMENSION, dtype=np.float32)
+        for word in text.lower().split():
+            vector[sum(map(ord, word)) % DIMENSION] += 1
+        embeddings.append((vector / max(np.linalg.norm(vector), 1e-12)).tolist())
+    return embeddings
+
+
+class WordOverlapCrossEncoder:
+    def predict(self, sentences, batch_size=32):
+        return [
+            len(set(query.lower().split()) & set(document.lower().split()))
+            for query, document in sentences
+        ]
+
+
+@pytest.fixture
+def vdb():
+    client = chromadb.EphemeralClient(Settings(anonymized_telemetry=False))
+    collection = client.create_collection(f"test_{uuid.uuid4().hex}")
+    documents = [
+        "payment is due in 30 days",
+        "payment is due in 30 days of invoice",
+        "payment is due within 30 days",
+        "audit rights are reserved",
+        "termination for convenience",
+        "liability is capped",
+    ]
+    collection.add(
+        ids=[str(i) for i in range(len(documents))],
+        documents=documents,
+        embeddings=embed(documents),
+        metadatas=[{"filename": "a.pdf", "page_number": 1} for _ in documents],
+    )
+    return SimpleNamespace(
+        shards={},
+        collection=collection,
+        collections={"": collection},
+        embedding_model=embed,
+        embedding_config={"model_name": "test"},
+        path=Path("test"),
+        fingerprint="test",
+    )
+
+
+@pytest.fixture
+def cross_encoder(monkeypatch):
+    monkeypatch.setattr(
+        Retriever,
+        "_instantiate_cross_encoder",
+        lambda self, *args: WordOverlapCrossEncoder(),
+    )
+
+
+def test_query_with_mmr(vdb):
+    retriever = Retriever(vdb, {"n_results": 5}, {"mmr": {"top_k": 3}})
+    result = retriever.query("when is payment due")
+    assert len(result["ids"][0]) == 3
+    assert len(result["documents"][0]) == 3
+    assert result["embeddings"] is None
+
+
+def test_query_with_mmr_keeps_requested_embeddings(vdb):
+    retriever = Retriever(
+        vdb,
+        {"n_results": 5, "include": ["documents", "distances", "embeddings"]},
+        {"mmr": {"top_k": 3}},
+    )
+    result = retriever.query("when is payment due")
+    assert len(result["embeddings"][0]) == 3
+
+
+def test_query_with_cascade(vdb, cross_encoder):
+    retriever = Retriever(
+        vdb,
+        {"n_results": 5},
+        {"reranking": {"model": "test", "top_k": 2, "cascade": {"candidates": 3}}},
+    )
+    result = retriever.query("audit rights")
+    assert len(result["ids"][0]) == 2
+    assert result["documents"][0][0] == "audit rights are reserved"
+    assert result["embeddings"] is None
+
+
+def test_query_with_mmr_and_cascade(vdb, cross_encoder):
+    retriever = Retriever(
+        vdb,
+        {"n_results": 6},
+        {
+            "mmr": {"top_k": 4},
+            "reranking": {"model": "test", "top_k": 2, "cascade": {"candidates": 3}},
+        },
+    )
+    result = retriever.query("audit rights")
+    assert len(result["ids"][0]) == 2
+    assert result["embeddings"] is None
+
+
+def test_query_without_cache_leaves_caches_untouched(vdb, tmp_path):
+    vdb.embedding_model = CachedEmbeddingFunction(
+        embed, "test", EmbeddingCache(tmp_path)
+    )
+    retriever = Retriever(
+        vdb,
+        {"n_results": 2},
+        {"query_cache": {}, "result_cache": {}},
+    )
+    uncached = retriever.query("audit rights", use_cache=False)
+    assert retriever.query_cache.stats()["size"] == 0
+    assert retriever.query_cache.stats()["misses"] == 0
+    assert retriever.result_cache.stats()["size"] == 0
+    assert retriever.result_cache.stats()["misses"] == 0
+    assert vdb.embedding_model.stats()["misses"] == 0
+    assert retriever.query("audit rights") == uncached
+    assert retriever.result_cache.stats()["misses"] == 1
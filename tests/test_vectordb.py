@@ -0,0 +1,170 @@
+import itertools
+import json
+import threading
+
+import pytest
+from unstructured.documents.elements import ElementMetadata, NarrativeText, Title
+
+from benchmarks.fake_embeddings import FakeEmbeddingFunction
+from src import vectordb
+from src.vectordb import VDB, _chunk_elements, _index_sections, _prefetch
+
+ELEMENTS = [
+    NarrativeText("Preface text."),
+    Title("Chapter 1 Payments"),
+    NarrativeText("Invoices are issued monthly."),
+    Title("Late payment"),
+    NarrativeText("Interest accrues on late payments."),
+    Title("Chapter 2 Termination"),
+    NarrativeText("Either party may terminate."),
+]
+
+
+def test_prefetch_yields_items_in_order():
+    assert list(_prefetch(range(10), 2)) == list(range(10))
+
+
+def test_prefetch_reraises_in_consumer():
+    def source():
+        yield 1
+        raise ValueError("partitioning failed")
+
+    items = _prefetch(source(), 2)
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="partitioning failed"):
+        next(items)
+
+
+def test_prefetch_closes_source_when_consumer_stops():
+    closed = threading.Event()
+
+    def source():
+        try:
+            yield from itertools.count()
+        finally:
+            closed.set()
+
+    items = _prefetch(source(), 2)
+    assert next(items) == 0
+    items.close()
+    assert closed.wait(timeout=5)
+
+
+def test_index_sections_assigns_chapter_and_section():
+    assert _index_sections(ELEMENTS) == [
+        ("", ""),
+        ("Chapter 1 Payments", ""),
+        ("Chapter 1 Payments", ""),
+        ("Chapter 1 Payments", "Late payment"),
+        ("Chapter 1 Payments", "Late payment"),
+        ("Chapter 2 Termination", ""),
+        ("Chapter 2 Termination", ""),
+    ]
+
+
+def test_chunk_elements_never_spans_sections():
+    ids, meta, docs = _chunk_elements(ELEMENTS, max_characters=500)
+    assert len(ids) == len(set(ids)) == len(meta) == len(docs)
+    sections = [(m["chapter"], m["section"]) for m in meta]
+    assert sections == [
+        ("", ""),
+        ("Chapter 1 Payments", ""),
+        ("Chapter 1 Payments", "Late payment"),
+        ("Chapter 2 Termination", ""),
+    ]
+    assert "Interest accrues" in docs[2] and "Invoices" not in docs[2]
+
+
+def test_chunk_ids_are_reproducible():
+    ids, _, _ = _chunk_elements(ELEMENTS, max_characters=500)
+    assert _chunk_elements(ELEMENTS, max_characters=500)[0] == ids
+
+
+def partition_text(filepath, **kwargs):
+    """Partition a plain text file, one element per line, for tests without PDFs."""
+    return [
+        NarrativeText(line, metadata=ElementMetadata(filename=filepath.name))
+        for line in filepath.read_text().splitlines()
+    ]
+
+
+class FailingEmbeddingFunction(FakeEmbeddingFunction):
+    def __init__(self, fail_on_call=None) -> None:
+        super().__init__(dim=8)
+        self.fail_on_call = fail_on_call
+        self.embedded = 0
+
+    def __call__(self, input):
+        if self.calls + 1 == self.fail_on_call:
+            raise RuntimeError("throttled")
+        self.embedded += len(input)
+        return super().__call__(input)
+
+
+def make_vdb(path, embedding_function, monkeypatch, **ingestion_config):
+    monkeypatch.setattr(vectordb, "partition_pdf", partition_text)
+    monkeypatch.setattr(
+        vectordb, "_setup_embedding_model", lambda *args, **kwargs: embedding_function
+    )
+    return VDB(
+        path=path,
+        collection="test",
+        embedding_config={"model_name": "fake", "api_version": "test"},
+        partition_config={"strategy": "fast"},
+        # One chunk per line
+        chunking_config={"max_characters": 400, "new_after_n_chars": 1},
+        ingestion_config={"batch_size": 2, "queue_size": 1, **ingestion_config},
+    )
+
+
+def test_interrupted_ingestion_resumes_after_committed_batches(tmp_path, monkeypatch):
+    path = tmp_path / "file.txt"
+    path.write_text("\n".join(f"Sentence number {i} of the file." for i in range(10)))
+    failing = FailingEmbeddingFunction(fail_on_call=3)
+    with pytest.raises(RuntimeError, match="throttled"):
+        make_vdb(tmp_path, failing, monkeypatch).sync_pdfs([path])
+    assert failing.embedded == 4
+
+    resumed = FailingEmbeddingFunction()
+    vdb = make_vdb(tmp_path, resumed, monkeypatch)
+    vdb.sync_pdfs([path])
+    n_chunks = vdb.collection.count()
+    assert n_chunks == 10
+    assert resumed.embedded == n_chunks - 4
+    assert sorted(vdb.manifest.records["file.txt"]["ids"]) == sorted(
+        vdb.collection.get()["ids"]
+    )
+    assert not vdb.checkpoint.storage_path.exists()
+
+
+CLAUSE = (
+    "This agreement is confidential. The receiving party shall not disclose confidential "
+    "information of the disclosing party to any third party without prior written "
+    "consent, and shall use it only for the purpose of performing its obligations under "
+    "this agreement. These obligations survive termination of this agreement for a "
+    "period of five years."
+)
+OTHER_CLAUSE = "The supplier shall deliver the goods within thirty days of the order."
+
+
+def test_near_duplicate_chunks_collapse_into_kept_chunk(tmp_path, monkeypatch):
+    a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+    a.write_text(f"{CLAUSE}\nPayment is due within sixty days of invoice.")
+    b.write_text(f"{CLAUSE.replace('five', 'seven')}\n{OTHER_CLAUSE}")
+    dedup = {"dedup": {"max_distance": 8}}
+    vdb = make_vdb(tmp_path, FakeEmbeddingFunction(8), monkeypatch, **dedup)
+    vdb.sync_pdfs([a, b])
+    stored = vdb.collection.get()
+    assert len(stored["ids"]) == 3
+    kept = stored["metadatas"][stored["documents"].index(CLAUSE)]
+    assert [s["filename"] for s in json.loads(kept["sources"])] == ["a.txt", "b.txt"]
+
+    # Removing a.txt removes the kept chunk, so b.txt's copy is kept instead
+    vdb = make_vdb(tmp_path, FakeEmbeddingFunction(8), monkeypatch, **dedup)
+    vdb.sync_pdfs([b])
+    stored = vdb.collection.get()
+    assert sorted(stored["documents"]) == sorted(
+        [CLAUSE.replace("five", "seven"), OTHER_CLAUSE]
+    )
+    for metadata in stored["metadatas"]:
+        assert [s["filename"] for s in json.loads(metadata["sources"])] == ["b.txt"]